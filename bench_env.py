@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+module for benchmarking the environment i/o path against the local fake vrep server
+"""
+import argparse
+import time
+import fake_vrep
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark VREP_Env steps against fake_vrep.')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='seconds of round trip latency for every blocking call')
+    parser.add_argument('--steps', type=int, default=200,
+                        help='number of environment steps to time')
+    parser.add_argument('--sleep-time', dest='sleep_time', type=float, default=0.0,
+                        help='VREP_Env sleep_time, 0 measures the i/o overhead alone')
+    parser.add_argument('--pipelined', dest='pipelined', action='store_true',
+                        help='batch the action and target move into one non blocking message, see VREP_Env.step_async')
+    parser.add_argument('--pairs', type=int, default=1,
+                        help='robot and target pairs in the scene, more than 1 steps them with MultiVREP_Env')
+    args = parser.parse_args()
+
+    fake_vrep.install(latency=args.latency, pairs=args.pairs)
+    # import after install so they pick up the fake module
+    import rewards
+    import vrep_env
+    from target_mover import TargetMover
+    from simple_actor import SimpleActor
+
+    goal_distance = 1
+    if args.pairs > 1:
+        bench_pairs(vrep_env, rewards, SimpleActor(goal_distance), goal_distance, args)
+        return
+    env = vrep_env.VREP_Env(rewards.graduated(goal_distance), goal_distance=goal_distance, sleep_time=args.sleep_time,
+                            pipelined=args.pipelined)
+    mover = TargetMover(env.client_id, target_handle=env.target_handle, path=["R"] * (args.steps + 1) + ["exit"],
+                        pipelined=args.pipelined)
+    actor = SimpleActor(goal_distance)
+    s = env.reset()
+    mover.reset()
+
+    fake_vrep.reset_stats()
+    start = time.time()
+    for _ in range(args.steps):
+        if args.pipelined:
+            env.step_async(actor.choose_action(s), move_target=mover.step)
+            s, r, done = env.step_wait()
+        else:
+            mover.step()
+            s, r, done = env.step(actor.choose_action(s))
+    elapsed = time.time() - start
+    stats = fake_vrep.stats()
+    env.stop()
+
+    print("%d steps in %.2fs, %.1f steps/s, %.1f ms/step" %
+          (args.steps, elapsed, args.steps / elapsed, 1000.0 * elapsed / args.steps))
+    print("blocking round trips per step: %.1f" % (stats.pop('round_trips') / float(args.steps)))
+    for (name, opmode), count in sorted(stats.items()):
+        print("  %-28s opmode %-7d %.1f/step" % (name, opmode, count / float(args.steps)))
+
+
+def bench_pairs(vrep_env, rewards, actor, goal_distance, args):
+    env = vrep_env.MultiVREP_Env(rewards.graduated(goal_distance), args.pairs, goal_distance=goal_distance,
+                                 sleep_time=args.sleep_time)
+    movers = env.make_movers(["R"] * (args.steps + 1) + ["exit"])
+    s = env.reset(movers=movers)
+
+    fake_vrep.reset_stats()
+    start = time.time()
+    for _ in range(args.steps):
+        s, r, dones = env.step([actor.choose_action(row) for row in s], movers)
+    elapsed = time.time() - start
+    round_trips = fake_vrep.stats()['round_trips']
+    env.stop()
+
+    transitions = args.steps * args.pairs
+    print("%d steps of %d pairs in %.2fs, %.1f transitions/s" % (args.steps, args.pairs, elapsed, transitions / elapsed))
+    print("blocking round trips per transition: %.2f" % (round_trips / float(transitions)))
+
+
+if __name__ == "__main__":
+    main()
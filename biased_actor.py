@@ -2,6 +2,7 @@
 import numpy as np
 import memory
 import vrep_env
+from state_batch import as_array
 
 MEMORY_CAPACITY=10000
 
@@ -23,8 +24,11 @@ class BiasedActor(object):
     def choose_action(self, state):
         """ choose actions given the current state
 
+            params: state - flattened state array or single state StateBatch
+
             returns: tuple of (left motor velocity, right motor velocity)
         """
+        state = as_array(state)
         self.count += 1
         # wait till there are enough samples to choose from, throw in a random new one every once in a while
         if self.pos_mem.pointer < 2000 or self.neg_mem.pointer == 1000 or self.count % 100 == 0:
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+""" module for collecting transitions with the policy a ddpg.py --mode serve process answers for
+
+A collector is a simulator connection, a target mover and a policy_server.PolicyClient, it imports neither
+tensorflow nor ddpg.py, so many of them share the server's single actor instead of building a graph and a
+session each.  The transitions fill a memory file that ddpg.py --load-mem-path reads.
+"""
+import argparse
+import memory
+import policy_server
+import rewards
+import scenarios
+from target_mover import TargetMover
+from vrep_env import VREP_Env
+
+MEMORY_CAPACITY = 10000
+MAX_EP_STEPS = 100
+GOAL_DISTANCE = 1.0
+
+
+def collect(env, mover, client, mem, var, max_steps=MAX_EP_STEPS):
+    """ run episodes until mem is full
+
+        params: env, mover - environment and the mover of its target
+                client - policy_server.PolicyClient, or any object with choose_action(s, var)
+                mem - memory.Memory to store the transitions in
+                var - exploration noise the server adds to every action
+
+        returns: number of episodes run
+    """
+    episodes = 0
+    while mem.pointer < mem.capacity:
+        s = env.reset()
+        mover.reset()
+        for t in range(max_steps):
+            mover_done = mover.step()
+            a = client.choose_action(s, var)
+            s_, r, env_done = env.step(a, before_tick=mover.step)
+            mem.store_transition(s, a, r, s_)
+            s = s_
+            if mover_done or env_done or mem.pointer >= mem.capacity:
+                break
+        mem.end_episode()
+        episodes += 1
+        print("Episode: %d, Memory: %d, Policy version: %s" % (episodes, mem.pointer, client.version))
+    return episodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect transitions through a ddpg.py --mode serve policy server.')
+    parser.add_argument('--policy-socket', dest='policy_socket', required=True,
+                        help='unix socket the ddpg.py --mode serve process listens on')
+    parser.add_argument('--save-mem-path', dest='save_mem_path', required=True,
+                        help='where to save the memory once it is full, for ddpg.py --load-mem-path')
+    parser.add_argument('--transitions', dest='transitions', type=int, required=False, default=MEMORY_CAPACITY,
+                        help='transitions to collect')
+    parser.add_argument('--explore', dest='explore', type=float, required=False, default=0.5,
+                        help='exploration noise the server adds to every action')
+    parser.add_argument('--path', dest='path', required=False, default='circle', choices=sorted(scenarios.PATHS),
+                        help='target path of every episode')
+    parser.add_argument('--sensors', dest='sensors', action='store_true',
+                        help='include the ultrasonic sensor readings, as the served ddpg.py --sensors policy expects')
+    parser.add_argument('--action-repeat', dest='action_repeat', type=int, required=False, default=1,
+                        help='control ticks every action is held for')
+    parser.add_argument('--port', dest='port', type=int, required=False, default=19999,
+                        help='remote api port of the vrep instance this collector runs on')
+    args = parser.parse_args()
+
+    env = VREP_Env(rewards.graduated(GOAL_DISTANCE), goal_distance=GOAL_DISTANCE, action_repeat=args.action_repeat,
+                   include_sensors=args.sensors, port=args.port)
+    mover = TargetMover(env.client_id, target_handle=env.target_handle, path=scenarios.PATHS[args.path])
+    client = policy_server.PolicyClient(args.policy_socket, env.state_dim, env.action_dim)
+    mem = memory.Memory(args.transitions, dims=2 * env.state_dim + env.action_dim + 1)
+    try:
+        collect(env, mover, client, mem, args.explore)
+        mem.save(args.save_mem_path)
+        print("Saved %d transitions to %s" % (mem.pointer, args.save_mem_path))
+    finally:
+        client.close()
+        env.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+""" module for synchronous data parallel learners in separate processes
+
+Every learner computes gradients on its own minibatches, then all of them average their gradients through
+shared memory before applying them.  As they start from the same weights and apply the same averaged
+gradients with the same optimizer state, their weights stay identical without ever being sent around.
+
+The average is a reduce-scatter followed by an all-gather on one shared array: learner i writes its gradient
+to row i, each learner averages its own slice of the columns into the result and all of them read the whole
+result back, with a barrier between the phases.
+"""
+import multiprocessing
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class AllReduce(object):
+    """ mean of one float32 vector per learner, computed together by all learners """
+
+    def __init__(self, ctx, workers, size, timeout=None):
+        """ params: ctx - multiprocessing context the learners are started from
+                    workers - number of learners taking part in every call
+                    size - length of the vectors
+                    timeout - seconds to wait for the other learners before giving up
+        """
+        self.workers = workers
+        self.size = size
+        self.timeout = timeout
+        self._rows = ctx.RawArray('f', workers * size)
+        self._result = ctx.RawArray('f', size)
+        self._barrier = ctx.Barrier(workers)
+        self._views = None
+
+    def __getstate__(self):
+        # numpy views are not sent to the learners, each one makes its own onto the shared arrays
+        state = dict(self.__dict__)
+        state['_views'] = None
+        return state
+
+    def _arrays(self):
+        if self._views is None:
+            self._views = (np.frombuffer(self._rows, dtype=np.float32).reshape(self.workers, self.size),
+                           np.frombuffer(self._result, dtype=np.float32))
+        return self._views
+
+    def wait(self):
+        """ block until every learner has called wait """
+        self._barrier.wait(self.timeout)
+
+    def abort(self):
+        """ release the learners blocked in wait or mean, they raise threading.BrokenBarrierError """
+        self._barrier.abort()
+
+    def mean(self, rank, vector):
+        """ average vector over all learners, every learner has to call this the same number of times
+
+            params: rank - this learner's index, 0 to workers - 1
+                    vector - this learner's (size,) values
+
+            returns: (size,) view of the mean, valid until the next call
+        """
+        rows, result = self._arrays()
+        rows[rank] = vector
+        self.wait()
+        columns = slice(rank * self.size // self.workers, (rank + 1) * self.size // self.workers)
+        result[columns] = rows[:, columns].mean(axis=0)
+        self.wait()
+        return result
+
+
+def flatten(arrays):
+    """ one float32 vector of all the arrays """
+    return np.concatenate([np.ravel(array) for array in arrays]).astype(np.float32)
+
+
+def split(vector, shapes):
+    """ inverse of flatten, views of vector with the given shapes """
+    arrays = []
+    start = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        arrays.append(vector[start:start + size].reshape(shape))
+        start += size
+    return arrays
+
+
+def run(learner, workers, size, args=(), timeout=None):
+    """ start workers learner processes and wait for all of them
+
+        The processes are spawned rather than forked, so each builds its own tensorflow session.  If one of
+        them fails the others are released from the all-reduce and an exception is raised.
+
+        params: learner - module level function called as learner(rank, reducer, results, *args), where
+                          reducer is the AllReduce shared by all learners and results a queue the learner puts
+                          exactly one (rank, result) item on when it is done
+                workers - number of learner processes
+                size - length of the vectors the learners average
+
+        returns: list of the learners' results by rank
+    """
+    ctx = multiprocessing.get_context('spawn')
+    reducer = AllReduce(ctx, workers, size, timeout)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=learner, args=(rank, reducer, results) + tuple(args)) for rank in range(workers)]
+    for process in processes:
+        process.start()
+    collected = {}
+    try:
+        while len(collected) < workers:
+            try:
+                rank, result = results.get(timeout=1.0)
+                collected[rank] = result
+            except queue.Empty:
+                failed = [process for process in processes if process.exitcode not in (None, 0)]
+                if failed:
+                    reducer.abort()
+                    raise Exception('Learner process failed with exit code %d' % failed[0].exitcode)
+    finally:
+        for process in processes:
+            process.join()
+    return [collected[rank] for rank in range(workers)]
+
+
+def scaling(results, batch_size):
+    """ throughput of one run of learners and its efficiency against the single learner run
+
+        params: results - dict of number of learners to their run() results, each with 'steps' and 'elapsed'
+                batch_size - minibatch size of one learner
+
+        returns: list of dicts with learners, steps_per_s, samples_per_s and efficiency, by number of learners
+    """
+    lines = []
+    for workers in sorted(results):
+        elapsed = max(result['elapsed'] for result in results[workers])
+        steps = results[workers][0]['steps']
+        lines.append({'learners': workers, 'steps_per_s': steps / elapsed,
+                      'samples_per_s': workers * batch_size * steps / elapsed})
+    if 1 in results:
+        single = lines[0]['samples_per_s']
+        for line in lines:
+            line['efficiency'] = line['samples_per_s'] / (line['learners'] * single)
+    return lines
+
+
+def max_difference(vectors):
+    """ largest absolute difference of any of the vectors from the first """
+    return max(float(np.max(np.abs(vector - vectors[0]))) for vector in vectors)
+
+
+def learner_threads(workers, cores=None):
+    """ tensorflow intra op threads per learner so the learners together use every core once
+
+        params: cores - cores the learners may run on, all of the machine's if None
+    """
+    return max(1, (cores or multiprocessing.cpu_count()) // workers)
@@ -12,10 +12,25 @@ import numpy as np
 import os
 import shutil
 import argparse
-from vrep_env import VREP_Env
+import copy
+import time
+from vrep_env import VREP_Env, MultiVREP_Env
 from target_mover import TargetMover
 import rewards
 import memory
+import graph_memory
+import ensemble
+import trajectory
+import policy_server
+import landscape
+import metrics
+import evaluation
+import history
+import data_parallel
+import lookup_table
+import scenarios
+import tuning
+from state_batch import as_array, XDIST, YDIST
 
 np.random.seed(1)
 tf.set_random_seed(1)
@@ -33,18 +48,65 @@ VAR_MIN = 0.1
 LOAD = True
 GOAL_DISTANCE=1.0
 
-env = VREP_Env(rewards.graduated(GOAL_DISTANCE), goal_distance=GOAL_DISTANCE)
-STATE_DIM = env.state_dim
-ACTION_DIM = env.action_dim
-ACTION_BOUND = env.action_bound
 
-# all placeholder for tf
+
+def add_import_args(parser):
+    """ arguments that shape the graph or configure its session, they are also parsed at import as both are built
+        then
+    """
+    parser.add_argument('--history', dest='history', type=int, required=False, default=1,
+                        help='stack this many consecutive observations into each state the networks see')
+    parser.add_argument('--sensors', dest='sensors', action='store_true',
+                        help='put the 16 ultrasonic sensor readings in front of every observation the networks see')
+    parser.add_argument('--profile', dest='profile', required=False, default=tuning.default_profile_path(),
+                        help='thread pool and batch size profile --mode autotune writes and every run loads, '
+                             'tensorflow\'s defaults and BATCH_SIZE are used while it does not exist')
+    parser.add_argument('--no-profile', dest='no_profile', action='store_true',
+                        help='ignore the --profile, e.g. to compare against the defaults')
+    parser.add_argument('--cpus', dest='cpus', type=tuning.parse_cpus, required=False, default=None,
+                        help='pin this run to a core set like 0-3,8, the thread pools are capped at its size')
+    return parser
+
+
+IMPORT_ARGS = add_import_args(argparse.ArgumentParser(add_help=False)).parse_known_args()[0]
+HISTORY = IMPORT_ARGS.history
+SENSORS = IMPORT_ARGS.sensors
+if IMPORT_ARGS.cpus:
+    # before the session starts its thread pools, they inherit the affinity
+    tuning.pin(IMPORT_ARGS.cpus)
+PROFILE = None if IMPORT_ARGS.no_profile else tuning.load_profile(IMPORT_ARGS.profile)
+if PROFILE:
+    BATCH_SIZE = PROFILE['batch_size']
+
+# dimensions are class attributes, the environment itself is only connected in setup()
+OBSERVATION_DIM = VREP_Env.sensor_state_dim if SENSORS else VREP_Env.state_dim
+STATE_DIM = OBSERVATION_DIM * HISTORY
+# the newest frame ends a state and every frame ends with xdist, ydist, orientation and relative orientation
+NEWEST_XDIST = STATE_DIM - VREP_Env.state_dim + XDIST
+NEWEST_YDIST = STATE_DIM - VREP_Env.state_dim + YDIST
+ACTION_DIM = VREP_Env.action_dim
+ACTION_BOUND = VREP_Env.action_bound
+# largest absolute xdist, ydist, orientation and relative orientation, for int16 --compact-memory
+STATE_BOUND = [4.0, 4.0, np.pi, np.pi]
+if SENSORS:
+    # readings are distances up to the sensor range, 1m on the p3dx
+    STATE_BOUND = [1.0] * (VREP_Env.sensor_state_dim - VREP_Env.state_dim) + STATE_BOUND
+
+sess = tf.Session(config=tf.ConfigProto(**tuning.session_kwargs(PROFILE, len(tuning.available_cpus()))))
+
+# replay buffer that lives in the graph, used with --replay graph
+graph_M = graph_memory.GraphMemory(sess, MEMORY_CAPACITY, dims=2 * STATE_DIM + ACTION_DIM + 1)
+with tf.name_scope('replay_batch'):
+    replay_batch = graph_M.sample_tensor(BATCH_SIZE)
+
+# all placeholder for tf, when not fed they default to a fresh sample of the in-graph replay buffer
 with tf.name_scope('S'):
-    S = tf.placeholder(tf.float32, shape=[None, STATE_DIM], name='s')
+    S = tf.placeholder_with_default(replay_batch[:, :STATE_DIM], shape=[None, STATE_DIM], name='s')
 with tf.name_scope('R'):
-    R = tf.placeholder(tf.float32, [None, 1], name='r')
+    R = tf.placeholder_with_default(replay_batch[:, -STATE_DIM - 1: -STATE_DIM], [None, 1], name='r')
 with tf.name_scope('S_'):
-    S_ = tf.placeholder(tf.float32, shape=[None, STATE_DIM], name='s_')
+    S_ = tf.placeholder_with_default(replay_batch[:, -STATE_DIM:], shape=[None, STATE_DIM], name='s_')
+REPLAY_A = replay_batch[:, STATE_DIM: STATE_DIM + ACTION_DIM]
 
 
 class Actor(object):
@@ -65,6 +127,7 @@ class Actor(object):
 
         self.e_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Actor/eval_net')
         self.t_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Actor/target_net')
+        self.replace_op = [tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)]
 
     def _build_net(self, s, scope, trainable):
         with tf.variable_scope(scope):
@@ -87,21 +150,38 @@ class Actor(object):
 
     def learn(self, s):   # batch update
         self.sess.run(self.train_op, feed_dict={S: s})
+        self.replace_target()
+
+    def replace_target(self):
+        """ copy eval net into target net every t_replace_iter learning steps """
         if self.t_replace_counter % self.t_replace_iter == 0:
-            self.sess.run([tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)])
+            self.sess.run(self.replace_op)
         self.t_replace_counter += 1
 
     def choose_action(self, s):
-        s = s[np.newaxis, :]    # single state
+        s = as_array(s)[np.newaxis, :]    # single state
         return self.sess.run(self.a, feed_dict={S: s})[0]  # single action
 
+    def choose_actions(self, states):
+        """ batched choose_action, one action row per state in the StateBatch or state matrix """
+        return self.sess.run(self.a, feed_dict={S: as_array(states)})
+
     def add_grad_to_graph(self, a_grads):
         with tf.variable_scope('policy_grads'):
             self.policy_grads = tf.gradients(ys=self.a, xs=self.e_params, grad_ys=a_grads)
 
         with tf.variable_scope('A_train'):
-            opt = tf.train.RMSPropOptimizer(-self.lr)  # (- learning rate) for ascent policy
-            self.train_op = opt.apply_gradients(zip(self.policy_grads, self.e_params))
+            self.opt = tf.train.RMSPropOptimizer(-self.lr)  # (- learning rate) for ascent policy
+            self.train_op = self.opt.apply_gradients(zip(self.policy_grads, self.e_params))
+
+    def add_apply_to_graph(self):
+        """ op applying policy gradients fed to grad_inputs, e.g. averaged over data parallel learners
+
+            Shares the RMSProp slots with train_op.
+        """
+        with tf.variable_scope('A_apply'):
+            self.grad_inputs = [tf.placeholder(tf.float32, param.shape) for param in self.e_params]
+            self.apply_op = self.opt.apply_gradients(zip(self.grad_inputs, self.e_params))
 
 
 class Critic(object):
@@ -124,21 +204,26 @@ class Critic(object):
 
             self.e_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Critic/eval_net')
             self.t_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Critic/target_net')
+        self.replace_op = [tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)]
 
         with tf.variable_scope('target_q'):
-            self.target_q = R + self.gamma * self.q_
+            # bootstrap factor, gamma unless an n-step memory feeds gamma^n per sample
+            self.discount = tf.placeholder_with_default(tf.fill(tf.shape(R), self.gamma), [None, 1], name='discount')
+            self.target_q = R + self.discount * self.q_
 
         with tf.variable_scope('TD_error'):
             self.loss = tf.reduce_mean(tf.squared_difference(self.target_q, self.q))
 
         with tf.variable_scope('C_train'):
-            self.train_op = tf.train.RMSPropOptimizer(self.lr).minimize(self.loss)
+            self.opt = tf.train.RMSPropOptimizer(self.lr)
+            self.train_op = self.opt.minimize(self.loss)
+            self.grads = tf.gradients(self.loss, self.e_params)
 
         with tf.variable_scope('a_grad'):
             self.a_grads = tf.gradients(self.q, a)[0]   # tensor of gradients of each sample (None, a_dim)
 
-    def _build_net(self, s, a, scope, trainable):
-        with tf.variable_scope(scope):
+    def _build_net(self, s, a, scope, trainable, reuse=None):
+        with tf.variable_scope(scope, reuse=reuse):
             init_w = tf.contrib.layers.xavier_initializer()
             init_b = tf.constant_initializer(0.01)
 
@@ -155,87 +240,233 @@ class Critic(object):
                                   kernel_initializer=init_w, bias_initializer=init_b, name='l3',
                                   trainable=trainable)
             with tf.variable_scope('q'):
-                q = tf.layers.dense(net, 1, kernel_initializer=init_w, bias_initializer=init_b, trainable=trainable)   # Q(s,a)
+                q = tf.layers.dense(net, 1, kernel_initializer=init_w, bias_initializer=init_b, name='dense',
+                                    trainable=trainable)   # Q(s,a)
         return q
 
-    def learn(self, s, a, r, s_):
-        self.sess.run(self.train_op, feed_dict={S: s, self.a: a, R: r, S_: s_})
+    def learn(self, s, a, r, s_, discount=None):
+        feed_dict = {S: s, self.a: a, R: r, S_: s_}
+        if discount is not None:
+            feed_dict[self.discount] = discount
+        loss, _ = self.sess.run([self.loss, self.train_op], feed_dict=feed_dict)
+        self.replace_target()
+        return loss
+
+    def replace_target(self):
+        """ copy eval net into target net every t_replace_iter learning steps """
         if self.t_replace_counter % self.t_replace_iter == 0:
-            self.sess.run([tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)])
+            self.sess.run(self.replace_op)
         self.t_replace_counter += 1
 
+    def add_replay_to_graph(self, replay_a, policy_grads):
+        """ build a training op on the in-graph replay sample
+
+            S, R and S_ default to the sample when not fed, the sampled actions are fed to a second copy of
+            the eval net.  The update waits on the actor's policy gradients so both read the pre-update
+            critic when they share one sess.run.  Shares the RMSProp slots with train_op.
+
+            params: replay_a - sampled actions matching the S default
+                    policy_grads - actor policy gradient tensors
+        """
+        with tf.variable_scope('Critic'):
+            q = self._build_net(S, replay_a, 'eval_net', trainable=True, reuse=True)
+
+        with tf.variable_scope('replay_TD_error'):
+            self.replay_loss = tf.reduce_mean(tf.squared_difference(self.target_q, q))
+
+        with tf.variable_scope('C_replay_train'):
+            with tf.control_dependencies(policy_grads):
+                self.replay_train_op = self.opt.minimize(self.replay_loss)
+
+    def add_apply_to_graph(self):
+        """ op applying critic gradients fed to grad_inputs, e.g. averaged over data parallel learners
+
+            Shares the RMSProp slots with train_op.
+        """
+        with tf.variable_scope('C_apply'):
+            self.grad_inputs = [tf.placeholder(tf.float32, param.shape) for param in self.e_params]
+            self.apply_op = self.opt.apply_gradients(zip(self.grad_inputs, self.e_params))
+
 
 #################################3
 # Beginning of script
 # Start defining stuff at module scope
 # TODO: clean this up
 ##################################
-sess = tf.Session()
 
 # Create actor and critic.
 actor = Actor(sess, ACTION_DIM, ACTION_BOUND[1], LR_A, REPLACE_ITER_A)
 critic = Critic(sess, STATE_DIM, ACTION_DIM, LR_C, GAMMA, REPLACE_ITER_C, actor.a, actor.a_)
 actor.add_grad_to_graph(critic.a_grads)
+critic.add_replay_to_graph(REPLAY_A, actor.policy_grads)
+# one run samples from the in-graph buffer and updates both critic and actor
+replay_train_op = tf.group(critic.replay_train_op, actor.train_op)
+# updates from gradients averaged over --learners processes
+critic.add_apply_to_graph()
+actor.add_apply_to_graph()
 
 # path to follow, just keep moving right
 path = ["R"] * 20 + ["exit"]
 # go in a circle
 path = ["R"] * 7 + ["B"] * 7 + ["L"] * 7 + ["F"] * 7 + ["exit"]
- 
-# moves the target we are trying to fallow
-mover = TargetMover(env.client_id, target_handle=env.target_handle, path=path)
+
+# the vrep environment and the mover for the target we are trying to fallow, connected in setup()
+env = None
+mover = None
+# policy_server.PolicyClient when actions come from a --mode serve process, see --policy-socket
+remote_actor = None
 
 # buffer to store the state, actioin, reward info for use by actor and critic learning
 M = memory.Memory(MEMORY_CAPACITY, dims=2 * STATE_DIM + ACTION_DIM + 1)
 rewards_over_time = np.zeros(MAX_EPISODES)
 
 saver = tf.train.Saver()
+# restores just the networks, so checkpoints written without optimizer state (see ensemble) load too
+policy_saver_params = actor.e_params + actor.t_params + critic.e_params + critic.t_params
+policy_saver = tf.train.Saver(policy_saver_params)
 
 
 def setup(args):
+    global env, mover, M, remote_actor
     if args.mode == "load":
-        saver.restore(sess, tf.train.latest_checkpoint(args.save_path))
+        policy_saver.restore(sess, tf.train.latest_checkpoint(args.save_path))
     else:
         sess.run(tf.global_variables_initializer())
-    if args.loadmempath:
-        M.load(args.loadmempath)
+        if args.init_path:
+            # e.g. fine tune an --mode offline pretrained model
+            policy_saver.restore(sess, tf.train.latest_checkpoint(args.init_path))
+    sess.run(tf.local_variables_initializer())
+    if args.learners > 1:
+        # the learner processes set up their own memories, see parallel_learner
+        return
+    if args.replay == "graph":
+        M = graph_M
+    elif args.n_step > 1:
+        M = memory.NStepMemory(MEMORY_CAPACITY, dims=2 * STATE_DIM + ACTION_DIM + 1, n=args.n_step, gamma=GAMMA)
+    elif args.compact_memory or HISTORY > 1:
+        # stacked states are rebuilt from single observations, each stored once
+        M = memory.CompactMemory(MEMORY_CAPACITY, OBSERVATION_DIM, ACTION_DIM,
+                                 dtype=args.compact_memory or "float32", state_bound=STATE_BOUND,
+                                 action_bound=ACTION_BOUND[1], history=HISTORY)
+    if args.mode == "offline" or (args.loadmempath and len(args.loadmempath) > 1):
+        M.load_all(args.loadmempath)
+    elif args.loadmempath:
+        M.load(args.loadmempath[0])
+    if args.mode in ("train", "load"):
+        recorder = None
+        if args.record_path:
+            recorder = trajectory.TrajectoryRecorder(args.record_path, ACTION_BOUND)
+        if args.pairs > 1:
+            env = MultiVREP_Env(rewards.graduated(GOAL_DISTANCE), args.pairs, goal_distance=GOAL_DISTANCE,
+                                action_repeat=args.action_repeat, include_sensors=SENSORS)
+            mover = env.make_movers(path)
+        else:
+            env = VREP_Env(rewards.graduated(GOAL_DISTANCE), goal_distance=GOAL_DISTANCE,
+                           action_repeat=args.action_repeat, recorder=recorder, include_sensors=SENSORS,
+                           pipelined=args.pipelined)
+            mover = TargetMover(env.client_id, target_handle=env.target_handle, path=path, recorder=recorder,
+                                pipelined=args.pipelined)
+            if HISTORY > 1:
+                env = history.HistoryEnv(env, HISTORY)
+    if args.policy_socket and args.mode != "serve":
+        remote_actor = policy_server.PolicyClient(args.policy_socket, STATE_DIM, ACTION_DIM)
+
+
+def learn():
+    """ one critic and actor update from a replay minibatch
+
+        returns: critic loss of the minibatch before the update
+    """
+    if M is graph_M:
+        loss, _ = sess.run([critic.replay_loss, replay_train_op])
+        critic.replace_target()
+        actor.replace_target()
+        return loss
+    b_discount = None
+    if isinstance(M, memory.NStepMemory):
+        b_M, b_discount = M.sample_with_discounts(BATCH_SIZE)
+    else:
+        b_M = M.sample(BATCH_SIZE)
+    b_s = b_M[:, :STATE_DIM]
+    b_a = b_M[:, STATE_DIM: STATE_DIM + ACTION_DIM]
+    b_r = b_M[:, -STATE_DIM - 1: -STATE_DIM]
+    b_s_ = b_M[:, -STATE_DIM:]
+
+    loss = critic.learn(b_s, b_a, b_r, b_s_, b_discount)
+    actor.learn(b_s)
+    return loss
+
+
+def make_eval_env(port, action_repeat):
+    """ an environment and mover of their own for the evaluation worker, on the vrep instance at port """
+    eval_env = VREP_Env(rewards.graduated(GOAL_DISTANCE), goal_distance=GOAL_DISTANCE, action_repeat=action_repeat,
+                        include_sensors=SENSORS, port=port, exclusive=False)
+    eval_mover = TargetMover(eval_env.client_id, target_handle=eval_env.target_handle, path=path)
+    if HISTORY > 1:
+        eval_env = history.HistoryEnv(eval_env, HISTORY)
+    return eval_env, eval_mover
 
 
+def train(save_path, eval_every=0, eval_episodes=3, eval_port=19998, scenario_pool=None, publish_every=0):
+    """ train in the environment, greedily evaluating a weight snapshot every eval_every episodes
 
-def train():
+        Training and evaluation records go to metrics.jsonl in save_path, evaluation runs in a background
+        worker on the vrep instance listening on eval_port and never blocks training.  With a scenario_pool
+        every episode follows the scenario a scenarios.ScenarioScheduler picks instead of path.  Every
+        publish_every episodes a checkpoint is written to save_path, for a --mode serve process watching it.
+    """
     var = 2.  # control exploration
+    if os.path.isdir(save_path): shutil.rmtree(save_path)
+    os.mkdir(save_path)
+    log = metrics.MetricsLog(os.path.join(save_path, 'metrics.jsonl'))
+    worker = None
+    if eval_every:
+        worker = evaluation.EvalWorker(lambda: make_eval_env(eval_port, env.action_repeat), log,
+                                       episodes=eval_episodes, max_steps=MAX_EP_STEPS)
+        worker.start()
+    scheduler = scenarios.ScenarioScheduler(scenario_pool, log, seed=1) if scenario_pool else None
+    total_steps = 0
 
     for ep in range(MAX_EPISODES):
+        if scheduler is not None:
+            scenario = scheduler.next(total_steps)
+            mover.path = scenario.path
         s = env.reset()
         mover.reset()
         ep_reward = 0
 
         for t in range(MAX_EP_STEPS):
         # while True:
-            mover_done = mover.step()
+            if not env.pipelined:
+                mover_done = mover.step()
             
             # Added exploration noise
-            a = actor.choose_action(s)
-            a = np.clip(np.random.normal(a, var), *ACTION_BOUND)    # add randomness to action selection for exploration
-            s_, r, env_done = env.step(a)
+            if remote_actor is not None:
+                a = remote_actor.choose_action(s, var)    # the policy server adds the noise
+            else:
+                a = actor.choose_action(s)
+                a = np.clip(np.random.normal(a, var), *ACTION_BOUND)    # add randomness to action selection for exploration
+            if env.pipelined:
+                # the target move goes out with the motor commands, learning runs while the simulator advances
+                mover_done = env.step_async(a, move_target=mover.step)
+                if M.pointer > MEMORY_CAPACITY:
+                    var = max([var * 0.999, VAR_MIN])
+                    learn()
+                s_, r, env_done = env.step_wait(before_tick=mover.step)
+            else:
+                s_, r, env_done = env.step(a, before_tick=mover.step)
             M.store_transition(s, a, r, s_)
-            print("%d, Distance: %f, Orientation: %f, Delta: %f, Velocity: L %f R %f, Reward: %f" % 
-                (t, s[0], s[1], (s[0] - GOAL_DISTANCE), a[0], a[1], r))
+            print("%d, Distance: x %f y %f, Delta: %f, Velocity: L %f R %f, Reward: %f" %
+                (t, s[NEWEST_XDIST], s[NEWEST_YDIST], (s[NEWEST_XDIST] - GOAL_DISTANCE), a[0], a[1], r))
     
 
-            if M.pointer > MEMORY_CAPACITY:
+            if M.pointer > MEMORY_CAPACITY and not env.pipelined:
                 var = max([var * 0.999, VAR_MIN])    # decay the action randomness
-                b_M = M.sample(BATCH_SIZE)
-                b_s = b_M[:, :STATE_DIM]
-                b_a = b_M[:, STATE_DIM: STATE_DIM + ACTION_DIM]
-                b_r = b_M[:, -STATE_DIM - 1: -STATE_DIM]
-                b_s_ = b_M[:, -STATE_DIM:]
-
-                critic.learn(b_s, b_a, b_r, b_s_)
-                actor.learn(b_s)
+                learn()
 
             s = s_
             ep_reward += r
+            total_steps += 1
 
             done = mover_done or env_done
             if t == MAX_EP_STEPS-1 or done:
@@ -248,41 +479,596 @@ def train():
                       )
                 break
         # end for
+        M.end_episode()
         rewards_over_time[ep] = ep_reward
+        log.write('train', total_steps, episode=ep, reward=ep_reward, steps=t + 1, explore=var, done=bool(done))
+        if scheduler is not None:
+            # with --action-repeat or --pipelined the environment also ends the episode when the path runs out
+            scheduler.record(scenario, total_steps, env_done and not mover.finished(), ep_reward, t + 1)
+        if worker is not None and (ep + 1) % eval_every == 0:
+            worker.submit(total_steps, evaluation.NumpyActor(evaluation.snapshot(sess, actor.e_params),
+                                                             ACTION_BOUND[1]))
+        if publish_every and (ep + 1) % publish_every == 0:
+            save_model(save_path, global_step=ep + 1)
+
+    if worker is not None:
+        worker.stop()
+    if scheduler is not None:
+        print('\n'.join(scheduler.summary()))
+    save_model(save_path)
+    save_rewards(save_path, rewards_over_time)
+
+
+def train_multi(save_path, scenario_pool=None):
+    """ train from every robot and target pair in the scene at once
+
+        Each simulator step stores one transition per pair and takes as many learning steps, so the replay
+        ratio matches train().  Pairs that finish are reset on their own while the others carry on, an episode
+        is counted per pair.  With a scenario_pool every pair's episode follows the scenario a
+        scenarios.ScenarioScheduler picks for it, the schedule and outcomes go to metrics.jsonl in save_path.
+    """
+    var = 2.  # control exploration
+    if os.path.isdir(save_path): shutil.rmtree(save_path)
+    os.mkdir(save_path)
+    movers = mover
+    scheduler = None
+    total_steps = 0
+    if scenario_pool:
+        log = metrics.MetricsLog(os.path.join(save_path, 'metrics.jsonl'))
+        scheduler = scenarios.ScenarioScheduler(scenario_pool, log, seed=1)
+        pair_scenarios = [scheduler.next(total_steps, slot=i) for i in range(env.n)]
+        for i, scenario in enumerate(pair_scenarios):
+            movers[i].path = scenario.path
+    s = env.reset(movers=movers)
+    ep_rewards = np.zeros(env.n)
+    ep_steps = np.zeros(env.n, dtype=int)
+    ep = 0
+    while ep < MAX_EPISODES:
+        a = actor.choose_actions(s)
+        a = np.clip(np.random.normal(a, var), *ACTION_BOUND)    # add randomness to action selection for exploration
+        s_, r, dones = env.step(a, movers)
+        for i in range(env.n):
+            M.store_transition(s[i], a[i], r[i], s_[i])
+        ep_rewards += r
+        ep_steps += 1
+        total_steps += 1
+
+        if M.pointer > MEMORY_CAPACITY:
+            for _ in range(env.n):
+                var = max([var * 0.999, VAR_MIN])    # decay the action randomness
+                learn()
+
+        finished = np.flatnonzero(dones | (ep_steps == MAX_EP_STEPS))
+        for i in finished:
+            if ep < MAX_EPISODES:
+                print('Ep:', ep,
+                      '| Pair: %d' % i,
+                      '| done' if dones[i] else '| ----',
+                      '| R: %i' % int(ep_rewards[i]),
+                      '| Explore: %.2f' % var,
+                      )
+                rewards_over_time[ep] = ep_rewards[i]
+                ep += 1
+            if scheduler is not None:
+                # a pair is also done when its path ran out, only losing the target is a failure
+                scheduler.record(pair_scenarios[i], total_steps, dones[i] and not movers[i].finished(),
+                                 ep_rewards[i], ep_steps[i])
+                pair_scenarios[i] = scheduler.next(total_steps, slot=i)
+                movers[i].path = pair_scenarios[i].path
+        if len(finished):
+            ep_rewards[finished] = 0
+            ep_steps[finished] = 0
+            s = env.reset(pairs=finished, movers=movers)
+        else:
+            s = s_
+
+    if scheduler is not None:
+        print('\n'.join(scheduler.summary()))
+    save_model(save_path)
+    save_rewards(save_path, rewards_over_time)
+
+
+def save_model(save_path, global_step=None):
+    ckpt_path = os.path.join(save_path, 'DDPG.ckpt')
+    ckpt_path = saver.save(sess, ckpt_path, global_step=global_step, write_meta_graph=False)
+    print("\nSave Model %s\n" % ckpt_path)
 
-    if os.path.isdir(path): shutil.rmtree(path)
-    os.mkdir(path)
-    ckpt_path = os.path.join(path, 'DDPG.ckpt')
-    save_path = saver.save(sess, ckpt_path, write_meta_graph=False)
-    print("\nSave Model %s\n" % save_path)
-    with open(os.path.join(path, 'reward_over_time'), "wb") as file_handle:
-        np.save(file_handle, rewards_over_time)
+
+def save_rewards(save_path, rewards):
+    with open(os.path.join(save_path, 'reward_over_time'), "wb") as file_handle:
+        np.save(file_handle, rewards)
     print("\nSaved Reward Over Time")
 
-def eval():
+
+def train_offline(save_path, steps, checkpoint_every):
+    """ gradient steps from the loaded memories only, no simulator
+
+        Checkpoints every checkpoint_every steps (latest_checkpoint picks the newest, so --mode load and
+        --init-path work on the folder) and saves the per step critic loss next to them.
+    """
+    if os.path.isdir(save_path): shutil.rmtree(save_path)
+    os.mkdir(save_path)
+    if hasattr(M, "flush"):
+        M.flush()
+    critic_loss = np.zeros(steps)
+    start = time.time()
+    interval_start = start
+    for step in range(steps):
+        critic_loss[step] = learn()
+        if (step + 1) % checkpoint_every == 0 or step + 1 == steps:
+            now = time.time()
+            interval = (step % checkpoint_every) + 1
+            print('Step: %d' % (step + 1),
+                  '| Critic loss: %.4f' % critic_loss[step + 1 - interval: step + 1].mean(),
+                  '| %.1f steps/s' % (interval / (now - interval_start)),
+                  )
+            interval_start = now
+            save_model(save_path, global_step=step + 1)
+    print("\n%d steps in %.1fs, %.1f steps/s" % (steps, time.time() - start, steps / (time.time() - start)))
+    with open(os.path.join(save_path, 'critic_loss'), "wb") as file_handle:
+        np.save(file_handle, critic_loss)
+    print("\nSaved Critic Loss")
+
+
+def parallel_learner(rank, reducer, results, args, weights, steps, checkpoint_every):
+    """ one of the --learners processes, started by run_learners
+
+        The process built the same graph and its session when it imported this module, with the thread
+        pools run_learners sized for it (tuning.child_threads).  It loads the weights the learners
+        start from, then every step computes critic and policy gradients on its own minibatch and applies
+        their average over all learners, so the weights of all learners stay the same.  The first learner
+        writes the checkpoints.
+    """
+    global M
+    np.random.seed(1 + rank)
+    learner_args = copy.copy(args)
+    learner_args.learners = 1
+    setup(learner_args)
+    for param in policy_saver_params:
+        param.load(weights[param.name], sess)
+    if args.mode == "bench":
+        M = memory.Memory(MEMORY_CAPACITY, dims=2 * STATE_DIM + ACTION_DIM + 1)
+        M.data[:] = np.random.uniform(-1, 1, M.data.shape)
+        M.pointer = MEMORY_CAPACITY
+    if hasattr(M, "flush"):
+        M.flush()
+    params = critic.e_params + actor.e_params
+    shapes = [param.shape.as_list() for param in params]
+    apply_feeds = critic.grad_inputs + actor.grad_inputs
+    critic_loss = np.zeros(steps)
+    reducer.wait()
+    start = time.time()
+    interval_start = start
+    for step in range(steps):
+        b_M = M.sample(BATCH_SIZE)
+        b_s = b_M[:, :STATE_DIM]
+        b_a = b_M[:, STATE_DIM: STATE_DIM + ACTION_DIM]
+        b_r = b_M[:, -STATE_DIM - 1: -STATE_DIM]
+        b_s_ = b_M[:, -STATE_DIM:]
+        # both gradients are taken before either update, like replay_train_op
+        critic_loss[step], c_grads = sess.run([critic.loss, critic.grads],
+                                              feed_dict={S: b_s, critic.a: b_a, R: b_r, S_: b_s_})
+        a_grads = sess.run(actor.policy_grads, feed_dict={S: b_s})
+        grads = reducer.mean(rank, data_parallel.flatten(c_grads + a_grads))
+        sess.run([critic.apply_op, actor.apply_op],
+                 feed_dict=dict(zip(apply_feeds, data_parallel.split(grads, shapes))))
+        critic.replace_target()
+        actor.replace_target()
+        if rank == 0 and checkpoint_every and ((step + 1) % checkpoint_every == 0 or step + 1 == steps):
+            now = time.time()
+            interval = (step % checkpoint_every) + 1
+            print('Step: %d' % (step + 1),
+                  '| Critic loss: %.4f' % critic_loss[step + 1 - interval: step + 1].mean(),
+                  '| %.1f steps/s' % (interval / (now - interval_start)),
+                  )
+            interval_start = now
+            save_model(args.save_path, global_step=step + 1)
+    elapsed = time.time() - start
+    results.put((rank, {'steps': steps, 'elapsed': elapsed, 'critic_loss': critic_loss,
+                        'weights': data_parallel.flatten(sess.run(params))}))
+
+
+def run_learners(args, learners, steps, checkpoint_every=0):
+    """ run parallel_learner in learners processes, starting from the current weights
+
+        returns: list of the learners' results, see parallel_learner
+    """
+    weights = evaluation.snapshot(sess, policy_saver_params)
+    size = sum(int(np.prod(param.shape.as_list())) for param in critic.e_params + actor.e_params)
+    with tuning.child_threads(data_parallel.learner_threads(learners, len(tuning.available_cpus())), 1):
+        results = data_parallel.run(parallel_learner, learners, size, args=(args, weights, steps, checkpoint_every))
+    print("%d learners, weights max difference: %g" %
+          (learners, data_parallel.max_difference([result['weights'] for result in results])))
+    return results
+
+
+def train_parallel(args, learners):
+    """ --mode offline with data parallel learners
+
+        Every step learns from learners * BATCH_SIZE samples, each learner samples its own BATCH_SIZE from
+        its copy of the loaded memories.
+    """
+    if os.path.isdir(args.save_path): shutil.rmtree(args.save_path)
+    os.mkdir(args.save_path)
+    results = run_learners(args, learners, args.offline_steps, args.checkpoint_every)
+    for line in data_parallel.scaling({learners: results}, BATCH_SIZE):
+        print("%.1f steps/s, %.0f samples/s" % (line['steps_per_s'], line['samples_per_s']))
+    with open(os.path.join(args.save_path, 'critic_loss'), "wb") as file_handle:
+        np.save(file_handle, np.mean([result['critic_loss'] for result in results], axis=0))
+    print("\nSaved Critic Loss")
+
+
+def bench_learners(args, max_learners, steps):
+    """ gradient steps/s of 1, 2, 4, ... up to max_learners data parallel learners on random transitions
+
+        Efficiency is the samples/s of W learners over W times the samples/s of a single learner.
+    """
+    counts = sorted(set([2 ** i for i in range(int(np.log2(max_learners)) + 1)] + [max_learners]))
+    results = dict((learners, run_learners(args, learners, steps)) for learners in counts)
+    for line in data_parallel.scaling(results, BATCH_SIZE):
+        print("%2d learners: %.1f steps/s, %.0f samples/s, efficiency %.2f" %
+              (line['learners'], line['steps_per_s'], line['samples_per_s'], line['efficiency']))
+
+
+def train_ensemble(k, shared_memory, save_path):
+    """ train k independently initialised agents in lockstep in one batched graph
+
+        With a single simulator the members take turns driving episodes, each episode's transitions go to
+        the driving member's memory (or to the one shared memory).  Once the memories are full every step
+        updates all k members in a single sess.run, each from its own minibatch.
+    """
+    agents = ensemble.Ensemble(k, STATE_DIM, ACTION_DIM, ACTION_BOUND[1], LR_A, LR_C, GAMMA,
+                               REPLACE_ITER_A, REPLACE_ITER_C)
+    agents.initialize()
+    if shared_memory:
+        memories = [M] * k
+    else:
+        # every member starts from its own copy of the (possibly seeded) memory
+        memories = [M] + [copy.deepcopy(M) for _ in range(k - 1)]
+    member_rewards = np.full((k, MAX_EPISODES), np.nan)
+    var = 2.  # control exploration
+
+    for ep in range(MAX_EPISODES):
+        member = ep % k
+        s = env.reset()
+        mover.reset()
+        ep_reward = 0
+
+        for t in range(MAX_EP_STEPS):
+            mover_done = mover.step()
+
+            a = agents.choose_action(member, s)
+            a = np.clip(np.random.normal(a, var), *ACTION_BOUND)    # add randomness to action selection for exploration
+            s_, r, env_done = env.step(a, before_tick=mover.step)
+            memories[member].store_transition(s, a, r, s_)
+
+            if all(mem.pointer > MEMORY_CAPACITY for mem in memories):
+                var = max([var * 0.999, VAR_MIN])    # decay the action randomness
+                b_M = np.stack([mem.sample(BATCH_SIZE) for mem in memories])
+                agents.learn(b_M[:, :, :STATE_DIM],
+                             b_M[:, :, STATE_DIM: STATE_DIM + ACTION_DIM],
+                             b_M[:, :, -STATE_DIM - 1: -STATE_DIM],
+                             b_M[:, :, -STATE_DIM:])
+
+            s = s_
+            ep_reward += r
+
+            done = mover_done or env_done
+            if t == MAX_EP_STEPS-1 or done:
+                result = '| done' if done else '| ----'
+                print('Ep:', ep,
+                      '| Member: %d' % member,
+                      result,
+                      '| R: %i' % int(ep_reward),
+                      '| Explore: %.2f' % var,
+                      )
+                break
+        memories[member].end_episode()
+        member_rewards[member, ep] = ep_reward
+
+    if os.path.isdir(save_path): shutil.rmtree(save_path)
+    os.mkdir(save_path)
+    for member in range(k):
+        member_path = os.path.join(save_path, 'member_%d' % member)
+        os.mkdir(member_path)
+        print("\nSave Model %s\n" % agents.save_member(member, member_path))
+        # episodes the member did not drive are nan
+        save_rewards(member_path, member_rewards[member])
+
+
+def eval(controller=None):
+    """ run one episode greedily, with the actor or a controller standing in for it, e.g. a LookupController """
     s = env.reset()
     while True:
         mover_done = mover.step()
-        a = actor.choose_action(s)
-        s_, r, env_done = env.step(a)
+        a = (controller or remote_actor or actor).choose_action(s)
+        s_, r, env_done = env.step(a, before_tick=mover.step)
         s = s_
         if mover_done or env_done:
             break;
 
+def bench(steps):
+    """ compare gradient steps/s of the Memory + feed_dict path against the in-graph replay path """
+    global M
+    random_rows = np.random.uniform(-1, 1, (MEMORY_CAPACITY, 2 * STATE_DIM + ACTION_DIM + 1))
+    memories = [("feed_dict", memory.Memory(MEMORY_CAPACITY, dims=random_rows.shape[1])), ("graph", graph_M)]
+    for name, M in memories:
+        for row in random_rows:
+            M.store_transition(row[:STATE_DIM], row[STATE_DIM: STATE_DIM + ACTION_DIM],
+                               row[STATE_DIM + ACTION_DIM], row[-STATE_DIM:])
+        if hasattr(M, "flush"):
+            M.flush()
+        learn()  # warm up
+        start = time.time()
+        for _ in range(steps):
+            learn()
+        elapsed = time.time() - start
+        print("%s: %d steps in %.2fs, %.1f steps/s" % (name, steps, elapsed, steps / elapsed))
+
+
+def autotune_probe(rank, reducer, results, seconds):
+    """ measure the thread pool setting of this process, one of the --mode autotune processes
+
+        The process built its session at import with the pools autotune set (tuning.child_threads).
+        Latency is the median of single state Actor.choose_action calls, throughput the samples/s of
+        critic.learn followed by actor.learn, as learn() runs them with the numpy memory, on random transitions.
+    """
+    sess.run(tf.global_variables_initializer())
+    sess.run(tf.local_variables_initializer())
+    bench_M = memory.Memory(MEMORY_CAPACITY, dims=2 * STATE_DIM + ACTION_DIM + 1)
+    bench_M.data[:] = np.random.uniform(-1, 1, bench_M.data.shape)
+    bench_M.pointer = MEMORY_CAPACITY
+    state = bench_M.data[0, :STATE_DIM]
+
+    def learn_batch(batch_size):
+        b_M = bench_M.sample(batch_size)
+        b_s = b_M[:, :STATE_DIM]
+        critic.learn(b_s, b_M[:, STATE_DIM: STATE_DIM + ACTION_DIM], b_M[:, -STATE_DIM - 1: -STATE_DIM],
+                     b_M[:, -STATE_DIM:])
+        actor.learn(b_s)
+
+    intra, inter = tuning.inherited_threads()
+    results.put((rank, {'intra_op_threads': intra, 'inter_op_threads': inter,
+                        'latency_ms': 1000 * tuning.latency(lambda: actor.choose_action(state)),
+                        'samples_per_s': dict((batch_size, batch_size * tuning.rate(lambda: learn_batch(batch_size),
+                                                                                    seconds))
+                                              for batch_size in tuning.BATCH_SIZES)}))
+
+
+def autotune(profile_path, seconds):
+    """ measure every thread pool setting and batch size on this machine and write the chosen ones to a profile
+
+        Tensorflow sizes its pools once per process, so every setting is measured in a process of its own
+        started with data_parallel.run, see autotune_probe.  See tuning.choose for how the profile is picked.
+    """
+    cpus = tuning.available_cpus()
+    measurements = []
+    for intra, inter in tuning.thread_settings(len(cpus)):
+        with tuning.child_threads(intra, inter):
+            measurement = data_parallel.run(autotune_probe, 1, 1, args=(seconds,))[0]
+        print("intra %2d inter %d: choose_action %.3fms |" % (intra, inter, measurement['latency_ms']),
+              ' | '.join("batch %d %.0f samples/s" % (batch_size, measurement['samples_per_s'][batch_size])
+                         for batch_size in tuning.BATCH_SIZES))
+        measurements.append(measurement)
+    spread = tuning.spread(measurements)
+    if spread < 1 + tuning.TOLERANCE:
+        print("The thread pool settings are within %.0f%% of each other, the differences are noise and the "
+              "profile keeps the fewest threads" % (100 * (spread - 1)))
+    chosen = tuning.choose(measurements)
+    tuning.save_profile(profile_path, chosen, measurements, cpus)
+    print("%s: intra op threads %d, inter op threads %d, batch size %d" %
+          (profile_path, chosen['intra_op_threads'], chosen['inter_op_threads'], chosen['batch_size']))
+
+
+def serve(save_path, socket_path, poll_seconds):
+    """ answer batched action requests from rollout workers, hot swapping in each new checkpoint in save_path """
+    server = policy_server.PolicyServer(actor.choose_actions, STATE_DIM, ACTION_DIM, ACTION_BOUND, socket_path)
+    server.start()
+    print("Serving policy on %s" % socket_path)
+    served = None
+    try:
+        while True:
+            latest = tf.train.latest_checkpoint(save_path)
+            if latest is not None and latest != served:
+                version = server.swap(lambda: policy_saver.restore(sess, latest))
+                served = latest
+                print("Serving %s as version %d" % (latest, version))
+            stats = server.stats()
+            if stats['requests']:
+                print('Requests: %d' % stats['requests'],
+                      '| Batch fill: %.2f' % stats['batch_fill'],
+                      '| Latency ms: mean %.2f p99 %.2f' % (stats['latency_ms_mean'], stats['latency_ms_p99']),
+                      )
+                server.reset_stats()
+            time.sleep(poll_seconds)
+    finally:
+        server.stop()
+
+
+def analyse_landscape(save_path, landscape_path, grid_shape, extent):
+    """ actor actions and critic values over a state grid for every checkpoint in save_path
+
+        Results are cached per checkpoint in landscape_path, with a CSV and images each and a summary.csv
+        comparing the checkpoints in the order they were written.
+    """
+    ckpt = tf.train.get_checkpoint_state(save_path)
+    if ckpt is None:
+        raise Exception('No checkpoints in ' + save_path)
+    if not os.path.isdir(landscape_path):
+        os.makedirs(landscape_path)
+    axes = landscape.grid_axes(extent, grid_shape)
+    # a grid state held for the whole history
+    run = lambda states: sess.run([actor.a, critic.q], feed_dict={S: np.tile(states, HISTORY)})
+    lines = []
+    previous = None
+    for checkpoint in ckpt.all_model_checkpoint_paths:
+        name = os.path.basename(checkpoint)
+        prefix = os.path.join(landscape_path, name)
+        start = time.time()
+        policy_saver.restore(sess, checkpoint)
+        result = landscape.analyse(run, axes, cache_path=prefix + '.npz', checkpoint=name,
+                                   version=landscape.checkpoint_version(checkpoint))
+        landscape.write_csv(result, prefix + '.csv')
+        landscape.write_images(result, prefix)
+        lines.append(landscape.summary(result, previous))
+        previous = result
+        print("%s: %d states in %.2fs" % (name, result['q'].size, time.time() - start))
+    landscape.write_summary_csv(lines, os.path.join(landscape_path, 'summary.csv'))
+
+
+def compile_lookup(save_path, lookup_path, extent, tolerance, dtype):
+    """ compile the actor of the latest checkpoint in save_path into a lookup table, see lookup_table.py """
+    policy_saver.restore(sess, tf.train.latest_checkpoint(save_path))
+    start = time.time()
+    table = lookup_table.compile_actor(actor.choose_actions, ACTION_BOUND[1], extent, tolerance=tolerance, dtype=dtype)
+    table.save(lookup_path)
+    print("%s: %s grid, %d bytes, max action error %.4f, compiled in %.1fs" %
+          (lookup_path, 'x'.join(str(n) for n in table.shape[:3]), table.nbytes, table.max_error,
+           time.time() - start))
+
+
 def main():
-    parser = argparse.ArgumentParser(description='Run DDPG against v-rep environment.')
-    parser.add_argument('--mode', required=True, choices=["train", "load"],
+    parser = add_import_args(argparse.ArgumentParser(description='Run DDPG against v-rep environment.'))
+    parser.add_argument('--mode', required=True,
+                        choices=["train", "load", "offline", "serve", "bench", "landscape", "compile", "autotune"],
                         help='what mode to run in')
     parser.add_argument('--save-path', dest='save_path', required=True, default="../vrep-train",
                         help='Where to save to or load from')
-    parser.add_argument('--load-mem-path', dest='loadmempath', required=False, default=None,
-                        help='path to generated mem file') 
+    parser.add_argument('--load-mem-path', dest='loadmempath', required=False, default=None, nargs='+',
+                        help='path to generated mem file, several are concatenated')
+    parser.add_argument('--init-path', dest='init_path', required=False, default=None,
+                        help='start training from the latest checkpoint in this folder')
+    parser.add_argument('--offline-steps', dest='offline_steps', type=int, required=False, default=100000,
+                        help='gradient steps to take in --mode offline')
+    parser.add_argument('--checkpoint-every', dest='checkpoint_every', type=int, required=False, default=10000,
+                        help='steps between checkpoints in --mode offline')
+    parser.add_argument('--replay', dest='replay', required=False, default="memory", choices=["memory", "graph"],
+                        help='keep the replay buffer in numpy (memory) or in tf variables sampled in-graph (graph)')
+    parser.add_argument('--ensemble', dest='ensemble', type=int, required=False, default=1,
+                        help='train this many independently initialised agents in one batched graph')
+    parser.add_argument('--shared-memory', dest='shared_memory', action='store_true',
+                        help='with --ensemble, draw every member\'s minibatches from one shared memory')
+    parser.add_argument('--n-step', dest='n_step', type=int, required=False, default=1,
+                        help='bootstrap the critic from n-step returns accumulated in the memory')
+    parser.add_argument('--action-repeat', dest='action_repeat', type=int, required=False, default=1,
+                        help='number of control ticks each chosen action is held for')
+    parser.add_argument('--compact-memory', dest='compact_memory', required=False, default=None,
+                        choices=["float32", "float16", "int16"],
+                        help='store each observation once per episode step, with states and actions in this type')
+    parser.add_argument('--policy-socket', dest='policy_socket', required=False, default=None,
+                        help='unix socket of the policy server, --mode serve listens on it, other modes act through it')
+    parser.add_argument('--serve-poll', dest='serve_poll', type=float, required=False, default=5.0,
+                        help='seconds between checks for a new checkpoint and stats reports in --mode serve')
+    parser.add_argument('--publish-every', dest='publish_every', type=int, required=False, default=0,
+                        help='write a checkpoint to the save path every this many training episodes, a --mode '
+                             'serve process watching it swaps the new weights in')
+    parser.add_argument('--record-path', dest='record_path', required=False, default=None,
+                        help='folder to record every episode\'s trajectory to, see trajectory.py')
+    parser.add_argument('--pipelined', dest='pipelined', action='store_true',
+                        help='send each action and target move as one non blocking message and learn while the '
+                             'simulator advances')
+    parser.add_argument('--pairs', dest='pairs', type=int, required=False, default=1,
+                        help='train from this many robot and target pairs in one scene, copies are named #0, #1, ...')
+    parser.add_argument('--eval-every', dest='eval_every', type=int, required=False, default=0,
+                        help='greedily evaluate a snapshot of the actor every this many training episodes, '
+                             'in the background on the vrep instance at --eval-port')
+    parser.add_argument('--eval-episodes', dest='eval_episodes', type=int, required=False, default=3,
+                        help='episodes per --eval-every evaluation')
+    parser.add_argument('--eval-port', dest='eval_port', type=int, required=False, default=19998,
+                        help='remote api port of the second vrep instance evaluations run on')
+    parser.add_argument('--lookup-path', dest='lookup_path', required=False, default=None,
+                        help='lookup table --mode compile writes, defaults to lookup.npz in the save path, '
+                             '--mode load drives with it instead of the actor')
+    parser.add_argument('--lookup-tolerance', dest='lookup_tolerance', type=float, required=False, default=0.05,
+                        help='largest action error --mode compile refines the lookup table grid to')
+    parser.add_argument('--lookup-extent', dest='lookup_extent', type=float, required=False, default=2.0,
+                        help='largest absolute xdist and ydist the lookup table covers')
+    parser.add_argument('--lookup-dtype', dest='lookup_dtype', required=False, default="float32",
+                        choices=["float32", "int16"], help='how the lookup table stores its actions')
+    parser.add_argument('--scenarios', dest='scenarios', required=False, default=None, nargs='+',
+                        choices=sorted(scenarios.PATHS),
+                        help='train on these target paths, scheduling episodes towards the ones the agent fails')
+    parser.add_argument('--scenario-offsets', dest='scenario_offsets', type=int, required=False, default=1,
+                        help='start every --scenarios path at this many evenly spaced places along it')
+    parser.add_argument('--learners', dest='learners', type=int, required=False, default=1,
+                        help='data parallel learner processes averaging their gradients, for --mode offline, '
+                             'and the most --mode bench measures the scaling up to')
+    parser.add_argument('--bench-steps', dest='bench_steps', type=int, required=False, default=2000,
+                        help='gradient steps per replay path for --mode bench')
+    parser.add_argument('--autotune-seconds', dest='autotune_seconds', type=float, required=False, default=2.0,
+                        help='seconds --mode autotune measures the learning throughput of every setting for')
+    parser.add_argument('--landscape-path', dest='landscape_path', required=False, default=None,
+                        help='where --mode landscape writes its results, defaults to landscape/ in the save path')
+    parser.add_argument('--landscape-grid', dest='landscape_grid', type=int, nargs=3, required=False,
+                        default=[41, 41, 9], metavar=('XDIST', 'YDIST', 'THETA'),
+                        help='number of xdist, ydist and theta values in the --mode landscape grid')
+    parser.add_argument('--landscape-extent', dest='landscape_extent', type=float, required=False, default=2.0,
+                        help='largest absolute xdist and ydist of the --mode landscape grid')
     args = parser.parse_args()
+    if args.ensemble > 1 and args.replay == "graph":
+        parser.error("--ensemble samples numpy memories, use it with --replay memory")
+    if args.ensemble > 1 and args.mode != "train":
+        parser.error("--ensemble trains its members online, use it with --mode train")
+    if args.n_step > 1 and (args.replay == "graph" or args.ensemble > 1):
+        parser.error("--n-step is only supported with the single agent --replay memory path")
+    if args.compact_memory and (args.replay == "graph" or args.n_step > 1):
+        parser.error("--compact-memory replaces the plain memory, it does not combine with --replay graph or --n-step")
+    if args.pairs > 1 and (args.n_step > 1 or args.compact_memory or args.ensemble > 1 or args.mode != "train"
+                           or args.pipelined or args.record_path or args.policy_socket):
+        parser.error("--pairs trains one agent from a plain or graph memory, the pairs interleave their transitions")
+    if args.history > 1 and (args.replay == "graph" or args.n_step > 1 or args.ensemble > 1 or args.pairs > 1):
+        parser.error("--history stacks states out of the compact memory, use it with the single agent --replay memory")
+    if args.learners > 1 and (args.mode not in ("offline", "bench") or args.replay == "graph" or args.n_step > 1
+                              or args.ensemble > 1):
+        parser.error("--learners runs --mode offline or bench with the single agent --replay memory")
+    if args.sensors and (args.mode in ("compile", "landscape") or args.lookup_path):
+        parser.error("lookup tables and landscapes span (xdist, ydist, theta), they do not combine with --sensors")
+    if args.history > 1 and (args.mode == "compile" or args.lookup_path):
+        parser.error("lookup tables cover single observation states, they do not combine with --history")
+    if args.lookup_path and args.mode not in ("compile", "load"):
+        parser.error("--lookup-path is written by --mode compile and driven with by --mode load")
+    if args.scenarios and (args.mode != "train" or args.ensemble > 1):
+        parser.error("--scenarios schedules the episodes of --mode train")
+    if args.eval_every and (args.mode != "train" or args.ensemble > 1 or args.pairs > 1):
+        parser.error("--eval-every evaluates the single agent of --mode train")
+    if args.mode == "autotune" and args.no_profile:
+        parser.error("--mode autotune writes the --profile, it does not combine with --no-profile")
+    if args.publish_every and (args.mode != "train" or args.ensemble > 1 or args.pairs > 1):
+        parser.error("--publish-every publishes the single agent of --mode train")
+    if args.mode == "serve" and not args.policy_socket:
+        parser.error("--mode serve needs a --policy-socket to listen on")
+    if args.mode == "offline" and not args.loadmempath:
+        parser.error("--mode offline trains from saved memories, pass them with --load-mem-path")
+    scenario_pool = scenarios.make_pool(args.scenarios, args.scenario_offsets) if args.scenarios else None
     setup(args)
     if args.mode == "load":
-        eval()
+        eval(lookup_table.LookupController(lookup_table.load(args.lookup_path)) if args.lookup_path else None)
+    elif args.mode == "bench" and args.learners > 1:
+        bench_learners(args, args.learners, args.bench_steps)
+    elif args.mode == "bench":
+        bench(args.bench_steps)
+    elif args.mode == "autotune":
+        autotune(args.profile, args.autotune_seconds)
+    elif args.mode == "offline" and args.learners > 1:
+        train_parallel(args, args.learners)
+    elif args.mode == "offline":
+        train_offline(args.save_path, args.offline_steps, args.checkpoint_every)
+    elif args.mode == "serve":
+        serve(args.save_path, args.policy_socket, args.serve_poll)
+    elif args.mode == "compile":
+        compile_lookup(args.save_path, args.lookup_path or os.path.join(args.save_path, 'lookup.npz'),
+                       args.lookup_extent, args.lookup_tolerance, args.lookup_dtype)
+    elif args.mode == "landscape":
+        analyse_landscape(args.save_path, args.landscape_path or os.path.join(args.save_path, 'landscape'),
+                          args.landscape_grid, args.landscape_extent)
+    elif args.ensemble > 1:
+        train_ensemble(args.ensemble, args.shared_memory, args.save_path)
+    elif args.pairs > 1:
+        train_multi(args.save_path, scenario_pool)
     else:
-        train()
+        train(args.save_path, args.eval_every, args.eval_episodes, args.eval_port, scenario_pool, args.publish_every)
+    if env is not None:
+        env.stop()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
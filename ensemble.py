@@ -0,0 +1,228 @@
+""" Module for training K independent DDPG agents in one batched graph
+
+Every weight carries a leading population dimension and every layer is a batched matmul over it, so one
+sess.run updates all K members.  Members never share parameters, their losses are summed so the gradient
+each member sees is the same as if it were trained on its own.  The layer sizes and variable names
+mirror ddpg.Actor and ddpg.Critic so a single member can be written out as a regular checkpoint.
+"""
+import os
+import numpy as np
+import tensorflow as tf
+
+
+def _glorot(n_in, n_out):
+    """ xavier uniform initializer for a single member's (n_in, n_out) slice """
+    limit = np.sqrt(6.0 / (n_in + n_out))
+    return tf.random_uniform_initializer(-limit, limit)
+
+
+def _dense(x, k, n_in, n_out, name, trainable, activation=None, init_b=None, use_bias=True):
+    """ batched dense layer, x is (k, batch, n_in) and each member has its own (n_in, n_out) kernel """
+    with tf.variable_scope(name):
+        w = tf.get_variable('kernel', [k, n_in, n_out], initializer=_glorot(n_in, n_out), trainable=trainable)
+        net = tf.matmul(x, w)
+        if use_bias:
+            b = tf.get_variable('bias', [k, 1, n_out], initializer=init_b or tf.zeros_initializer(),
+                                trainable=trainable)
+            net = net + b
+    if activation is not None:
+        net = activation(net)
+    return net
+
+
+class EnsembleActor(object):
+    """ ddpg.Actor with a leading population dimension """
+
+    def __init__(self, k, s, s_, action_dim, action_bound, learning_rate):
+        self.k = k
+        self.a_dim = action_dim
+        self.action_bound = action_bound
+        self.lr = learning_rate
+
+        with tf.variable_scope('Actor'):
+            # input s, output a
+            self.a = self._build_net(s, scope='eval_net', trainable=True)
+
+            # input s_, output a, get a_ for critic
+            self.a_ = self._build_net(s_, scope='target_net', trainable=False)
+
+        self.e_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Actor/eval_net')
+        self.t_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Actor/target_net')
+        self.replace_op = [tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)]
+
+    def _build_net(self, s, scope, trainable):
+        with tf.variable_scope(scope):
+            init_b = tf.constant_initializer(0.001)
+            s_dim = s.get_shape().as_list()[-1]
+            net = _dense(s, self.k, s_dim, 200, 'l1', trainable, tf.nn.relu6, init_b)
+            net = _dense(net, self.k, 200, 200, 'l2', trainable, tf.nn.relu6, init_b)
+            net = _dense(net, self.k, 200, 10, 'l3', trainable, tf.nn.relu, init_b)
+            with tf.variable_scope('a'):
+                actions = _dense(net, self.k, 10, self.a_dim, 'a', trainable, tf.nn.tanh)
+                scaled_a = tf.multiply(actions, self.action_bound, name='scaled_a')
+        return scaled_a
+
+    def add_grad_to_graph(self, a_grads):
+        with tf.variable_scope('policy_grads'):
+            self.policy_grads = tf.gradients(ys=self.a, xs=self.e_params, grad_ys=a_grads)
+
+        with tf.variable_scope('A_train'):
+            opt = tf.train.RMSPropOptimizer(-self.lr)  # (- learning rate) for ascent policy
+            self.train_op = opt.apply_gradients(zip(self.policy_grads, self.e_params))
+
+
+class EnsembleCritic(object):
+    """ ddpg.Critic with a leading population dimension """
+
+    def __init__(self, k, s, a, r, s_, actor, state_dim, action_dim, learning_rate, gamma):
+        self.k = k
+        self.s_dim = state_dim
+        self.a_dim = action_dim
+        self.lr = learning_rate
+        self.gamma = gamma
+
+        with tf.variable_scope('Critic'):
+            # Input (s, a) from the replay batch, output q
+            self.q = self._build_net(s, a, 'eval_net', trainable=True)
+
+            # Input (s, actor a), output q the actor climbs
+            self.q_actor = self._build_net(s, actor.a, 'eval_net', trainable=True, reuse=True)
+
+            # Input (s_, a_), output q_ for q_target
+            self.q_ = self._build_net(s_, actor.a_, 'target_net', trainable=False)
+
+            self.e_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Critic/eval_net')
+            self.t_params = tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='Critic/target_net')
+        self.replace_op = [tf.assign(t, e) for t, e in zip(self.t_params, self.e_params)]
+
+        with tf.variable_scope('target_q'):
+            self.target_q = r + self.gamma * self.q_
+
+        with tf.variable_scope('TD_error'):
+            # one loss per member, summed for the update
+            self.losses = tf.reduce_mean(tf.squared_difference(self.target_q, self.q), axis=[1, 2])
+            self.loss = tf.reduce_sum(self.losses)
+
+        with tf.variable_scope('a_grad'):
+            self.a_grads = tf.gradients(self.q_actor, actor.a)[0]
+
+    def add_train_to_graph(self, policy_grads):
+        """ the critic update waits on the policy gradients so both read the pre-update critic """
+        with tf.variable_scope('C_train'):
+            with tf.control_dependencies(policy_grads):
+                self.train_op = tf.train.RMSPropOptimizer(self.lr).minimize(self.loss, var_list=self.e_params)
+
+    def _build_net(self, s, a, scope, trainable, reuse=None):
+        with tf.variable_scope(scope, reuse=reuse):
+            init_b = tf.constant_initializer(0.01)
+
+            with tf.variable_scope('l1'):
+                n_l1 = 200
+                w1_s = tf.get_variable('w1_s', [self.k, self.s_dim, n_l1], initializer=_glorot(self.s_dim, n_l1),
+                                       trainable=trainable)
+                w1_a = tf.get_variable('w1_a', [self.k, self.a_dim, n_l1], initializer=_glorot(self.a_dim, n_l1),
+                                       trainable=trainable)
+                b1 = tf.get_variable('b1', [self.k, 1, n_l1], initializer=init_b, trainable=trainable)
+                net = tf.nn.relu6(tf.matmul(s, w1_s) + tf.matmul(a, w1_a) + b1)
+            net = _dense(net, self.k, 200, 200, 'l2', trainable, tf.nn.relu6, init_b)
+            net = _dense(net, self.k, 200, 10, 'l3', trainable, tf.nn.relu, init_b)
+            with tf.variable_scope('q'):
+                q = _dense(net, self.k, 10, 1, 'dense', trainable, init_b=init_b)   # Q(s,a)
+        return q
+
+
+class Ensemble(object):
+    """ K actor/critic pairs trained in lockstep in their own graph and session """
+
+    def __init__(self, k, state_dim, action_dim, action_bound, lr_a, lr_c, gamma, replace_iter_a,
+                 replace_iter_c, config=None):
+        """ build the batched graph
+
+            params: k - number of members
+                    state_dim, action_dim, action_bound - environment dimensions, see VREP_Env
+                    lr_a, lr_c, gamma, replace_iter_a, replace_iter_c - as for ddpg.Actor and ddpg.Critic
+                    config - optional tf.ConfigProto for the session
+        """
+        self.k = k
+        self.replace_iter_a = replace_iter_a
+        self.replace_iter_c = replace_iter_c
+        self.learn_counter = 0
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            with tf.name_scope('S'):
+                self.S = tf.placeholder(tf.float32, shape=[k, None, state_dim], name='s')
+            with tf.name_scope('A'):
+                self.A = tf.placeholder(tf.float32, shape=[k, None, action_dim], name='a')
+            with tf.name_scope('R'):
+                self.R = tf.placeholder(tf.float32, [k, None, 1], name='r')
+            with tf.name_scope('S_'):
+                self.S_ = tf.placeholder(tf.float32, shape=[k, None, state_dim], name='s_')
+
+            self.actor = EnsembleActor(k, self.S, self.S_, action_dim, action_bound, lr_a)
+            self.critic = EnsembleCritic(k, self.S, self.A, self.R, self.S_, self.actor, state_dim, action_dim,
+                                         lr_c, gamma)
+            self.actor.add_grad_to_graph(self.critic.a_grads)
+            self.critic.add_train_to_graph(self.actor.policy_grads)
+            self.train_op = tf.group(self.critic.train_op, self.actor.train_op)
+            self.init_op = tf.global_variables_initializer()
+        self.sess = tf.Session(graph=self.graph, config=config)
+
+    def initialize(self):
+        self.sess.run(self.init_op)
+
+    def choose_actions(self, states):
+        """ one action per member
+
+            params: states - (k, state_dim) array, row i is the state member i acts on
+
+            returns: (k, action_dim) array of actions
+        """
+        return self.sess.run(self.actor.a, feed_dict={self.S: np.asarray(states)[:, np.newaxis, :]})[:, 0, :]
+
+    def choose_action(self, member, s):
+        """ action of a single member, the other members see the same state and are discarded """
+        return self.choose_actions(np.tile(s, (self.k, 1)))[member]
+
+    def learn(self, s, a, r, s_):
+        """ one update of every member in a single sess.run
+
+            params: s, a, r, s_ - (k, batch, dim) arrays, slice i is member i's minibatch
+
+            returns: per member critic loss before the update
+        """
+        losses, _ = self.sess.run([self.critic.losses, self.train_op],
+                                  feed_dict={self.S: s, self.A: a, self.R: r, self.S_: s_})
+        if self.learn_counter % self.replace_iter_c == 0:
+            self.sess.run(self.critic.replace_op)
+        if self.learn_counter % self.replace_iter_a == 0:
+            self.sess.run(self.actor.replace_op)
+        self.learn_counter += 1
+        return losses
+
+    def member_weights(self, member):
+        """ one member's weights keyed by the variable names ddpg.Actor and ddpg.Critic use """
+        variables = self.actor.e_params + self.actor.t_params + self.critic.e_params + self.critic.t_params
+        values = self.sess.run(variables)
+        weights = {}
+        for variable, value in zip(variables, values):
+            value = value[member]
+            if variable.op.name.endswith('bias'):
+                value = value[0]    # dense layers keep a flat bias, ddpg.Critic's b1 stays (1, n)
+            weights[variable.op.name] = value
+        return weights
+
+    def save_member(self, member, path):
+        """ save one member as a checkpoint that ddpg.py --mode load can restore
+
+            params: member - index of the member
+                    path - directory to write DDPG.ckpt into
+
+            returns: path of the written checkpoint
+        """
+        weights = self.member_weights(member)
+        with tf.Graph().as_default():
+            variables = [tf.Variable(value, name=name) for name, value in sorted(weights.items())]
+            saver = tf.train.Saver(variables)
+            with tf.Session() as sess:
+                sess.run(tf.variables_initializer(variables))
+                return saver.save(sess, os.path.join(path, 'DDPG.ckpt'), write_meta_graph=False)
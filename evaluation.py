@@ -0,0 +1,135 @@
+""" module for greedy evaluation episodes that run next to training
+
+The learner hands a snapshot of the actor weights to an EvalWorker, which evaluates it in a background thread
+on its own environment with a numpy copy of the actor, so neither the training session nor the training
+environment is touched.  Results go to the shared metrics stream labelled with the step the snapshot was taken.
+"""
+import threading
+import numpy as np
+from state_batch import as_array
+
+
+def snapshot(sess, params):
+    """ copy of the current values of the given variables
+
+        returns: dict of variable name to array
+    """
+    return dict(zip([param.name for param in params], sess.run(params)))
+
+
+def _relu6(x):
+    return np.minimum(np.maximum(x, 0), 6)
+
+
+class NumpyActor(object):
+    """ the ddpg actor network evaluated with numpy from a weight snapshot, greedy, no exploration noise """
+
+    # layer names and activations, see Actor._build_net in ddpg.py
+    layers = [('l1', _relu6), ('l2', _relu6), ('l3', lambda x: np.maximum(x, 0)), ('a/a', np.tanh)]
+
+    def __init__(self, weights, action_bound, scope='Actor/eval_net'):
+        """ params: weights - from snapshot(), variable name to array
+                    action_bound - the largest absolute action
+                    scope - variable scope of the network
+        """
+        self.action_bound = action_bound
+        self.params = [(weights['%s/%s/kernel:0' % (scope, name)], weights['%s/%s/bias:0' % (scope, name)],
+                        activation) for name, activation in self.layers]
+
+    def choose_actions(self, states):
+        net = as_array(states)
+        for kernel, bias, activation in self.params:
+            net = activation(net.dot(kernel) + bias)
+        return net * self.action_bound
+
+    def choose_action(self, s):
+        return self.choose_actions(np.asarray(as_array(s))[np.newaxis, :])[0]
+
+
+class EvalWorker(object):
+    """ runs greedy evaluation episodes of submitted policies in a background thread
+
+        Only the newest submitted policy waits to be evaluated, a snapshot submitted while an evaluation runs
+        replaces any older one that has not started yet.
+    """
+
+    def __init__(self, make_env, log, episodes=3, max_steps=100):
+        """ params: make_env - callable returning (env, mover), called on the worker thread so the
+                               environment (and its connection) belongs to the worker
+                    log - metrics.MetricsLog the results are written to
+                    episodes - episodes per evaluation
+                    max_steps - step limit of an episode
+        """
+        self.make_env = make_env
+        self.log = log
+        self.episodes = episodes
+        self.max_steps = max_steps
+        self.evaluated = 0
+        self.skipped = 0
+        self._pending = None
+        self._running = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, step, policy):
+        """ queue a policy for evaluation without waiting for it
+
+            params: step - training step the policy was snapshotted at
+                    policy - object with choose_action, e.g. a NumpyActor
+        """
+        with self._condition:
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = (step, policy)
+            self._condition.notify()
+
+    def stop(self, finish=True):
+        """ stop the worker, after evaluating the pending policy if finish is set """
+        with self._condition:
+            if not finish:
+                self._pending = None
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        env, mover = self.make_env()
+        try:
+            while True:
+                with self._condition:
+                    while self._pending is None and self._running:
+                        self._condition.wait()
+                    if self._pending is None:
+                        return
+                    step, policy = self._pending
+                    self._pending = None
+                self._evaluate(env, mover, step, policy)
+        finally:
+            env.stop()
+
+    def _evaluate(self, env, mover, step, policy):
+        rewards = np.zeros(self.episodes)
+        steps = np.zeros(self.episodes)
+        dones = np.zeros(self.episodes, dtype=bool)
+        for ep in range(self.episodes):
+            s = env.reset()
+            mover.reset()
+            for t in range(self.max_steps):
+                mover_done = mover.step()
+                s, r, env_done = env.step(policy.choose_action(s), before_tick=mover.step)
+                rewards[ep] += r
+                steps[ep] = t + 1
+                if mover_done or env_done:
+                    # with --action-repeat or --pipelined the environment also ends the episode when the path runs out
+                    dones[ep] = env_done and not mover.finished()
+                    break
+        self.evaluated += 1
+        self.log.write('eval', step, reward_mean=rewards.mean(), reward_std=rewards.std(),
+                       reward_min=rewards.min(), steps_mean=steps.mean(), lost_target=int(dones.sum()),
+                       episodes=self.episodes)
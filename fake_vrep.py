@@ -0,0 +1,425 @@
+""" local stand-in for the vrep remote api module
+
+Implements the subset of the remote api vrep_env.py and target_mover.py use against a simple kinematic
+scene: a Pioneer_p3dx differential drive robot (with its two motors and 16 ultrasonic sensors), a Sphere
+target and optional circular obstacles, optionally copied into several robot and target pairs.  The scene
+advances with wall clock time like a running simulation.
+
+Opmode semantics follow the real remote api:
+    simx_opmode_oneshot_wait / simx_opmode_blocking - one round trip of latency, returns the value
+    simx_opmode_oneshot - no waiting, setters are applied, getters return simx_return_novalue_flag
+    simx_opmode_streaming - starts a stream, the first call returns simx_return_novalue_flag
+    simx_opmode_buffer - latest value of a started stream without waiting, simx_return_novalue_flag otherwise
+and while simxPauseCommunication(client_id, True) is in effect non blocking commands are held back and
+applied together when it is released.
+
+To use it in place of the real module call install() before importing vrep_env or target_mover:
+
+    import fake_vrep
+    fake_vrep.install(latency=0.005)
+    import vrep_env
+"""
+import math
+import sys
+import time
+import numpy as np
+import kinematics
+import sensor_model
+
+
+simx_return_ok = 0
+simx_return_novalue_flag = 1
+simx_return_timeout_flag = 2
+simx_return_illegal_opmode_flag = 4
+simx_return_remote_error_flag = 8
+simx_return_split_progress_flag = 16
+simx_return_local_error_flag = 32
+simx_return_initialize_error_flag = 64
+
+simx_opmode_oneshot = 0
+simx_opmode_blocking = 65536
+simx_opmode_oneshot_wait = 65536
+simx_opmode_streaming = 131072
+simx_opmode_buffer = 393216
+
+sim_object_shape_type = 0
+sim_object_joint_type = 1
+sim_object_proximitysensor_type = 5
+sim_appobj_object_type = 109
+
+SENSOR_RANGE = 1.0
+ROBOT_NAME = 'Pioneer_p3dx'
+
+_config = {'latency': 0.0, 'realtime_factor': 1.0, 'robot_pose': (0.0, 0.0, 0.0), 'target_pos': (1.0, 0.0, 0.05),
+           'obstacles': [], 'pairs': 1, 'pair_spacing': 5.0, 'dynamics': dict(kinematics.DYNAMICS)}
+_scenes = {}
+_next_client = [0]
+_stats = {}
+
+
+def install(**config):
+    """ register this module as 'vrep' so the project modules import it, configure() takes the same arguments """
+    configure(**config)
+    sys.modules['vrep'] = sys.modules[__name__]
+
+
+def configure(latency=None, realtime_factor=None, robot_pose=None, target_pos=None, obstacles=None, pairs=None,
+              pair_spacing=None, dynamics=None):
+    """ configure scenes created by the next simxStart
+
+        params: latency - seconds every blocking call waits for its round trip
+                realtime_factor - simulated seconds per wall clock second
+                robot_pose - starting (x, y, yaw) of the robot
+                target_pos - starting (x, y, z) of the target
+                obstacles - list of (x, y, radius) circles the ultrasonic sensors can detect
+                pairs - number of robot and target pairs, copies are named with #0, #1, ... suffixes
+                pair_spacing - how far apart along y the pairs start
+                dynamics - wheel_radius, axle_length and motor time_constant of the robot, e.g. from
+                           fidelity.load_calibration(), missing ones keep the kinematics.DYNAMICS values
+    """
+    for key, value in [('latency', latency), ('realtime_factor', realtime_factor), ('robot_pose', robot_pose),
+                       ('target_pos', target_pos), ('obstacles', obstacles), ('pairs', pairs),
+                       ('pair_spacing', pair_spacing)]:
+        if value is not None:
+            _config[key] = value
+    if dynamics is not None:
+        _config['dynamics'] = dict(kinematics.DYNAMICS, **dynamics)
+
+
+def stats():
+    """ number of calls per (function, opmode) and the total blocking round trips since reset_stats() """
+    counts = dict(_stats)
+    counts['round_trips'] = sum(count for (_, opmode), count in _stats.items() if opmode == simx_opmode_blocking)
+    return counts
+
+
+def reset_stats():
+    _stats.clear()
+
+
+class _Object(object):
+    """ an object in the scene, poses are absolute (x, y, z) and (alpha, beta, gamma) """
+
+    def __init__(self, name, pos, orient, parent=None, object_type=sim_object_shape_type):
+        self.name = name
+        self.pos = list(pos)
+        self.orient = list(orient)
+        self.parent = parent
+        self.object_type = object_type
+        # target velocity of a joint and the speed it has reached
+        self.velocity = 0.0
+        self.speed = 0.0
+
+
+class _Robot(object):
+    """ handles of one loaded robot model """
+
+    def __init__(self, base, motor_left, motor_right, sensors):
+        self.base = base
+        self.motor_left = motor_left
+        self.motor_right = motor_right
+        self.sensors = sensors
+
+
+class _Scene(object):
+    """ the simulated scene of one client connection """
+
+    def __init__(self):
+        self.objects = {}
+        self.robots = {}
+        self.obstacles = list(_config['obstacles'])
+        self.sensor_model = sensor_model.SensorModel(self.obstacles, sensor_range=SENSOR_RANGE)
+        # readings of every sensor by handle and the robot poses they were cast from, see sensor_readings()
+        self._readings = {}
+        self._read_poses = None
+        self.streams = set()
+        self.paused = False
+        self.held = []
+        self._next_handle = 1
+        # copies of the robot and target are named like vrep names pasted copies: no suffix, then #0, #1, ...
+        for pair in range(_config['pairs']):
+            suffix = '' if pair == 0 else '#%d' % (pair - 1)
+            offset = pair * _config['pair_spacing']
+            x, y, z = _config['target_pos']
+            self._add('Sphere' + suffix, (x, y + offset, z), (0.0, 0.0, 0.0))
+            self._load_robot(suffix, offset)
+        self.last_time = time.time()
+
+    def _add(self, name, pos, orient, parent=None, object_type=sim_object_shape_type):
+        handle = self._next_handle
+        self._next_handle += 1
+        self.objects[handle] = _Object(name, pos, orient, parent, object_type)
+        return handle
+
+    def _load_robot(self, suffix='', offset=0.0):
+        x, y, yaw = _config['robot_pose']
+        y += offset
+        base = self._add(ROBOT_NAME + suffix, (x, y, 0.1388), (0.0, 0.0, yaw))
+        motors = [self._add(ROBOT_NAME + side + suffix, (x, y, 0.1), (0.0, 0.0, yaw), base, sim_object_joint_type)
+                  for side in ('_leftMotor', '_rightMotor')]
+        sensors = [self._add(ROBOT_NAME + '_ultrasonicSensor%d' % (i + 1) + suffix, (x, y, 0.1), (0.0, 0.0, yaw),
+                             base, sim_object_proximitysensor_type)
+                   for i in range(sensor_model.NUM_SENSORS)]
+        self.robots[base] = _Robot(base, motors[0], motors[1], sensors)
+        return base
+
+    def handle_of(self, name):
+        for handle, obj in self.objects.items():
+            if obj.name == name:
+                return handle
+        return None
+
+    def remove(self, handle):
+        for child in [h for h, obj in self.objects.items() if obj.parent == handle]:
+            del self.objects[child]
+        del self.objects[handle]
+        self.robots.pop(handle, None)
+
+    def advance(self):
+        """ move the robots for the simulated time since the last call """
+        now = time.time()
+        dt = (now - self.last_time) * _config['realtime_factor']
+        self.last_time = now
+        if dt <= 0:
+            return
+        for robot in self.robots.values():
+            base = self.objects[robot.base]
+            left = self.objects[robot.motor_left]
+            right = self.objects[robot.motor_right]
+            x, y, yaw, left.speed, right.speed = kinematics.drive_lagged(
+                base.pos[0], base.pos[1], base.orient[2], left.speed, right.speed, left.velocity, right.velocity, dt,
+                **_config['dynamics'])
+            base.pos[0], base.pos[1], base.orient[2] = float(x), float(y), float(yaw)
+            left.speed, right.speed = float(left.speed), float(right.speed)
+        for obj in self.objects.values():
+            if obj.parent in self.robots:
+                parent = self.objects[obj.parent]
+                obj.pos[0], obj.pos[1] = parent.pos[0], parent.pos[1]
+                obj.orient[2] = parent.orient[2]
+
+    def position(self, handle, relative_to):
+        obj = self.objects[handle]
+        if relative_to == -1:
+            return list(obj.pos)
+        ref = self.objects[relative_to]
+        dx = obj.pos[0] - ref.pos[0]
+        dy = obj.pos[1] - ref.pos[1]
+        yaw = ref.orient[2]
+        return [math.cos(yaw) * dx + math.sin(yaw) * dy,
+                -math.sin(yaw) * dx + math.cos(yaw) * dy,
+                obj.pos[2] - ref.pos[2]]
+
+    def orientation(self, handle, relative_to):
+        obj = self.objects[handle]
+        if relative_to == -1:
+            return list(obj.orient)
+        return [0.0, 0.0, _wrap(obj.orient[2] - self.objects[relative_to].orient[2])]
+
+    def set_position(self, handle, relative_to, position):
+        """ inverse of position(), a relative position is in the planar frame of the reference object """
+        obj = self.objects[handle]
+        if relative_to == -1:
+            obj.pos = [float(value) for value in position]
+            return
+        ref = self.objects[relative_to]
+        yaw = ref.orient[2]
+        x, y, z = position
+        obj.pos = [ref.pos[0] + math.cos(yaw) * x - math.sin(yaw) * y,
+                   ref.pos[1] + math.sin(yaw) * x + math.cos(yaw) * y,
+                   ref.pos[2] + z]
+
+    def set_orientation(self, handle, relative_to, euler_angles):
+        """ inverse of orientation(), a relative orientation turns the yaw from the reference object's """
+        obj = self.objects[handle]
+        alpha, beta, gamma = [float(value) for value in euler_angles]
+        if relative_to != -1:
+            gamma = _wrap(gamma + self.objects[relative_to].orient[2])
+        obj.orient = [alpha, beta, gamma]
+
+    def sensor_readings(self):
+        """ distance reading of every sensor by handle
+
+            All sensors of all robots are cast together and kept until a robot moves, so reading the sensors
+            one call at a time costs one cast per physics tick rather than one per sensor.
+        """
+        robots = list(self.robots.values())
+        poses = tuple((self.objects[robot.base].pos[0], self.objects[robot.base].pos[1],
+                       self.objects[robot.base].orient[2]) for robot in robots)
+        if poses != self._read_poses:
+            self._readings = {}
+            if robots:
+                dists = self.sensor_model.read(*np.array(poses).T)
+                for robot, robot_dists in zip(robots, dists):
+                    self._readings.update(zip(robot.sensors, robot_dists))
+            self._read_poses = poses
+        return self._readings
+
+    def read_sensor(self, handle):
+        """ (detection state, detected point in the sensor frame) of the closest obstacle in the sensor cone """
+        if self.objects[handle].object_type != sim_object_proximitysensor_type:
+            raise KeyError(handle)
+        dist = float(self.sensor_readings()[handle])
+        if dist == 0:
+            return False, [0.0, 0.0, 0.0]
+        return True, [0.0, 0.0, float(dist)]
+
+    def group_data(self, object_type, data_type):
+        """ (handles, ints, floats, strings) of simxGetObjectGroupData for the supported data types """
+        handles = sorted(handle for handle, obj in self.objects.items()
+                         if object_type == sim_appobj_object_type or obj.object_type == object_type)
+        ints, floats, strings = [], [], []
+        if data_type == 0:
+            strings = [self.objects[handle].name for handle in handles]
+        elif data_type == 9:
+            for handle in handles:
+                floats.extend(self.objects[handle].pos + self.objects[handle].orient)
+        elif data_type == 13:
+            readings = self.sensor_readings()
+            for handle in handles:
+                dist = float(readings[handle])
+                ints.extend([int(dist > 0), 0])
+                floats.extend([0.0, 0.0, dist, 0.0, 0.0, 0.0])
+        else:
+            raise ValueError('fake vrep does not support group data type %d' % data_type)
+        return handles, ints, floats, strings
+
+
+def _wrap(angle):
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+def _call(name, client_id, opmode, apply, value_key=None):
+    """ shared opmode handling
+
+        params: apply - callable doing the work on the scene and returning the value (None for setters)
+                value_key - identifies the value for streaming, None for setters
+
+        returns: (return code, value)
+    """
+    _stats[(name, opmode)] = _stats.get((name, opmode), 0) + 1
+    scene = _scenes.get(client_id)
+    if scene is None:
+        return simx_return_initialize_error_flag, None
+    if opmode == simx_opmode_blocking:
+        time.sleep(_config['latency'])
+        return _apply(scene, apply)
+    if value_key is None:
+        # non blocking setter, held back while communication is paused
+        if scene.paused:
+            scene.held.append(apply)
+            return simx_return_ok, None
+        return _apply(scene, apply)
+    if opmode == simx_opmode_streaming and value_key not in scene.streams:
+        scene.streams.add(value_key)
+        return simx_return_novalue_flag, None
+    if opmode in (simx_opmode_streaming, simx_opmode_buffer) and value_key in scene.streams:
+        return _apply(scene, apply)
+    return simx_return_novalue_flag, None
+
+
+def _apply(scene, apply, advance=True):
+    """ bring the scene up to date and run the call, unknown handles are a remote error like in vrep """
+    if advance:
+        scene.advance()
+    try:
+        return simx_return_ok, apply(scene)
+    except (KeyError, ValueError):
+        return simx_return_remote_error_flag, None
+
+
+def simxStart(connectionAddress, connectionPort, waitUntilConnected, doNotReconnectOnceDisconnected,
+              timeOutInMs, commThreadCycleInMs):
+    client_id = _next_client[0]
+    _next_client[0] += 1
+    _scenes[client_id] = _Scene()
+    return client_id
+
+
+def simxFinish(clientID):
+    if clientID == -1:
+        _scenes.clear()
+    else:
+        _scenes.pop(clientID, None)
+
+
+def simxPauseCommunication(clientID, enable):
+    scene = _scenes[clientID]
+    scene.paused = bool(enable)
+    if not scene.paused:
+        # the held commands arrive in one message and take effect in the same simulation step
+        scene.advance()
+        for apply in scene.held:
+            _apply(scene, apply, advance=False)
+        scene.held = []
+    return simx_return_ok
+
+
+def simxGetPingTime(clientID):
+    start = time.time()
+    time.sleep(_config['latency'])
+    return simx_return_ok, int((time.time() - start) * 1000)
+
+
+def simxGetObjectHandle(clientID, objectName, operationMode):
+    rc, handle = _call('simxGetObjectHandle', clientID, operationMode, lambda scene: scene.handle_of(objectName),
+                       ('handle', objectName))
+    if rc == simx_return_ok and handle is None:
+        return simx_return_remote_error_flag, 0
+    return rc, handle if handle is not None else 0
+
+
+def simxGetObjectPosition(clientID, objectHandle, relativeToObjectHandle, operationMode):
+    rc, pos = _call('simxGetObjectPosition', clientID, operationMode,
+                    lambda scene: scene.position(objectHandle, relativeToObjectHandle),
+                    ('position', objectHandle, relativeToObjectHandle))
+    return rc, pos if pos is not None else [0.0, 0.0, 0.0]
+
+
+def simxSetObjectPosition(clientID, objectHandle, relativeToObjectHandle, position, operationMode):
+    def apply(scene):
+        scene.set_position(objectHandle, relativeToObjectHandle, position)
+    return _call('simxSetObjectPosition', clientID, operationMode, apply)[0]
+
+
+def simxGetObjectOrientation(clientID, objectHandle, relativeToObjectHandle, operationMode):
+    rc, orient = _call('simxGetObjectOrientation', clientID, operationMode,
+                       lambda scene: scene.orientation(objectHandle, relativeToObjectHandle),
+                       ('orientation', objectHandle, relativeToObjectHandle))
+    return rc, orient if orient is not None else [0.0, 0.0, 0.0]
+
+
+def simxSetObjectOrientation(clientID, objectHandle, relativeToObjectHandle, eulerAngles, operationMode):
+    def apply(scene):
+        scene.set_orientation(objectHandle, relativeToObjectHandle, eulerAngles)
+    return _call('simxSetObjectOrientation', clientID, operationMode, apply)[0]
+
+
+def simxReadProximitySensor(clientID, sensorHandle, operationMode):
+    rc, reading = _call('simxReadProximitySensor', clientID, operationMode,
+                        lambda scene: scene.read_sensor(sensorHandle), ('sensor', sensorHandle))
+    detected, point = reading if reading is not None else (False, [0.0, 0.0, 0.0])
+    return rc, detected, point, 0, [0.0, 0.0, 1.0]
+
+
+def simxSetJointTargetVelocity(clientID, jointHandle, targetVelocity, operationMode):
+    def apply(scene):
+        scene.objects[jointHandle].velocity = targetVelocity
+    return _call('simxSetJointTargetVelocity', clientID, operationMode, apply)[0]
+
+
+def simxGetObjectGroupData(clientID, objectType, dataType, operationMode):
+    rc, data = _call('simxGetObjectGroupData', clientID, operationMode,
+                     lambda scene: scene.group_data(objectType, dataType), ('group', objectType, dataType))
+    if data is None:
+        return rc, [], [], [], []
+    return (rc,) + data
+
+
+def simxLoadModel(clientID, modelPathAndName, options, operationMode):
+    rc, handle = _call('simxLoadModel', clientID, operationMode, lambda scene: scene._load_robot(),
+                       ('model', modelPathAndName))
+    return rc, handle if handle is not None else 0
+
+
+def simxRemoveModel(clientID, objectHandle, operationMode):
+    return _call('simxRemoveModel', clientID, operationMode, lambda scene: scene.remove(objectHandle))[0]
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" module for measuring how closely the local kinematic backend follows V-REP, and calibrating it
+
+Scripts, an action sequence and a target path each, are run through VREP_Env with a TrajectoryRecorder.  The
+recorded episodes are replayed open loop through the kinematic model (kinematics.drive_lagged) for many
+parameter sets at once, which gives the per step divergence in robot pose and reward of every set.  fit()
+searches the wheel radius, axle length and motor time constant that minimise it, and the result is saved as a
+numbered calibration file that fake_vrep.configure(dynamics=...) takes.
+
+    ./fidelity.py record --record-path fidelity_runs --episodes 20
+    ./fidelity.py fit --record-path fidelity_runs --calibration-path calibrations
+    ./fidelity.py compare --record-path fidelity_runs --calibration-path calibrations
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+import kinematics
+import rewards
+import trajectory
+from state_batch import StateBatch, XDIST, YDIST, THETA, VLEFT, VRIGHT
+
+
+# format of the calibration files, bumped when their layout changes
+CALIBRATION_VERSION = 1
+PARAMS = ('wheel_radius', 'axle_length', 'time_constant')
+# search ranges of fit()
+DEFAULT_RANGES = {'wheel_radius': (0.07, 0.12), 'axle_length': (0.25, 0.42), 'time_constant': (0.0, 0.3)}
+
+
+def random_script(steps, action_bound, rng, hold=(3, 10), moves='RLFB'):
+    """ piecewise constant actions and a target path of straight runs
+
+        params: steps - number of actions
+                action_bound - [min, max] action
+                rng - np.random.RandomState
+                hold - smallest and largest number of steps an action or path direction is held for
+
+        returns: (actions (steps, 2), path) - path ends with 'exit' after steps moves
+    """
+    actions = np.zeros((steps, 2))
+    path = []
+    t = 0
+    while t < steps:
+        run = rng.randint(hold[0], hold[1] + 1)
+        actions[t:t + run] = rng.uniform(action_bound[0], action_bound[1], 2)
+        path += [moves[rng.randint(len(moves))]] * run
+        t += run
+    return actions, path[:steps] + ['exit']
+
+
+def record(env, mover, scripts):
+    """ run scripts through an environment created with a TrajectoryRecorder, one recorded episode each
+
+        The loop is the one ddpg.eval() runs, with the script's actions instead of the actor's.
+
+        params: scripts - list of (actions, path) from random_script()
+    """
+    for actions, path in scripts:
+        env.reset()
+        mover.path = path
+        mover.reset()
+        for a in actions:
+            mover_done = mover.step()
+            _, _, env_done = env.step(a, before_tick=mover.step)
+            if mover_done or env_done:
+                break
+    env.recorder.end_episode()
+
+
+def _target(episode):
+    """ absolute target position and orientation at every recorded state, from the robot pose and the state
+
+        returns: (x (T+1,), y (T+1,), yaw (T+1,))
+    """
+    pose = episode['robot_pose'].astype(float)
+    states = episode['states'].astype(float)
+    cos, sin = np.cos(pose[:, 5]), np.sin(pose[:, 5])
+    x = pose[:, 0] + cos * states[:, XDIST] - sin * states[:, YDIST]
+    y = pose[:, 1] + sin * states[:, XDIST] + cos * states[:, YDIST]
+    return x, y, pose[:, 5] - states[:, THETA]
+
+
+def _candidates(params):
+    """ parameter dict as (P,) arrays, scalars become one candidate """
+    params = dict(kinematics.DYNAMICS, **params)
+    values = np.broadcast_arrays(*[np.atleast_1d(np.asarray(params[name], dtype=float)) for name in PARAMS])
+    return dict(zip(PARAMS, values))
+
+
+def simulate(episode, params, substeps=4):
+    """ replay a recorded episode's actions open loop through the kinematic model, for P parameter sets at once
+
+        The robot starts from the recorded pose at rest and every step lasts as long as it did when recorded.
+
+        params: episode - from trajectory.load_episode()
+                params - dict of PARAMS to scalars or (P,) arrays, missing ones are kinematics.DYNAMICS
+
+        returns: (P, T+1, 3) array of x, y, yaw at every recorded state
+    """
+    candidates = _candidates(params)
+    n = len(candidates['wheel_radius'])
+    start = episode['robot_pose'][0].astype(float)
+    x, y, yaw = np.full(n, start[0]), np.full(n, start[1]), np.full(n, start[5])
+    wleft, wright = np.zeros(n), np.zeros(n)
+    dts = np.diff(episode['time'])
+    poses = np.zeros((n, len(dts) + 1, 3))
+    poses[:, 0] = np.stack((x, y, yaw), axis=-1)
+    for t, (action, dt) in enumerate(zip(episode['actions'].astype(float), dts)):
+        x, y, yaw, wleft, wright = kinematics.drive_lagged(x, y, yaw, wleft, wright, action[0], action[1], dt,
+                                                           substeps=substeps, **candidates)
+        poses[:, t + 1] = np.stack((x, y, yaw), axis=-1)
+    return poses
+
+
+def simulated_rewards(episode, poses, rewarder):
+    """ rewards the simulated poses would have got, against the recorded target
+
+        returns: (P, T) array
+    """
+    target_x, target_y, target_yaw = _target(episode)
+    dx = target_x - poses[..., 0]
+    dy = target_y - poses[..., 1]
+    cos, sin = np.cos(poses[..., 2]), np.sin(poses[..., 2])
+    states = episode['states'].astype(float)
+    shape = poses.shape[:2]
+    batch = StateBatch.from_arrays((cos * dx + sin * dy).ravel(), (-sin * dx + cos * dy).ravel(),
+                                   kinematics.wrap(poses[..., 2] - target_yaw).ravel(),
+                                   np.broadcast_to(states[:, VLEFT], shape).ravel(),
+                                   np.broadcast_to(states[:, VRIGHT], shape).ravel())
+    data = batch.data.reshape(shape + (-1,))
+    orig = StateBatch(data[:, :-1].reshape(-1, data.shape[-1]))
+    new = StateBatch(data[:, 1:].reshape(-1, data.shape[-1]))
+    return rewarder.calculate_rewards(orig, new).reshape(shape[0], -1)
+
+
+def divergence(episode, poses, rewarder=None):
+    """ per step difference between the recording and simulated poses
+
+        params: poses - (P, T+1, 3) from simulate()
+                rewarder - rewards.RewardCalculator to also compare rewards with, both recalculated with it
+
+        returns: dict of 'position' (P, T+1) meters, 'yaw' (P, T+1) radians and, with a rewarder, 'reward' (P, T)
+    """
+    recorded = episode['robot_pose'].astype(float)
+    result = {'position': np.hypot(poses[..., 0] - recorded[:, 0], poses[..., 1] - recorded[:, 1]),
+              'yaw': np.abs(kinematics.wrap(poses[..., 2] - recorded[:, 5]))}
+    if rewarder is not None:
+        result['reward'] = np.abs(simulated_rewards(episode, poses, rewarder) -
+                                  trajectory.rewards_for(episode, rewarder))
+    return result
+
+
+def loss(episodes, params, yaw_weight=0.5, substeps=4):
+    """ mean position plus weighted yaw divergence over all steps of the episodes
+
+        returns: (P,) array, one loss per parameter set
+    """
+    total = 0.0
+    count = 0
+    for episode in episodes:
+        diverged = divergence(episode, simulate(episode, params, substeps))
+        total = total + (diverged['position'] + yaw_weight * diverged['yaw']).sum(axis=1)
+        count += diverged['position'].shape[1]
+    return total / count
+
+
+def fit(episodes, ranges=None, points=5, rounds=4, yaw_weight=0.5, substeps=4):
+    """ search the parameters that minimise loss() with successively finer grids
+
+        Every round evaluates a points^3 grid over the current ranges in one batch and narrows each range to
+        one grid spacing either side of the best point.
+
+        params: episodes - recorded episodes from trajectory.load_episode()
+                ranges - dict of PARAMS to (low, high), defaults to DEFAULT_RANGES
+
+        returns: (params dict, loss of those params)
+    """
+    ranges = dict(DEFAULT_RANGES, **(ranges or {}))
+    for _ in range(rounds):
+        axes = [np.linspace(ranges[name][0], ranges[name][1], points) for name in PARAMS]
+        grid = dict(zip(PARAMS, [values.ravel() for values in np.meshgrid(*axes, indexing='ij')]))
+        losses = loss(episodes, grid, yaw_weight, substeps)
+        best = np.argmin(losses)
+        for name, values in zip(PARAMS, axes):
+            spacing = values[1] - values[0]
+            ranges[name] = (max(grid[name][best] - spacing, 0.0), grid[name][best] + spacing)
+    return dict((name, float(grid[name][best])) for name in PARAMS), float(losses[best])
+
+
+def report(episodes, params, rewarder=None, substeps=4):
+    """ mean and final step divergence of one parameter set over the episodes """
+    position, yaw, final, reward = [], [], [], []
+    for episode in episodes:
+        diverged = divergence(episode, simulate(episode, params, substeps), rewarder)
+        position.append(diverged['position'][0])
+        yaw.append(diverged['yaw'][0])
+        final.append(diverged['position'][0, -1])
+        if rewarder is not None:
+            reward.append(diverged['reward'][0])
+    summary = {'position_mean': float(np.concatenate(position).mean()),
+               'position_max': float(np.concatenate(position).max()),
+               'position_final_mean': float(np.mean(final)),
+               'yaw_mean': float(np.concatenate(yaw).mean())}
+    if rewarder is not None:
+        summary['reward_mean'] = float(np.concatenate(reward).mean())
+    return summary
+
+
+def save_calibration(directory, params, details=None):
+    """ write params as the next numbered calibration file in directory
+
+        returns: location of the written calibration_NNN.json
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # after the highest existing revision, counting the files would overwrite the newest once one is deleted
+    revisions = [int(os.path.basename(location)[len('calibration_'):-len('.json')])
+                 for location in glob.glob(os.path.join(directory, 'calibration_[0-9]*.json'))]
+    revision = max(revisions) + 1 if revisions else 0
+    calibration = {'version': CALIBRATION_VERSION, 'revision': revision, 'created': time.time(),
+                   'params': dict((name, float(params[name])) for name in PARAMS)}
+    calibration.update(details or {})
+    location = os.path.join(directory, 'calibration_%03d.json' % revision)
+    with open(location, 'w') as file_handle:
+        json.dump(calibration, file_handle, indent=2, sort_keys=True)
+    return location
+
+
+def load_calibration(location):
+    """ params of a calibration file, or of the newest one in a directory
+
+        returns: dict of PARAMS for fake_vrep.configure(dynamics=...)
+    """
+    if os.path.isdir(location):
+        files = sorted(glob.glob(os.path.join(location, 'calibration_*.json')))
+        if not files:
+            raise Exception('No calibrations in ' + location)
+        location = files[-1]
+    with open(location) as file_handle:
+        calibration = json.load(file_handle)
+    if calibration.get('version') != CALIBRATION_VERSION:
+        raise Exception('%s is calibration version %s, expected %d' %
+                        (location, calibration.get('version'), CALIBRATION_VERSION))
+    return calibration['params']
+
+
+def load_episodes(directory):
+    episodes = [trajectory.load_episode(location) for location in trajectory.episode_files(directory)]
+    if not episodes:
+        raise Exception('No recorded episodes in ' + directory)
+    return episodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the kinematic backend against v-rep and calibrate it.')
+    parser.add_argument('command', choices=['record', 'fit', 'compare'],
+                        help='record scripted episodes, fit a calibration to them or compare a calibration')
+    parser.add_argument('--record-path', dest='record_path', required=True,
+                        help='folder of recorded episodes')
+    parser.add_argument('--calibration-path', dest='calibration_path', required=False, default='calibrations',
+                        help='folder calibrations are written to, compare uses the newest or a given file')
+    parser.add_argument('--episodes', type=int, default=20, help='scripts to record')
+    parser.add_argument('--steps', type=int, default=100, help='actions per script')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the scripts')
+    parser.add_argument('--fake', action='store_true',
+                        help='record against fake_vrep, with the dynamics of --calibration-path if it has any')
+    parser.add_argument('--goal-distance', dest='goal_distance', type=float, default=1.0,
+                        help='goal distance of the rewards and of the recording environment')
+    args = parser.parse_args()
+
+    rewarder = rewards.graduated(args.goal_distance)
+    if args.command == 'record':
+        if args.fake:
+            import fake_vrep
+            fake_vrep.install()
+            if glob.glob(os.path.join(args.calibration_path, 'calibration_*.json')):
+                fake_vrep.configure(dynamics=load_calibration(args.calibration_path))
+        # import after a possible install so they pick up the fake module
+        from vrep_env import VREP_Env
+        from target_mover import TargetMover
+        recorder = trajectory.TrajectoryRecorder(args.record_path, VREP_Env.action_bound)
+        env = VREP_Env(rewarder, goal_distance=args.goal_distance, recorder=recorder)
+        mover = TargetMover(env.client_id, target_handle=env.target_handle, path=['exit'], recorder=recorder)
+        rng = np.random.RandomState(args.seed)
+        try:
+            record(env, mover, [random_script(args.steps, VREP_Env.action_bound, rng)
+                                for _ in range(args.episodes)])
+        finally:
+            env.stop()
+        return
+
+    episodes = load_episodes(args.record_path)
+    if args.command == 'fit':
+        params, fitted_loss = fit(episodes)
+        before = report(episodes, kinematics.DYNAMICS, rewarder)
+        after = report(episodes, params, rewarder)
+        location = save_calibration(args.calibration_path, params,
+                                    {'loss': fitted_loss, 'episodes': len(episodes),
+                                     'record_path': args.record_path,
+                                     'divergence': {'default': before, 'calibrated': after}})
+        print("Fitted %s, written to %s" % (json.dumps(params, sort_keys=True), location))
+        for name, summary in [('default', before), ('calibrated', after)]:
+            print("%-10s %s" % (name, json.dumps(summary, sort_keys=True)))
+    else:
+        params = load_calibration(args.calibration_path)
+        print("%s over %d episodes" % (json.dumps(params, sort_keys=True), len(episodes)))
+        print(json.dumps(report(episodes, params, rewarder), sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+""" Module for holding the in-graph replay memory """
+import numpy as np
+import tensorflow as tf
+
+
+class GraphMemory(object):
+    """ class for storing transition tuples in tensorflow variables so minibatches are sampled in-graph
+
+        Rows use the same [s, a, r, s_] layout as memory.Memory.  Transitions are staged on the python
+        side and appended append_size at a time with a single scatter, the buffer itself lives in
+        LOCAL_VARIABLES so it is not written into model checkpoints.
+    """
+
+    def __init__(self, sess, capacity, dims, append_size=32, scope='Replay'):
+        """ init memory
+
+            params: sess        - session the buffer variables live in
+                    capacity    - size of memory
+                    dims        - dimensions of memory to store
+                    append_size - number of transitions staged before they are appended to the graph
+        """
+        self.sess = sess
+        self.capacity = capacity
+        self.dims = dims
+        self.append_size = append_size
+        self.pointer = 0
+        self._staging = np.zeros((append_size, dims), dtype=np.float32)
+        self._staged = 0
+
+        with tf.variable_scope(scope):
+            self.data = tf.get_variable('data', [capacity, dims], dtype=tf.float32,
+                                        initializer=tf.zeros_initializer(), trainable=False,
+                                        collections=[tf.GraphKeys.LOCAL_VARIABLES])
+            # number of valid rows, sampling is restricted to these
+            self.size = tf.get_variable('size', [], dtype=tf.int32,
+                                        initializer=tf.zeros_initializer(), trainable=False,
+                                        collections=[tf.GraphKeys.LOCAL_VARIABLES])
+            self._rows = tf.placeholder(tf.float32, [None, dims], name='rows')
+            self._indices = tf.placeholder(tf.int32, [None], name='indices')
+            self._new_size = tf.placeholder(tf.int32, [], name='new_size')
+            self.append_op = tf.group(tf.scatter_update(self.data, self._indices, self._rows),
+                                      tf.assign(self.size, self._new_size))
+
+    def sample_tensor(self, n):
+        """ tensor that draws n rows uniformly from the filled part of the buffer each time it is run
+
+            params: n - number of samples
+
+            return: tensor of shape (n, dims)
+        """
+        indices = tf.random_uniform([n], 0, tf.maximum(self.size, 1), dtype=tf.int32)
+        return tf.gather(self.data, indices)
+
+    def store_transition(self, s, a, r, s_):
+        """ stage the transition, the staged rows are appended to the graph once append_size are waiting
+
+            params: s  - original state
+                    a  - action
+                    r  - reward for action
+                    s_ - next state
+        """
+        self._staging[self._staged, :] = np.hstack((s, a, [r], s_))
+        self._staged += 1
+        self.pointer += 1
+        if self._staged == self.append_size:
+            self.flush()
+
+    def end_episode(self):
+        """ mark the end of an episode, nothing is pending for single step transitions """
+        return
+
+    def flush(self):
+        """ append any staged transitions to the graph buffer """
+        if self._staged == 0:
+            return
+        first = self.pointer - self._staged
+        indices = np.arange(first, self.pointer) % self.capacity
+        self.sess.run(self.append_op, feed_dict={self._rows: self._staging[:self._staged],
+                                                 self._indices: indices,
+                                                 self._new_size: min(self.pointer, self.capacity)})
+        self._staged = 0
+
+    def save(self, location):
+        """ save the memory to the provided location, in the same format as memory.Memory
+
+            params: location - to store memory
+        """
+        self.flush()
+        with open(location, "wb") as file_handle:
+            np.save(file_handle, self.sess.run(self.data)[:min(self.pointer, self.capacity)])
+
+    def load(self, location):
+        """ load a saved memory.Memory or GraphMemory file, keeps the newest capacity rows
+
+            params: location - to load memory from
+        """
+        self.load_all([location])
+
+    def load_all(self, locations):
+        """ load and concatenate several saved memories, keeps the newest capacity rows
+
+            params: locations - list of locations to load memory from
+        """
+        rows = []
+        for location in locations:
+            with open(location, "rb") as file_handle:
+                rows.append(np.load(file_handle))
+        rows = np.concatenate(rows)[-self.capacity:]
+        data = np.zeros((self.capacity, self.dims), dtype=np.float32)
+        data[:len(rows)] = rows
+        self.data.load(data, self.sess)
+        self.size.load(len(rows), self.sess)
+        self.pointer = len(rows)
+        self._staged = 0
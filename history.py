@@ -0,0 +1,111 @@
+""" module for stacking the last k observations of an environment
+
+A stacked state is [ frame t-k+1, ..., frame t ], oldest first.  At the start of an episode the missing older
+frames repeat the first frame, the same as CompactMemory(history=k) stacks states out of its ring.
+"""
+import numpy as np
+from state_batch import as_array
+
+
+class HistoryWindow(object):
+    """ rolling window of the last k frames, handed out as views instead of copies
+
+        Frames are appended to a linear buffer and the window is the k frames ending at the newest one.  When
+        the buffer is full the last k - 1 frames are moved to its front, once every spare frames, so a returned
+        window stays valid for spare - 1 more pushes, plenty for the state a caller holds across a step.
+    """
+
+    def __init__(self, k, frame_dim, spare=64):
+        """ params: k - frames per window
+                    frame_dim - values per frame
+                    spare - frames appended between two moves to the front
+        """
+        self.k = k
+        self.frame_dim = frame_dim
+        self._buffer = np.zeros((k - 1 + spare, frame_dim))
+        self._end = k - 1
+
+    def reset(self, frame):
+        """ start a new episode, the window is the first frame repeated
+
+            returns: flat (k * frame_dim,) view of the window
+        """
+        self._buffer[:self.k] = as_array(frame)
+        self._end = self.k
+        return self.window()
+
+    def push(self, frame):
+        """ append the newest frame
+
+            returns: flat (k * frame_dim,) view of the window
+        """
+        if self._end == len(self._buffer):
+            self._buffer[:self.k - 1] = self._buffer[self._end - self.k + 1:self._end]
+            self._end = self.k - 1
+        self._buffer[self._end] = as_array(frame)
+        self._end += 1
+        return self.window()
+
+    def window(self):
+        return self._buffer[self._end - self.k:self._end].reshape(-1)
+
+
+class HistoryEnv(object):
+    """ wraps an environment so its states are the last k frames, everything else is passed through """
+
+    def __init__(self, env, k):
+        self.env = env
+        self.k = k
+        self.state_dim = env.state_dim * k
+        self.window = HistoryWindow(k, env.state_dim)
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+    def reset(self):
+        return self.window.reset(self.env.reset())
+
+    def restore(self, snapshot, mover=None):
+        """ a restored situation starts a new history """
+        return self.window.reset(self.env.restore(snapshot, mover))
+
+    def step(self, actions, before_tick=None):
+        s_, r, done = self.env.step(actions, before_tick)
+        return self.window.push(s_), r, done
+
+    def step_wait(self, before_tick=None):
+        s_, r, done = self.env.step_wait(before_tick)
+        return self.window.push(s_), r, done
+
+    def fork(self, k, snapshot=None, mover=None, sensor_model=None):
+        """ copies of the wrapped environment, their states stacked the same way, see HistoryFork """
+        return HistoryFork(self.env.fork(k, snapshot, mover, sensor_model), self.k)
+
+
+class HistoryFork(object):
+    """ wraps a ForkedEnv so the states of each of its copies are that copy's last k frames
+
+        A fork starts a new history, like a restored environment, and all copies share one window of frames
+        holding every copy's frame side by side.
+    """
+
+    def __init__(self, forked, k):
+        self.forked = forked
+        self.k = k
+        self.state_dim = forked.state_dim * k
+        self.window = HistoryWindow(k, forked.k * forked.state_dim)
+
+    def __getattr__(self, name):
+        return getattr(self.forked, name)
+
+    def reset(self):
+        return self._stacked(self.window.reset(self.forked.reset().reshape(-1)))
+
+    def step(self, actions):
+        states, r, dones = self.forked.step(actions)
+        return self._stacked(self.window.push(states.reshape(-1))), r, dones
+
+    def _stacked(self, window):
+        """ (copies, k * frame_dim) states, oldest frame first in every row """
+        frames = window.reshape(self.k, self.forked.k, self.forked.state_dim)
+        return frames.transpose(1, 0, 2).reshape(self.forked.k, self.state_dim)
@@ -0,0 +1,65 @@
+""" module for the differential drive model of the Pioneer p3dx, used by fake_vrep and by forked rollouts """
+import numpy as np
+
+
+# pioneer p3dx geometry, meters
+WHEEL_RADIUS = 0.0975
+AXLE_LENGTH = 0.331
+
+
+def wrap(angle):
+    """ wrap angles to [-pi, pi] """
+    return np.arctan2(np.sin(angle), np.cos(angle))
+
+
+def drive(x, y, yaw, wleft, wright, dt, wheel_radius=WHEEL_RADIUS, axle_length=AXLE_LENGTH):
+    """ pose after driving dt seconds with constant wheel speeds, follows the exact arc
+
+        params: x, y, yaw - pose, scalars or arrays
+                wleft, wright - wheel angular velocities in rad/s (the motor target velocities)
+                dt - seconds driven
+
+        returns: (x, y, yaw) - new pose, same shapes as the inputs
+    """
+    v = wheel_radius * (np.asarray(wleft) + wright) / 2.0
+    omega = wheel_radius * (np.asarray(wright) - wleft) / axle_length
+    turning = np.abs(omega) >= 1e-9
+    # straight line where not turning, the division is guarded so both branches can be evaluated
+    safe_omega = np.where(turning, omega, 1.0)
+    new_yaw = yaw + omega * dt
+    x = x + np.where(turning, v / safe_omega * (np.sin(new_yaw) - np.sin(yaw)), v * dt * np.cos(yaw))
+    y = y + np.where(turning, -v / safe_omega * (np.cos(new_yaw) - np.cos(yaw)), v * dt * np.sin(yaw))
+    return x, y, wrap(new_yaw)
+
+
+# parameters of the model, the calibrated values from fidelity.py replace these
+DYNAMICS = {'wheel_radius': WHEEL_RADIUS, 'axle_length': AXLE_LENGTH, 'time_constant': 0.0}
+
+
+def motor_response(speed, command, dt, time_constant):
+    """ first order lag of the wheel speed towards the commanded speed
+
+        params: time_constant - seconds for 63% of a change in command to take effect, 0 follows it instantly
+
+        returns: (speed after dt, mean speed over dt)
+    """
+    time_constant = np.maximum(time_constant, 1e-9)
+    lag = np.exp(-dt / time_constant)
+    offset = np.asarray(speed) - command
+    return command + offset * lag, command + offset * time_constant / dt * (1 - lag)
+
+
+def drive_lagged(x, y, yaw, wleft, wright, command_left, command_right, dt, wheel_radius=WHEEL_RADIUS,
+                 axle_length=AXLE_LENGTH, time_constant=0.0, substeps=4):
+    """ pose and wheel speeds after dt seconds of the wheels accelerating towards the commanded speeds
+
+        Each substep drives with the wheels' mean speeds over it, with a time_constant of 0 this is drive().
+
+        returns: (x, y, yaw, wleft, wright)
+    """
+    h = dt / float(substeps)
+    for _ in range(substeps):
+        wleft, mean_left = motor_response(wleft, command_left, h, time_constant)
+        wright, mean_right = motor_response(wright, command_right, h, time_constant)
+        x, y, yaw = drive(x, y, yaw, mean_left, mean_right, h, wheel_radius, axle_length)
+    return x, y, yaw, wleft, wright
@@ -0,0 +1,160 @@
+""" module for analysing a trained policy and its critic over a grid of states
+
+The grid spans (xdist, ydist, theta), the relative orientation is derived from xdist and ydist the same way the
+environment does, so every grid point is a state the networks could see.  A result holds the grid axes, the
+actions (xdist, ydist, theta, action_dim) and the Q values (xdist, ydist, theta) of one checkpoint and is
+cached as an npz file next to its CSV and images.
+"""
+import csv
+import glob
+import os
+import numpy as np
+from state_batch import StateBatch
+
+
+def grid_axes(extent=2.0, shape=(41, 41, 9)):
+    """ evenly spaced axes of the analysis grid
+
+        params: extent - largest absolute xdist and ydist in meters
+                shape - number of xdist, ydist and theta values
+
+        returns: dict of axis name to values
+    """
+    return {'xdist': np.linspace(-extent, extent, shape[0]),
+            'ydist': np.linspace(-extent, extent, shape[1]),
+            'theta': np.linspace(-np.pi, np.pi, shape[2], endpoint=False)}
+
+
+def grid_states(axes):
+    """ network input for every grid point, xdist varies slowest and theta fastest
+
+        returns: (points, state_dim) array
+    """
+    xdist, ydist, theta = np.meshgrid(axes['xdist'], axes['ydist'], axes['theta'], indexing='ij')
+    return StateBatch.from_arrays(xdist.ravel(), ydist.ravel(), theta.ravel()).to_array()
+
+
+def evaluate(run, states, batch_size=4096):
+    """ actions and Q values for many states, batch_size at a time
+
+        params: run - callable mapping a (batch, state_dim) array to (actions, q)
+                states - (n, state_dim) array
+
+        returns: (actions (n, action_dim), q (n,))
+    """
+    actions = []
+    q = []
+    for start in range(0, len(states), batch_size):
+        batch_actions, batch_q = run(states[start:start + batch_size])
+        actions.append(batch_actions)
+        q.append(np.reshape(batch_q, -1))
+    return np.concatenate(actions), np.concatenate(q)
+
+
+def checkpoint_version(checkpoint):
+    """ modification time of a checkpoint's files, it changes when training writes the same name again """
+    files = glob.glob(checkpoint + '.*') or [checkpoint]
+    return '%.6f' % max(os.path.getmtime(name) for name in files)
+
+
+def analyse(run, axes, cache_path=None, checkpoint='', version='', batch_size=4096):
+    """ evaluate the grid, or load it from the cache if it was analysed for the same checkpoint and axes
+
+        params: run - callable mapping a (batch, state_dim) array to (actions, q)
+                axes - from grid_axes()
+                cache_path - npz file to load from and save to, None to not cache
+                checkpoint - name of the analysed checkpoint, stored with the result
+                version - identifies the checkpoint's weights, e.g. checkpoint_version(), a cached result
+                          for another version of the same name is recomputed
+
+        returns: dict with the axes, 'actions', 'q', 'checkpoint' and 'version'
+    """
+    if cache_path is not None and os.path.exists(cache_path):
+        cached = load(cache_path)
+        if (str(cached['checkpoint']) == checkpoint and str(cached.get('version', '')) == version
+                and all(np.array_equal(cached[name], values) for name, values in axes.items())):
+            return cached
+    shape = tuple(len(axes[name]) for name in ('xdist', 'ydist', 'theta'))
+    actions, q = evaluate(run, grid_states(axes), batch_size)
+    result = dict(axes)
+    result['actions'] = actions.reshape(shape + (-1,))
+    result['q'] = q.reshape(shape)
+    result['checkpoint'] = checkpoint
+    result['version'] = version
+    if cache_path is not None:
+        np.savez_compressed(cache_path, **result)
+    return result
+
+
+def load(location):
+    """ load a cached result """
+    with np.load(location) as result:
+        return dict(result)
+
+
+def summary(result, previous=None):
+    """ one line overview of a result, with how far the policy moved since the previous result if given """
+    actions = result['actions']
+    line = {'checkpoint': str(result['checkpoint']),
+            'q_mean': result['q'].mean(), 'q_min': result['q'].min(), 'q_max': result['q'].max(),
+            'vleft_mean': actions[..., 0].mean(), 'vright_mean': actions[..., 1].mean()}
+    if previous is not None:
+        line['action_change'] = np.abs(actions - previous['actions']).mean()
+        line['q_change'] = np.abs(result['q'] - previous['q']).mean()
+    return line
+
+
+def write_csv(result, location):
+    """ one row per grid point: xdist, ydist, theta, the actions and q """
+    actions = result['actions']
+    with open(location, 'w') as file_handle:
+        writer = csv.writer(file_handle)
+        writer.writerow(['xdist', 'ydist', 'theta'] + ['a%d' % i for i in range(actions.shape[-1])] + ['q'])
+        for i, xdist in enumerate(result['xdist']):
+            for j, ydist in enumerate(result['ydist']):
+                for k, theta in enumerate(result['theta']):
+                    writer.writerow(['%g' % xdist, '%g' % ydist, '%g' % theta] +
+                                    ['%g' % a for a in actions[i, j, k]] + ['%g' % result['q'][i, j, k]])
+
+
+def write_summary_csv(lines, location):
+    """ the summary() lines of several checkpoints as one table """
+    columns = ['checkpoint', 'q_mean', 'q_min', 'q_max', 'vleft_mean', 'vright_mean', 'action_change', 'q_change']
+    with open(location, 'w') as file_handle:
+        writer = csv.DictWriter(file_handle, columns)
+        writer.writeheader()
+        for line in lines:
+            writer.writerow(line)
+
+
+def write_images(result, prefix):
+    """ heatmaps of q and both actions over xdist and ydist, one image per theta value
+
+        Needs matplotlib, without it no images are written.
+
+        returns: list of written image locations
+    """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, skipping landscape images")
+        return []
+    extent = [result['ydist'][0], result['ydist'][-1], result['xdist'][0], result['xdist'][-1]]
+    panels = [('q', result['q'])] + [('a%d' % i, result['actions'][..., i])
+                                     for i in range(result['actions'].shape[-1])]
+    locations = []
+    for k, theta in enumerate(result['theta']):
+        fig, axes = plt.subplots(1, len(panels), figsize=(5 * len(panels), 4))
+        for ax, (name, values) in zip(axes, panels):
+            image = ax.imshow(values[:, :, k], origin='lower', extent=extent, aspect='auto')
+            ax.set_title('%s, theta %.2f' % (name, theta))
+            ax.set_xlabel('ydist')
+            ax.set_ylabel('xdist')
+            fig.colorbar(image, ax=ax)
+        location = '%s_theta%02d.png' % (prefix, k)
+        fig.savefig(location)
+        plt.close(fig)
+        locations.append(location)
+    return locations
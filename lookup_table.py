@@ -0,0 +1,251 @@
+""" module for compiling a trained actor into an interpolated lookup table controller
+
+The actor sees [ xdist, ydist, orientation, relative orientation ], the relative orientation follows from xdist and
+ydist, so the table only spans (xdist, ydist, theta) and every one of its points is a state the actor could see.
+Actions are stored at the points of a rectilinear grid and interpolated multilinearly between them.
+
+The grid starts out uniform and compile_actor() halves the intervals the table gets wrong on a validation sample,
+so it is fine where the policy changes quickly and coarse where it does not.  All breakpoints stay on a uniform
+lattice of the finest spacing, a per axis array maps every lattice cell to the interval holding it, which finds
+the interval of a value in constant time.
+"""
+import math
+import numpy as np
+from state_batch import StateBatch, as_array
+
+
+# format of saved tables, bumped when their layout changes
+TABLE_VERSION = 1
+AXES = ('xdist', 'ydist', 'theta')
+
+
+def bounds(extent):
+    """ (low, high) of every axis for tables covering xdist and ydist up to extent meters """
+    return [(-extent, extent), (-extent, extent), (-math.pi, math.pi)]
+
+
+def sample_points(axis_bounds, n, rng):
+    """ n uniformly random (xdist, ydist, theta) points within the bounds """
+    return np.stack([rng.uniform(low, high, n) for low, high in axis_bounds], axis=-1)
+
+
+def network_input(points):
+    """ actor input for (n, 3) points, with the relative orientation the environment would compute """
+    return StateBatch.from_arrays(points[:, 0], points[:, 1], points[:, 2]).to_array()
+
+
+def evaluate(policy, points, batch_size=4096):
+    """ actions of the policy at every point, batch_size at a time
+
+        params: policy - callable mapping a (batch, state_dim) array to (batch, action_dim) actions,
+                         e.g. Actor.choose_actions or evaluation.NumpyActor.choose_actions
+
+        returns: (n, action_dim) array
+    """
+    return np.concatenate([policy(network_input(points[start:start + batch_size]))
+                           for start in range(0, len(points), batch_size)])
+
+
+class LookupTable(object):
+    """ actions on a rectilinear (xdist, ydist, theta) grid whose breakpoints lie on a uniform lattice """
+
+    def __init__(self, axes, actions, cells, action_bound, dtype='float32', max_error=None):
+        """ params: axes - breakpoints of every axis, the first and last are the axis bounds
+                    actions - (len(axes[0]), len(axes[1]), len(axes[2]), action_dim) actions at the grid points
+                    cells - number of lattice cells per axis, every breakpoint is on the lattice
+                    action_bound - largest absolute action, int16 tables are scaled to it
+                    dtype - 'float32' or 'int16' storage of the actions
+                    max_error - largest absolute action error measured when compiling
+        """
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.cells = [int(n) for n in cells]
+        self.action_bound = float(action_bound)
+        self.dtype = dtype
+        self.max_error = max_error
+        if dtype == 'int16':
+            self.scale = self.action_bound / np.iinfo(np.int16).max
+            self.actions = np.round(np.clip(actions / self.scale, -32767, 32767)).astype(np.int16)
+        else:
+            self.scale = 1.0
+            self.actions = np.asarray(actions, dtype=np.float32)
+        # interval of every lattice cell, the cell starting at a breakpoint belongs to the interval it starts
+        self.intervals = []
+        for axis, n in zip(self.axes, self.cells):
+            starts = axis[0] + (axis[-1] - axis[0]) * np.arange(n) / n
+            self.intervals.append(np.clip(np.searchsorted(axis, starts + 1e-12, 'right') - 1, 0, len(axis) - 2))
+
+    @property
+    def shape(self):
+        return self.actions.shape
+
+    @property
+    def nbytes(self):
+        return self.actions.nbytes + sum(axis.nbytes for axis in self.axes)
+
+    def locate(self, axis, values):
+        """ interval index and fraction within it of values along an axis, clamped to the axis bounds """
+        points = self.axes[axis]
+        values = np.clip(values, points[0], points[-1])
+        cell = ((values - points[0]) * (self.cells[axis] / (points[-1] - points[0]))).astype(int)
+        index = self.intervals[axis][np.minimum(cell, self.cells[axis] - 1)]
+        return index, (values - points[index]) / (points[index + 1] - points[index])
+
+    def lookup(self, points):
+        """ interpolated actions at many (xdist, ydist, theta) points
+
+            returns: (n, action_dim) array
+        """
+        located = [self.locate(axis, points[:, axis]) for axis in range(3)]
+        actions = np.zeros((len(points), self.actions.shape[-1]))
+        for corner in range(8):
+            index = []
+            weight = np.ones(len(points))
+            for axis, (lower, fraction) in enumerate(located):
+                upper = (corner >> axis) & 1
+                index.append(lower + upper)
+                weight *= fraction if upper else 1 - fraction
+            actions += weight[:, np.newaxis] * self.actions[tuple(index)]
+        return actions * self.scale
+
+    def choose_actions(self, states):
+        """ actions for a batch of network inputs or a StateBatch, the relative orientation is not used """
+        states = as_array(states)
+        return self.lookup(states[:, :3])
+
+    def save(self, location):
+        """ save the table to an npz file """
+        with open(location, "wb") as file_handle:
+            np.savez(file_handle, version=TABLE_VERSION, xdist=self.axes[0], ydist=self.axes[1], theta=self.axes[2],
+                     actions=self.actions, cells=self.cells, action_bound=self.action_bound, dtype=self.dtype,
+                     max_error=np.nan if self.max_error is None else self.max_error)
+
+
+def load(location):
+    """ load a table written by LookupTable.save """
+    with np.load(location) as saved:
+        if int(saved['version']) != TABLE_VERSION:
+            raise Exception('%s is lookup table version %d, expected %d' %
+                            (location, int(saved['version']), TABLE_VERSION))
+        dtype = str(saved['dtype'])
+        actions = saved['actions']
+        if dtype == 'int16':
+            actions = actions * (float(saved['action_bound']) / np.iinfo(np.int16).max)
+        max_error = float(saved['max_error'])
+        return LookupTable([saved[name] for name in AXES], actions, saved['cells'], float(saved['action_bound']),
+                           dtype, None if np.isnan(max_error) else max_error)
+
+
+def _build(policy, axes, cells, action_bound, dtype, batch_size):
+    grid = np.stack([values.ravel() for values in np.meshgrid(*axes, indexing='ij')], axis=-1)
+    actions = evaluate(policy, grid, batch_size).reshape(tuple(len(axis) for axis in axes) + (-1,))
+    return LookupTable(axes, actions, cells, action_bound, dtype)
+
+
+def compile_actor(policy, action_bound, extent=2.0, coarse=9, tolerance=0.05, max_levels=5, max_points=2000000,
+                  samples=20000, dtype='float32', batch_size=4096, seed=0):
+    """ tabulate a policy, refining the grid until the table is within tolerance of it
+
+        Every round the intervals holding a validation point whose action is off by more than tolerance are
+        halved along the axes the policy bends along within the interval by more than tolerance / 2, or the one
+        it bends along the most.  Refining stops at tolerance, after max_levels rounds or before the table would
+        grow past max_points grid points.  The reported max_error is then measured on fresh random points.
+
+        params: policy - callable mapping a (batch, state_dim) array to actions, see evaluate()
+                action_bound - largest absolute action
+                extent - largest absolute xdist and ydist covered, states beyond are clamped to the edge
+                coarse - points per axis of the starting grid
+                tolerance - largest acceptable absolute action error
+                samples - validation points per round and for the final measurement
+
+        returns: LookupTable
+    """
+    rng = np.random.RandomState(seed)
+    axis_bounds = bounds(extent)
+    axes = [np.linspace(low, high, coarse) for low, high in axis_bounds]
+    cells = [coarse - 1] * 3
+    validation = sample_points(axis_bounds, samples, rng)
+    expected = evaluate(policy, validation, batch_size)
+    table = _build(policy, axes, cells, action_bound, dtype, batch_size)
+    for _ in range(max_levels):
+        wrong = validation[np.abs(table.lookup(validation) - expected).max(axis=1) > tolerance]
+        if not len(wrong):
+            break
+        # blame the axes along which the policy itself bends within the point's interval: how far it is at the
+        # interval's middle from halfway between its values at the ends, the other coordinates held
+        located = [table.locate(axis, wrong[:, axis])[0] for axis in range(3)]
+        errors = []
+        for axis, points in enumerate(axes):
+            ends = []
+            for position in (points[located[axis]], points[located[axis] + 1],
+                             (points[located[axis]] + points[located[axis] + 1]) / 2):
+                probes = wrong.copy()
+                probes[:, axis] = position
+                ends.append(evaluate(policy, probes, batch_size))
+            errors.append(np.abs(ends[2] - (ends[0] + ends[1]) / 2).max(axis=1))
+        errors = np.stack(errors, axis=-1)
+        blamed = (errors > tolerance / 2) | (errors == errors.max(axis=1, keepdims=True))
+        refined = []
+        for axis, points in enumerate(axes):
+            split = np.unique(located[axis][blamed[:, axis]])
+            refined.append(np.union1d(points, (points[split] + points[split + 1]) / 2))
+        if np.prod([len(points) for points in refined]) > max_points:
+            break
+        axes = refined
+        cells = [n * 2 for n in cells]
+        table = _build(policy, axes, cells, action_bound, dtype, batch_size)
+    test = sample_points(axis_bounds, samples, rng)
+    table.max_error = float(np.abs(table.lookup(test) - evaluate(policy, test, batch_size)).max())
+    return table
+
+
+class LookupController(object):
+    """ drop in for Actor.choose_action and SimpleActor.choose_action driven by a LookupTable
+
+        A call costs the same whatever the size of the table: three lattice lookups and eight table reads per
+        action dimension, in plain python arithmetic on flat lists so no arrays are allocated.  The action is
+        written into a preallocated array, which is returned and overwritten by the next call.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        nx, ny, nt, self.action_dim = table.actions.shape
+        self._values = [float(value) * table.scale for value in table.actions.ravel()]
+        # flat index steps along each axis
+        self._strides = (ny * nt * self.action_dim, nt * self.action_dim, self.action_dim)
+        self._axes = [(float(points[0]), float(points[-1]), n / float(points[-1] - points[0]), n - 1,
+                       [int(i) for i in intervals], [float(p) for p in points])
+                      for points, n, intervals in zip(table.axes, table.cells, table.intervals)]
+        self._action = np.zeros(self.action_dim)
+
+    def _locate(self, axis, value):
+        low, high, per_cell, last_cell, intervals, points = self._axes[axis]
+        if value <= low:
+            return 0, 0.0
+        if value >= high:
+            return len(points) - 2, 1.0
+        cell = int((value - low) * per_cell)
+        index = intervals[cell if cell < last_cell else last_cell]
+        left = points[index]
+        return index, (value - left) / (points[index + 1] - left)
+
+    def choose_action(self, state):
+        """ params: state - flattened state array or single state StateBatch
+
+            returns: the interpolated action, a view that the next call overwrites
+        """
+        state = as_array(state)
+        ix, fx = self._locate(0, float(state[0]))
+        iy, fy = self._locate(1, float(state[1]))
+        it, ft = self._locate(2, float(state[2]))
+        sx, sy, st = self._strides
+        values = self._values
+        for d in range(self.action_dim):
+            base = ix * sx + iy * sy + it * st + d
+            c00 = values[base] + (values[base + st] - values[base]) * ft
+            c01 = values[base + sy] + (values[base + sy + st] - values[base + sy]) * ft
+            c10 = values[base + sx] + (values[base + sx + st] - values[base + sx]) * ft
+            c11 = values[base + sx + sy] + (values[base + sx + sy + st] - values[base + sx + sy]) * ft
+            c0 = c00 + (c01 - c00) * fy
+            c1 = c10 + (c11 - c10) * fy
+            self._action[d] = c0 + (c1 - c0) * fx
+        return self._action
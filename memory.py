@@ -1,9 +1,13 @@
 """ Module for holding memory class """
+import os
+from collections import deque
 import numpy as np
 
 
 class Memory(object):
     """ class for storing transition tuples """
+    # per row arrays that load_all concatenates
+    _row_arrays = ('data',)
 
     def __init__(self, capacity, dims):
         """ init memory
@@ -29,6 +33,10 @@ class Memory(object):
         self.data[index, :] = transition
         self.pointer += 1
 
+    def end_episode(self):
+        """ mark the end of an episode, nothing is pending for single step transitions """
+        return
+
     def sample(self, n):
         """ sample the memory to get n examples 
         
@@ -60,3 +68,319 @@ class Memory(object):
         self.pointer = len(self.data) - 1
         self.capacity = len(self.data)
 
+    def load_all(self, locations):
+        """ load and concatenate several saved memories, unlike load the combined memory counts as full
+
+            params: locations - list of locations to load memory from
+        """
+        loaded = dict((name, []) for name in self._row_arrays)
+        for location in locations:
+            self.load(location)
+            for name in self._row_arrays:
+                loaded[name].append(getattr(self, name))
+        for name in self._row_arrays:
+            setattr(self, name, np.concatenate(loaded[name]))
+        self.capacity = len(self.data)
+        self.pointer = self.capacity
+
+
+class NStepMemory(Memory):
+    """ class for storing n-step transition tuples
+
+        Single steps are handed to store_transition as usual.  Each step adds its discounted reward to the
+        returns of the up to n-1 steps still waiting, so when a step is n steps old its row is complete and
+        is written as (s, a, r + gamma r' + ... + gamma^(n-1) r'', s_n) together with the bootstrap
+        factor gamma^n in discounts.  end_episode flushes the shorter windows left at an episode boundary.
+    """
+    _row_arrays = ('data', 'discounts')
+
+    def __init__(self, capacity, dims, n, gamma):
+        """ init memory
+
+            params: capacity - size of memory
+                    dims     - dimensions of memory to store
+                    n        - number of steps to accumulate before bootstrapping
+                    gamma    - reward discount
+        """
+        Memory.__init__(self, capacity, dims)
+        self.n = n
+        self.gamma = gamma
+        self.discounts = np.full(capacity, gamma)
+        # [s, a, discounted return so far, steps accumulated] for each step still inside its window
+        self._pending = deque()
+        self._last_s_ = None
+
+    def store_transition(self, s, a, r, s_):
+        """ accumulate the step into the pending windows and store the window that is now complete
+
+            params: s  - original state
+                    a  - action
+                    r  - reward for action
+                    s_ - next state
+        """
+        for pending in self._pending:
+            pending[2] += self.gamma ** pending[3] * r
+            pending[3] += 1
+        self._pending.append([np.array(s, copy=True), np.array(a, copy=True), r, 1])
+        # states may be views into the environment's state ring, keep our own copy
+        self._last_s_ = np.array(s_, copy=True)
+        if self._pending[0][3] == self.n:
+            self._store_window(self._pending.popleft(), s_)
+
+    def end_episode(self):
+        """ store the windows that were cut short by the end of the episode """
+        while self._pending:
+            self._store_window(self._pending.popleft(), self._last_s_)
+        self._last_s_ = None
+
+    def _store_window(self, pending, s_):
+        s, a, ret, steps = pending
+        self.discounts[self.pointer % self.capacity] = self.gamma ** steps
+        Memory.store_transition(self, s, a, ret, s_)
+
+    def sample_with_discounts(self, n):
+        """ sample the memory to get n examples and the bootstrap factor of each
+
+            params: n - number of samples
+
+            return: (n samples, (n, 1) array of bootstrap factors)
+        """
+        assert self.pointer >= self.capacity, 'Memory has not been fulfilled'
+        indices = np.random.choice(self.capacity, size=n)
+        return self.data[indices, :], self.discounts[indices, np.newaxis]
+
+    def save(self, location):
+        """ save the memory, the bootstrap factors go next to it in <location>.discounts
+
+            params: location - to store memory
+        """
+        Memory.save(self, location)
+        with open(location + ".discounts", "wb") as file_handle:
+            np.save(file_handle, self.discounts)
+
+    def load(self, location):
+        """ load the memory, plain single step memories get a bootstrap factor of gamma
+
+            params: location - to load memory from
+        """
+        Memory.load(self, location)
+        self.discounts = np.full(self.capacity, self.gamma)
+        if os.path.exists(location + ".discounts"):
+            with open(location + ".discounts", "rb") as file_handle:
+                self.discounts = np.load(file_handle)
+        self._pending.clear()
+
+
+class CompactMemory(object):
+    """ class for storing transition tuples with every observation kept once
+
+        Slot i holds the state, action and reward of one transition and its next state is the state in slot
+        i + 1.  When an episode ends its last next state is written to a slot of its own that is flagged as
+        not starting a transition, so within an episode no state is stored twice.  States and actions can be
+        stored as float32, float16 or int16 scaled to the given bounds, sample() reconstructs float rows in the
+        [s, a, r, s_] layout of Memory.
+
+        With history k > 1 the states handed out are the last k frames of the episode, oldest first, stacked
+        from the ring by index arithmetic: every slot records its step within the episode, and frames from
+        before the episode start repeat its first frame (see history.HistoryWindow).  Only the newest frame of
+        a stacked state passed to store_transition is stored.
+    """
+
+    def __init__(self, capacity, state_dim, action_dim, dtype='float32', state_bound=None, action_bound=None,
+                 history=1):
+        """ init memory
+
+            params: capacity     - number of slots, about one more per episode than the transitions held
+                    state_dim    - dimensions of a state
+                    action_dim   - dimensions of an action
+                    dtype        - storage for states and actions, float32, float16 or int16
+                    state_bound  - largest absolute value per state dimension, needed for int16
+                    action_bound - largest absolute action, needed for int16
+                    history      - number of frames in the states sample() returns
+        """
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.dtype = dtype
+        self.history = history
+        if dtype == 'int16':
+            assert state_bound is not None and action_bound is not None, 'int16 storage needs state and action bounds'
+            self.state_scale = np.abs(np.broadcast_to(state_bound, (state_dim,))) / 32767.0
+            self.action_scale = np.abs(np.broadcast_to(action_bound, (action_dim,))) / 32767.0
+        else:
+            self.state_scale = None
+            self.action_scale = None
+        self._reset()
+
+    def _reset(self):
+        storage = np.dtype(self.dtype)
+        self.obs = np.zeros((self.capacity, self.state_dim), storage)
+        self.actions = np.zeros((self.capacity, self.action_dim), storage)
+        self.rewards = np.zeros(self.capacity, np.float32)
+        # slot starts a transition, False for the frames that close an episode
+        self.valid = np.zeros(self.capacity, bool)
+        # step of the slot's frame within its episode, how far back its history reaches
+        self.steps = np.zeros(self.capacity, np.int32)
+        self._episode_step = 0
+        self.write = 0
+        self.slots = 0
+        self.pointer = 0
+        # next state of the newest transition, written once the episode goes on or ends
+        self._pending_next = None
+
+    def nbytes(self):
+        """ bytes used by the storage arrays """
+        return self.obs.nbytes + self.actions.nbytes + self.rewards.nbytes + self.valid.nbytes + self.steps.nbytes
+
+    def _encode(self, values, scale):
+        if scale is None:
+            return values
+        return np.clip(np.round(np.asarray(values) / scale), -32767, 32767)
+
+    def _decode(self, values, scale):
+        if scale is None:
+            return values.astype(float)
+        return values * scale
+
+    def _write_slot(self, s, a, r, valid):
+        self.obs[self.write] = self._encode(s, self.state_scale)
+        self.actions[self.write] = self._encode(a, self.action_scale)
+        self.rewards[self.write] = r
+        self.valid[self.write] = valid
+        self.steps[self.write] = self._episode_step
+        self._episode_step += 1
+        self.write = (self.write + 1) % self.capacity
+        self.slots += 1
+
+    def store_transition(self, s, a, r, s_):
+        """ store the transition, s is shared with the previous transition's next state when they match
+
+            params: s  - original state
+                    a  - action
+                    r  - reward for action
+                    s_ - next state
+        """
+        s = self._frame(s)
+        if self._pending_next is not None and not np.array_equal(s, self._pending_next):
+            # not a continuation, close the previous episode
+            self.end_episode()
+        if self._pending_next is None:
+            self._episode_step = 0
+        self._write_slot(s, a, r, True)
+        # states may be views into the environment's state ring, keep our own copy
+        self._pending_next = np.array(self._frame(s_), dtype=float)
+        self.pointer += 1
+
+    def _frame(self, s):
+        """ the newest frame of a state, which is all that is stored """
+        return np.asarray(s)[-self.state_dim:]
+
+    def end_episode(self):
+        """ write the final next state of the episode """
+        if self._pending_next is not None:
+            self._write_slot(self._pending_next, np.zeros(self.action_dim), 0, False)
+            self._pending_next = None
+
+    def sample(self, n):
+        """ sample the memory to get n examples
+
+            params: n - number of samples
+
+            return: n samples in the [s, a, r, s_] layout of Memory
+        """
+        assert self.slots >= self.capacity, 'Memory has not been fulfilled'
+        indices = np.random.randint(self.capacity, size=n)
+        invalid = self._unusable(indices)
+        while invalid.any():
+            indices[invalid] = np.random.randint(self.capacity, size=invalid.sum())
+            invalid = self._unusable(indices)
+        return self._rows(indices)
+
+    def _unusable(self, indices):
+        """ slots that do not start a transition, or whose history was already overwritten """
+        age = (indices - self.write) % self.capacity
+        return ~self.valid[indices] | (age < np.minimum(self.steps[indices], self.history - 1))
+
+    def _rows(self, indices, stacked=True):
+        """ [s, a, r, s_] rows of the transitions starting at the slots, with stacked histories if stacked """
+        history = self.history if stacked else 1
+        a = self._decode(self.actions[indices], self.action_scale)
+        r = self.rewards[indices, np.newaxis].astype(float)
+        # how many frames back each of the history's frames is, clamped to the episode start
+        back = np.arange(history - 1, -1, -1)[np.newaxis, :]
+        steps = self.steps[indices, np.newaxis]
+        s = self._stack(indices[:, np.newaxis] - np.minimum(back, steps))
+        s_ = self._stack(indices[:, np.newaxis] + 1 - np.minimum(back, steps + 1))
+        if self._pending_next is not None:
+            # the newest transition's next frame is not in the ring yet
+            newest = indices == (self.write - 1) % self.capacity
+            s_[newest, -self.state_dim:] = self._pending_next
+        return np.hstack((s, a, r, s_))
+
+    def _stack(self, slots):
+        """ frames of an (n, history) array of slots as (n, history * state_dim) states """
+        frames = self._decode(self.obs[slots % self.capacity], self.state_scale)
+        return frames.reshape(len(slots), -1)
+
+    def _transitions(self):
+        """ stored transitions oldest first, None marks an episode end """
+        start = self.write if self.slots >= self.capacity else 0
+        for i in (start + np.arange(min(self.slots, self.capacity))) % self.capacity:
+            if self.valid[i]:
+                yield self._rows(np.array([i]), stacked=False)[0]
+            else:
+                yield None
+
+    def save(self, location):
+        """ save the memory to the provided location
+
+            params: location - to store memory
+        """
+        empty = np.zeros(0)
+        pending = self._pending_next if self._pending_next is not None else empty
+        with open(location, "wb") as file_handle:
+            np.savez(file_handle, obs=self.obs, actions=self.actions, rewards=self.rewards, valid=self.valid,
+                     steps=self.steps, write=self.write, slots=self.slots, pointer=self.pointer, pending=pending,
+                     state_scale=self.state_scale if self.state_scale is not None else empty,
+                     action_scale=self.action_scale if self.action_scale is not None else empty)
+
+    def load(self, location):
+        """ load a saved CompactMemory or a plain Memory file from the provided location
+
+            params: location - to load memory from
+        """
+        self.load_all([location])
+
+    def load_all(self, locations):
+        """ load several saved CompactMemory or plain Memory files, re-encoded with this memory's storage
+
+            params: locations - list of locations to load memory from
+        """
+        self._reset()
+        for location in locations:
+            with open(location, "rb") as file_handle:
+                loaded = np.load(file_handle)
+                if isinstance(loaded, np.ndarray):
+                    rows = loaded
+                else:
+                    rows = self._saved_rows(loaded)
+            for row in rows:
+                if row is None:
+                    self.end_episode()
+                    continue
+                sd, ad = self.state_dim, self.action_dim
+                self.store_transition(row[:sd], row[sd: sd + ad], row[sd + ad], row[-sd:])
+            self.end_episode()
+
+    def _saved_rows(self, saved):
+        """ transition rows (None for episode ends) of a saved CompactMemory """
+        other = CompactMemory(len(saved['obs']), self.state_dim, self.action_dim)
+        other.dtype = str(saved['obs'].dtype)
+        if len(saved['state_scale']):
+            other.state_scale, other.action_scale = saved['state_scale'], saved['action_scale']
+        other.obs, other.actions = saved['obs'], saved['actions']
+        other.rewards, other.valid = saved['rewards'], saved['valid']
+        other.write, other.slots, other.pointer = int(saved['write']), int(saved['slots']), int(saved['pointer'])
+        # the newest transition may still wait for its next state, which is saved on its own
+        other._pending_next = saved['pending'] if len(saved['pending']) else None
+        return list(other._transitions())
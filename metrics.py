@@ -0,0 +1,42 @@
+""" module for the metrics stream training and evaluation write to
+
+Every record is one json line with its kind (e.g. 'train' or 'eval'), the training step it belongs to and its
+values, appended as it happens so the file can be followed while training runs.
+"""
+import json
+import threading
+import time
+
+
+class MetricsLog(object):
+    """ appends records to a json lines file, safe to write from several threads """
+
+    def __init__(self, location):
+        self.location = location
+        self._lock = threading.Lock()
+
+    def write(self, kind, step, **values):
+        """ append one record
+
+            params: kind - what produced the record, e.g. 'train' or 'eval'
+                    step - the training step the values correspond to
+                    values - json serializable values
+        """
+        record = {'kind': kind, 'step': int(step), 'time': time.time()}
+        record.update((key, _plain(value)) for key, value in values.items())
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            with open(self.location, 'a') as file_handle:
+                file_handle.write(line + '\n')
+
+
+def _plain(value):
+    """ numpy scalars as python numbers """
+    return value.item() if hasattr(value, 'item') else value
+
+
+def read(location, kind=None):
+    """ the records of a metrics file, optionally only those of one kind """
+    with open(location) as file_handle:
+        records = [json.loads(line) for line in file_handle if line.strip()]
+    return [record for record in records if kind is None or record['kind'] == kind]
@@ -0,0 +1,210 @@
+""" module for serving batched policy inference to rollout workers over a unix socket
+
+Workers send single states, the server gathers the requests that arrive within max_wait of the first one
+(up to max_batch) and answers them with one batched forward pass, adding each request's exploration noise.
+The policy can be swapped between batches, every response carries the version of the weights it came from.
+
+    request:  float64 [ state..., exploration var ]
+    response: float64 [ action..., weights version ]
+"""
+import os
+import socket
+import threading
+import time
+from collections import deque
+import numpy as np
+from state_batch import as_array
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+
+def _recv_exact(conn, size):
+    """ read exactly size bytes, None if the peer closed the connection """
+    chunks = []
+    while size > 0:
+        chunk = conn.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class PolicyServer(object):
+    """ batches action requests from many workers into single forward passes """
+
+    def __init__(self, policy, state_dim, action_dim, action_bound, socket_path, max_batch=64, max_wait=0.002):
+        """ params: policy - callable mapping a (batch, state_dim) array to (batch, action_dim) actions,
+                             e.g. ddpg's actor.choose_actions
+                    state_dim, action_dim, action_bound - environment dimensions, see VREP_Env
+                    socket_path - unix socket to listen on
+                    max_batch - most requests answered by one forward pass
+                    max_wait - seconds to wait for more requests after the first one of a batch arrived
+        """
+        self.policy = policy
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.action_bound = action_bound
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.version = 0
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._running = False
+        self._listener = None
+        self._threads = []
+        self._states = np.zeros((max_batch, state_dim))
+        self._vars = np.zeros(max_batch)
+        # stats since reset_stats
+        self._latencies = deque(maxlen=10000)
+        self._batch_sizes = deque(maxlen=10000)
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """ start listening and serving in background threads """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(128)
+        self._listener.settimeout(0.1)
+        self._running = True
+        for target in (self._accept, self._serve_batches):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._listener.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def swap(self, load):
+        """ atomically replace the weights between two batches
+
+            params: load - callable that loads the new weights, e.g. restoring a checkpoint into the session
+
+            returns: the new version
+        """
+        with self._lock:
+            load()
+            self.version += 1
+            return self.version
+
+    def stats(self):
+        """ request latency (receipt to reply) and how full the batches were """
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            sizes = np.array(self._batch_sizes)
+        if not len(sizes):
+            return {'requests': 0, 'batches': 0}
+        return {'requests': int(sizes.sum()),
+                'batches': len(sizes),
+                'mean_batch': sizes.mean(),
+                'batch_fill': sizes.mean() / self.max_batch,
+                'latency_ms_mean': latencies.mean(),
+                'latency_ms_p99': np.percentile(latencies, 99),
+                'version': self.version}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._latencies.clear()
+            self._batch_sizes.clear()
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn, _ = self._listener.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            thread = threading.Thread(target=self._read_requests, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _read_requests(self, conn):
+        """ one thread per worker, a worker has at most one request outstanding """
+        size = (self.state_dim + 1) * 8
+        while self._running:
+            data = _recv_exact(conn, size)
+            if data is None:
+                conn.close()
+                return
+            request = np.frombuffer(data, dtype=np.float64)
+            self._requests.put((conn, request, time.time()))
+
+    def _serve_batches(self):
+        while self._running:
+            try:
+                batch = [self._requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._answer(batch)
+
+    def _answer(self, batch):
+        n = len(batch)
+        for i, (_, request, _) in enumerate(batch):
+            self._states[i] = request[:-1]
+            self._vars[i] = request[-1]
+        with self._lock:
+            actions = np.asarray(self.policy(self._states[:n]), dtype=np.float64)
+            version = self.version
+        # exploration noise, as the training loop adds it
+        actions = np.clip(np.random.normal(actions, self._vars[:n, np.newaxis]), *self.action_bound)
+        replies = np.hstack((actions, np.full((n, 1), float(version))))
+        # counted before any reply goes out, so a client that got its answer also finds it in stats()
+        now = time.time()
+        with self._stats_lock:
+            self._latencies.extend(now - received for _, _, received in batch)
+            self._batch_sizes.append(n)
+        for (conn, _, _), reply in zip(batch, replies):
+            try:
+                conn.sendall(reply.tobytes())
+            except socket.error:
+                continue
+
+
+class PolicyClient(object):
+    """ worker side of the PolicyServer, a drop-in for Actor.choose_action """
+
+    def __init__(self, socket_path, state_dim, action_dim, var=0.0):
+        """ params: socket_path - unix socket the server listens on
+                    state_dim, action_dim - environment dimensions, see VREP_Env
+                    var - exploration noise the server adds to this worker's actions
+        """
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.var = var
+        self.version = None
+        self._request = np.zeros(state_dim + 1)
+        self._conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._conn.connect(socket_path)
+
+    def choose_action(self, s, var=None):
+        """ action for a single state, with var (or the client's var) exploration noise applied by the server """
+        self._request[:-1] = as_array(s)
+        self._request[-1] = self.var if var is None else var
+        self._conn.sendall(self._request.tobytes())
+        reply = np.frombuffer(_recv_exact(self._conn, (self.action_dim + 1) * 8), dtype=np.float64)
+        self.version = int(reply[-1])
+        return reply[:-1]
+
+    def close(self):
+        self._conn.close()
@@ -1,5 +1,6 @@
 """ module for different reward calculation schemes """
 import math
+import numpy as np
 
 
 DISTANCE_REWARD_MATRIX = [
@@ -32,6 +33,13 @@ class RewardCalculator(object):
         reward += sum([r.calculate_reward(orig_state, new_state) for r in self.rewarders])
         return reward
 
+    def calculate_rewards(self, orig_states, new_states):
+        """ vectorized calculate_reward over StateBatch objects, returns one reward per row """
+        rewards = np.zeros(len(new_states))
+        for r in self.rewarders:
+            rewards += r.calculate_rewards(orig_states, new_states)
+        return rewards
+
 
 class BaseRewarder(object):
     """ base class for storing field data """
@@ -61,6 +69,15 @@ class IncrementalReward(BaseRewarder):
 
         return reward
 
+    def calculate_rewards(self, orig_states, new_states):
+        """ vectorized calculate_reward over StateBatch objects """
+        delta_orig = np.abs(orig_states.dist() - self.goal_distance)
+        delta_new = np.abs(new_states.dist() - self.goal_distance)
+        closer = delta_new < delta_orig
+        reward = self.pos_reward * (closer & (delta_new < self.goal_distance))
+        reward += self.pos_reward * (closer & (delta_new < self.goal_distance/2.0))
+        return reward
+
 
 class GraduatedReward(BaseRewarder):
     """ class that gives scaled rewards based on cloeness to goals """
@@ -86,6 +103,13 @@ class GraduatedReward(BaseRewarder):
             return -1
             
         return dist_reward + angle_reward
+
+    def calculate_rewards(self, orig_states, new_states):
+        """ vectorized calculate_reward over StateBatch objects """
+        dist_reward = _graduate(np.abs(new_states.dist() - self.goal_distance), DISTANCE_REWARD_MATRIX)
+        angle_reward = _graduate(np.abs(np.degrees(new_states.theta - self.goal_theta)), ANGLE_REWARD_MATRIX)
+        good = (dist_reward > 0) & (angle_reward > 0)
+        return np.where(good, dist_reward + angle_reward, -1.0)
         
 
 class MoveCloserRewarder(BaseRewarder):
@@ -107,6 +131,13 @@ class MoveCloserRewarder(BaseRewarder):
 
         return reward
 
+    def calculate_rewards(self, orig_states, new_states):
+        """ vectorized calculate_reward over StateBatch objects """
+        delta_orig = np.abs(orig_states.dist() - self.goal_distance)
+        delta_new = np.abs(new_states.dist() - self.goal_distance)
+        reward = np.where(delta_new < delta_orig, float(self.pos_reward), float(self.neg_reward))
+        return np.where(np.abs(delta_orig - delta_new) < 0.01, 0.0, reward)
+
 
 class OrientationAlignedRewarder(BaseRewarder):
     """ class that rewards the robot for reducing the delta in goal theta """
@@ -129,6 +160,25 @@ class OrientationAlignedRewarder(BaseRewarder):
         else:
             return self.neg_reward
 
+    def calculate_rewards(self, orig_states, new_states):
+        """ vectorized calculate_reward over StateBatch objects """
+        delta_orig = _wrap_degrees(np.abs(np.degrees(orig_states.theta - self.goal_theta)))
+        delta_new = _wrap_degrees(np.abs(np.degrees(new_states.theta - self.goal_theta)))
+        reward = np.where(np.abs(delta_new) <= np.abs(delta_orig), float(self.pos_reward), float(self.neg_reward))
+        return np.where(np.abs(delta_orig - delta_new) < 1, 0.0, reward)
+
+
+def _graduate(actual_delta, reward_matrix):
+    """ vectorized lookup of the first (delta, reward) bracket the actual delta falls under, 0 if none """
+    deltas = np.array([delta for delta, _ in reward_matrix])
+    graduated_rewards = np.array([reward for _, reward in reward_matrix] + [0.0])
+    return graduated_rewards[np.searchsorted(deltas, actual_delta, side='right')]
+
+
+def _wrap_degrees(delta):
+    """ same wrap as the scalar rewarders, deltas past 180 degrees are measured the other way """
+    return np.where(delta > 180, delta - 360, delta)
+
 
 def default(goal_distance, goal_theta=0, pos_reward=1, neg_reward=-1):
     """ return reward_calculator using the default rewarding scheme """
@@ -0,0 +1,145 @@
+""" module for choosing the target path of every training episode by how often the agent still fails it
+
+A scenario is one of the target paths started at an offset into it, so the episode begins with a different
+segment of the path.  An episode fails when the environment ends it because the robot lost the target
+(VREP_Env._is_done), running out of path or steps is a success.  The scheduler keeps running statistics per
+scenario and draws the next one with a probability proportional to its recent failure rate, so simulator
+time goes to the segments the policy has not learned yet.  Scenarios never played come first, and a floor keeps
+mastered ones in the rotation now and then.
+"""
+import math
+import numpy as np
+
+
+# target paths, every entry moves the target by the mover increment
+PATHS = {
+    'circle': ["R"] * 7 + ["B"] * 7 + ["L"] * 7 + ["F"] * 7 + ["exit"],
+    'circle_reverse': ["F"] * 7 + ["L"] * 7 + ["B"] * 7 + ["R"] * 7 + ["exit"],
+    'right': ["R"] * 20 + ["exit"],
+    'zigzag': (["R"] * 4 + ["F"] * 4 + ["R"] * 4 + ["B"] * 4) * 2 + ["exit"],
+    'back_and_forth': ["R"] * 10 + ["L"] * 10 + ["exit"],
+}
+
+
+def rotate(path, offset):
+    """ path started offset moves into it, the skipped moves are done at the end """
+    moves = [move for move in path if move != "exit"]
+    offset %= len(moves)
+    return moves[offset:] + moves[:offset] + ["exit"]
+
+
+class Scenario(object):
+    """ a path and start offset with running statistics of the episodes played on it """
+
+    def __init__(self, name, path, offset=0):
+        self.name = '%s@%d' % (name, offset)
+        self.path = rotate(path, offset)
+        self.episodes = 0
+        self.failures = 0
+        # exponentially weighted failure rate, None until played
+        self.recent_failure = None
+        self.reward_mean = 0.0
+        self._reward_m2 = 0.0
+
+    def record(self, failed, reward, decay):
+        """ update the statistics with one episode, Welford's update for the reward mean and variance """
+        self.episodes += 1
+        self.failures += int(failed)
+        if self.recent_failure is None:
+            self.recent_failure = float(failed)
+        else:
+            self.recent_failure = decay * self.recent_failure + (1 - decay) * float(failed)
+        delta = reward - self.reward_mean
+        self.reward_mean += delta / self.episodes
+        self._reward_m2 += delta * (reward - self.reward_mean)
+
+    @property
+    def reward_std(self):
+        return math.sqrt(self._reward_m2 / self.episodes) if self.episodes else 0.0
+
+    def stats(self):
+        return {'episodes': self.episodes, 'failures': self.failures,
+                'recent_failure': self.recent_failure, 'reward_mean': self.reward_mean,
+                'reward_std': self.reward_std}
+
+
+def make_pool(names=None, offsets=1):
+    """ scenarios for the named paths, each started at offsets evenly spaced places along it
+
+        Offsets that give a path already in the pool are left out, e.g. every rotation of 'right' is the same.
+
+        params: names - keys of PATHS, all of them if None
+                offsets - start offsets per path
+
+        returns: list of Scenario
+    """
+    pool = []
+    for name in sorted(PATHS) if names is None else names:
+        moves = len(PATHS[name]) - 1
+        for i in range(offsets):
+            scenario = Scenario(name, PATHS[name], i * moves // offsets)
+            if all(scenario.path != other.path for other in pool):
+                pool.append(scenario)
+    return pool
+
+
+class ScenarioScheduler(object):
+    """ draws scenarios with a probability proportional to how often the agent recently failed them """
+
+    def __init__(self, scenarios, log=None, floor=0.05, decay=0.8, seed=None):
+        """ params: scenarios - list of Scenario to choose from
+                    log - optional metrics.MetricsLog for the decisions ('schedule') and results ('scenario')
+                    floor - smallest priority, how often mastered scenarios are still played
+                    decay - weight of the past in the recent failure rate
+        """
+        self.scenarios = scenarios
+        self.log = log
+        self.floor = floor
+        self.decay = decay
+        self.rng = np.random.RandomState(seed)
+
+    def priorities(self):
+        """ selection probability of every scenario """
+        unplayed = np.array([scenario.recent_failure is None for scenario in self.scenarios])
+        if unplayed.any():
+            return unplayed / float(unplayed.sum())
+        priorities = np.maximum([scenario.recent_failure for scenario in self.scenarios], self.floor)
+        return priorities / priorities.sum()
+
+    def next(self, step=0, slot=None):
+        """ choose the scenario of the next episode
+
+            params: step - training step, for the log
+                    slot - which of several parallel environments (e.g. --pairs) the episode runs in
+
+            returns: Scenario
+        """
+        probabilities = self.priorities()
+        index = self.rng.choice(len(self.scenarios), p=probabilities)
+        scenario = self.scenarios[index]
+        if self.log is not None:
+            values = {'scenario': scenario.name, 'probability': probabilities[index]}
+            if slot is not None:
+                values['slot'] = slot
+            self.log.write('schedule', step, **values)
+        return scenario
+
+    def record(self, scenario, step, failed, reward, steps):
+        """ update the scenario's statistics with the outcome of an episode played on it
+
+            params: failed - if the environment ended the episode because the target was lost
+                    reward - the episode's total reward
+                    steps - steps the episode took
+        """
+        scenario.record(failed, reward, self.decay)
+        if self.log is not None:
+            self.log.write('scenario', step, scenario=scenario.name, failed=bool(failed), reward=reward, steps=steps,
+                           **scenario.stats())
+
+    def summary(self):
+        """ one line per scenario with its statistics """
+        return ['%-20s episodes %4d | failures %4d | recent failure %s | reward %.2f +- %.2f' %
+                (scenario.name, scenario.episodes, scenario.failures,
+                 '-' if scenario.recent_failure is None else '%.2f' % scenario.recent_failure,
+                 scenario.reward_mean, scenario.reward_std)
+                for scenario in self.scenarios]
@@ -0,0 +1,126 @@
+""" module for simulating the Pioneer p3dx ultrasonic sensors without the simulator
+
+Every sensor cone is approximated by a fan of rays, the reading of a sensor is the distance from the sensor to
+the closest point any of its rays hits, or 0 if nothing is within range, the same as read_sensors in
+vrep_env.py.  Obstacles are circles kept in a uniform grid, each ray only tests the obstacles in the cells
+along it, and all rays of all sensors of all robots are cast together with numpy.
+"""
+import math
+import numpy as np
+
+
+# sensor 1..16 positions (x, y) relative to the robot centre in meters and directions in degrees
+SENSOR_POSITIONS = np.array([
+    (0.069, 0.136), (0.114, 0.119), (0.148, 0.078), (0.166, 0.027),
+    (0.166, -0.027), (0.148, -0.078), (0.114, -0.119), (0.069, -0.136),
+    (-0.157, -0.136), (-0.203, -0.119), (-0.237, -0.078), (-0.255, -0.027),
+    (-0.255, 0.027), (-0.237, 0.078), (-0.203, 0.119), (-0.157, 0.136)])
+SENSOR_ANGLES = np.radians([90, 50, 30, 10, -10, -30, -50, -90, -90, -130, -150, -170, 170, 150, 130, 90])
+NUM_SENSORS = len(SENSOR_ANGLES)
+
+
+class ObstacleGrid(object):
+    """ uniform grid over circular obstacles, each cell lists the obstacles that could be hit inside it """
+
+    def __init__(self, obstacles, cell_size=0.5):
+        """ params: obstacles - list of (x, y, radius) circles
+                    cell_size - grid cell edge length in meters
+        """
+        self.obstacles = np.array(obstacles, dtype=float).reshape(-1, 3)
+        self.cell_size = cell_size
+        if not len(self.obstacles):
+            self.origin = np.zeros(2)
+            self.cells = -np.ones((1, 1, 1), dtype=int)
+            return
+        centres, radii = self.obstacles[:, :2], self.obstacles[:, 2]
+        # one cell of margin so a ray sampled every cell_size/2 never skips an obstacle's cells
+        self.origin = (centres - radii[:, np.newaxis]).min(axis=0) - 2 * cell_size
+        upper = (centres + radii[:, np.newaxis]).max(axis=0) + 2 * cell_size
+        shape = np.ceil((upper - self.origin) / cell_size).astype(int)
+        lists = [[[] for _ in range(shape[1])] for _ in range(shape[0])]
+        for i, (x, y, radius) in enumerate(self.obstacles):
+            lo = self._cell(np.array([x - radius, y - radius])) - 1
+            hi = self._cell(np.array([x + radius, y + radius])) + 1
+            for cx in range(max(lo[0], 0), min(hi[0], shape[0] - 1) + 1):
+                for cy in range(max(lo[1], 0), min(hi[1], shape[1] - 1) + 1):
+                    lists[cx][cy].append(i)
+        width = max(1, max(len(cell) for column in lists for cell in column))
+        # padded with -1 so a lookup is a single fancy index
+        self.cells = -np.ones((shape[0], shape[1], width), dtype=int)
+        for cx in range(shape[0]):
+            for cy in range(shape[1]):
+                self.cells[cx, cy, :len(lists[cx][cy])] = lists[cx][cy]
+
+    def _cell(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(int)
+
+    def candidates(self, points):
+        """ obstacle indices (-1 padded) of the cells the points fall in, points outside the grid get none
+
+            params: points - (..., 2) array
+
+            returns: (..., width) array
+        """
+        cells = self._cell(points)
+        inside = ((cells >= 0) & (cells < self.cells.shape[:2])).all(axis=-1)
+        cells = np.where(inside[..., np.newaxis], cells, 0)
+        found = self.cells[cells[..., 0], cells[..., 1]]
+        return np.where(inside[..., np.newaxis], found, -1)
+
+
+class SensorModel(object):
+    """ casts the 16 ultrasonic sensor cones of many robots at once """
+
+    def __init__(self, obstacles, sensor_range=1.0, cone_half_angle=math.radians(15), rays_per_sensor=5,
+                 cell_size=0.5):
+        """ params: obstacles - list of (x, y, radius) circles
+                    sensor_range - furthest detection distance in meters
+                    cone_half_angle - half opening angle of a sensor cone in radians
+                    rays_per_sensor - rays the cone is approximated with
+                    cell_size - grid cell edge length in meters
+        """
+        self.grid = ObstacleGrid(obstacles, cell_size)
+        self.sensor_range = sensor_range
+        self.ray_angles = (SENSOR_ANGLES[:, np.newaxis] +
+                           np.linspace(-cone_half_angle, cone_half_angle, rays_per_sensor)[np.newaxis, :])
+        # points along a ray where the grid is looked up, at most half a cell apart
+        steps = int(math.ceil(2 * sensor_range / cell_size)) + 1
+        self.ray_samples = np.linspace(0, sensor_range, steps)
+
+    def read(self, x, y, yaw):
+        """ sensor readings for robots at the given poses
+
+            params: x, y, yaw - robot positions and headings, scalars or arrays of the same length
+
+            returns: (n, 16) array of distances, 0 where nothing was detected
+        """
+        x, y, yaw = (np.atleast_1d(np.asarray(v, dtype=float)) for v in (x, y, yaw))
+        cos, sin = np.cos(yaw)[:, np.newaxis], np.sin(yaw)[:, np.newaxis]
+        # sensor origins in the world, (n, sensors)
+        ox = x[:, np.newaxis] + cos * SENSOR_POSITIONS[:, 0] - sin * SENSOR_POSITIONS[:, 1]
+        oy = y[:, np.newaxis] + sin * SENSOR_POSITIONS[:, 0] + cos * SENSOR_POSITIONS[:, 1]
+        # ray directions, (n, sensors, rays)
+        angles = yaw[:, np.newaxis, np.newaxis] + self.ray_angles
+        dx, dy = np.cos(angles), np.sin(angles)
+        ox, oy = ox[..., np.newaxis], oy[..., np.newaxis]
+
+        # candidate obstacles along each ray, (n, sensors, rays, samples * width)
+        points = np.stack([ox[..., np.newaxis] + dx[..., np.newaxis] * self.ray_samples,
+                           oy[..., np.newaxis] + dy[..., np.newaxis] * self.ray_samples], axis=-1)
+        candidates = self.grid.candidates(points)
+        candidates = candidates.reshape(candidates.shape[:3] + (-1,))
+        if not len(self.grid.obstacles):
+            return np.zeros((len(x), NUM_SENSORS))
+        circles = self.grid.obstacles[np.maximum(candidates, 0)]
+
+        # ray / circle intersection, nearest entry point in front of the sensor
+        fx = ox[..., np.newaxis] - circles[..., 0]
+        fy = oy[..., np.newaxis] - circles[..., 1]
+        b = fx * dx[..., np.newaxis] + fy * dy[..., np.newaxis]
+        c = fx * fx + fy * fy - circles[..., 2] ** 2
+        disc = b * b - c
+        root = np.sqrt(np.maximum(disc, 0))
+        dist = np.where(c <= 0, 0.0, -b - root)   # sensor inside an obstacle reads 0 distance
+        hit = (candidates >= 0) & (disc >= 0) & (dist >= 0) & (dist <= self.sensor_range)
+        dist = np.where(hit, dist, np.inf).min(axis=(-1, -2))
+        return np.where(np.isinf(dist), 0.0, dist)
@@ -1,6 +1,7 @@
 """ module for holding actor that behaves in simple manner """
 import math
 import numpy as np
+from state_batch import as_array
 
 
 def noise():
@@ -28,8 +29,11 @@ class SimpleActor(object):
     def choose_action(self, state):
         """ choose actions given the current state
 
+            params: state - flattened state array or single state StateBatch
+
             returns: tuple of (left motor velocity, right motor velocity)
         """
+        state = as_array(state)
         xpos = state[0]
         ypos = state[1]
         dist = math.sqrt(xpos**2 + ypos**2)
@@ -0,0 +1,159 @@
+""" module for holding compact, array backed robot states """
+import numpy as np
+
+
+# column layout of the data array, the sensor readings sit right before it in the same block so the network
+# input with sensors, [ sensors..., xdist, ydist, orientation, relative orientation ], is also a view
+XDIST = 0
+YDIST = 1
+THETA = 2
+RELATIVE_ORIENTATION = 3
+DIST = 4
+VLEFT = 5
+VRIGHT = 6
+NUM_FIELDS = 7
+
+# the leading columns that make up the network input, see to_array
+STATE_DIM = 4
+
+
+class StateBatch(object):
+    """ holds one or many robot states contiguously in a single array
+
+        A batch backed by a 1-D row behaves like a single state (accessors return scalars), a batch
+        backed by a 2-D array holds one state per row (accessors return column views).  Derived values
+        (distance and relative orientation) are computed once when the batch is filled, so dist(),
+        relative_orientation() and to_array() are views into the backing array and never copy.
+    """
+    __slots__ = ('data', 'sensor_readings', 'block')
+
+    def __init__(self, data, sensor_readings=None, block=None):
+        """ wraps existing arrays, use empty() or from_arrays() to build a new batch
+
+            params: data - array of shape (NUM_FIELDS,) or (n, NUM_FIELDS)
+                    sensor_readings - array of shape (num_sensors,) or (n, num_sensors), may be None
+                    block - the [ sensor_readings, data ] array both are views of, None if they are separate
+        """
+        self.data = data
+        self.sensor_readings = sensor_readings
+        self.block = block
+
+    @classmethod
+    def _from_block(cls, block, num_sensors):
+        return cls(block[..., num_sensors:], block[..., :num_sensors], block)
+
+    @classmethod
+    def empty(cls, n, num_sensors=0):
+        """ allocate a zeroed batch of n states
+
+            params: n - number of states to hold
+                    num_sensors - number of sensor readings kept per state
+
+            returns: StateBatch - with n rows
+        """
+        return cls._from_block(np.zeros((n, num_sensors + NUM_FIELDS)), num_sensors)
+
+    @classmethod
+    def from_arrays(cls, xdist, ydist, theta, vleft=0, vright=0, sensor_readings=None):
+        """ build a new batch from per-field values or arrays of values
+
+            returns: StateBatch - with one row per element of xdist
+        """
+        xdist = np.atleast_1d(np.asarray(xdist, dtype=float))
+        if sensor_readings is None:
+            return cls.empty(len(xdist)).fill(xdist, ydist, theta, vleft, vright)
+        sensors = np.asarray(sensor_readings, dtype=float).reshape(len(xdist), -1)
+        return cls.empty(len(xdist), sensors.shape[1]).fill(xdist, ydist, theta, vleft, vright, sensors)
+
+    def __len__(self):
+        return 1 if self.data.ndim == 1 else len(self.data)
+
+    def row(self, i):
+        """ single state view onto row i, shares memory with this batch """
+        sensors = None if self.sensor_readings is None else self.sensor_readings[i]
+        block = None if self.block is None else self.block[i]
+        return StateBatch(self.data[i], sensors, block)
+
+    def fill(self, xdist, ydist, theta, vleft, vright, sensor_readings=None):
+        """ overwrite the batch in place and recompute the derived columns
+
+            params: xdist - the distance from the target on x axis
+                    ydist - the distance from the target on y axis
+                    theta - the relative orientation to the target in radians
+                    vleft - current left motor velocity
+                    vright - current right motor velocity
+                    sensor_readings - sensor distance readings, left untouched if None
+
+            returns: self - for chaining
+        """
+        data = self.data
+        data[..., XDIST] = xdist
+        data[..., YDIST] = ydist
+        data[..., THETA] = theta
+        data[..., VLEFT] = vleft
+        data[..., VRIGHT] = vright
+        np.arctan2(data[..., YDIST], data[..., XDIST], out=data[..., RELATIVE_ORIENTATION])
+        np.hypot(data[..., XDIST], data[..., YDIST], out=data[..., DIST])
+        if sensor_readings is not None:
+            self.sensor_readings[...] = sensor_readings
+        return self
+
+    def copy(self):
+        """ deep copy that no longer shares memory with this batch """
+        if self.block is not None:
+            return StateBatch._from_block(self.block.copy(), self.sensor_readings.shape[-1])
+        sensors = None if self.sensor_readings is None else self.sensor_readings.copy()
+        return StateBatch(self.data.copy(), sensors)
+
+    def _column(self, column):
+        """ scalar for a single state, view for a batch """
+        return self.data[..., column][()]
+
+    @property
+    def xdist(self):
+        return self._column(XDIST)
+
+    @property
+    def ydist(self):
+        return self._column(YDIST)
+
+    @property
+    def theta(self):
+        return self._column(THETA)
+
+    @property
+    def vleft(self):
+        return self._column(VLEFT)
+
+    @property
+    def vright(self):
+        return self._column(VRIGHT)
+
+    def to_array(self, include_sensors=False):
+        """ network input view
+
+            params: include_sensors - put the sensor readings in front of the state, a view as well
+                                      unless the batch was built from separate arrays
+
+            returns: view with [ xdist, ydist, orientation, relative orientation ] per state
+        """
+        if not include_sensors:
+            return self.data[..., :STATE_DIM]
+        num_sensors = self.sensor_readings.shape[-1]
+        if self.block is not None:
+            return self.block[..., :num_sensors + STATE_DIM]
+        return np.concatenate((self.sensor_readings, self.data[..., :STATE_DIM]), axis=-1)
+
+    def dist(self):
+        """ euclidean distance to target """
+        return self._column(DIST)
+
+    def relative_orientation(self):
+        return self._column(RELATIVE_ORIENTATION)
+
+
+def as_array(state):
+    """ network input for either a StateBatch or an already flattened state array """
+    if isinstance(state, StateBatch):
+        return state.to_array()
+    return state
@@ -12,19 +12,26 @@ DONE=-1000000
 class TargetMover(object):
     """ Class for moving the target along a desired path """
 
-    def __init__(self, client_id, target_handle, path, increment=0.1):
+    def __init__(self, client_id, target_handle, path, increment=0.1, recorder=None, pipelined=False):
         """ Initialize the target mover
 
             params: client_id     - to connect to vrep server with
                     target_handle - handle of object being followed
                     path          - list of [RLFB] instruction for what direction to move
                     increment     - how far to move for each step
+                    recorder      - optional trajectory.TrajectoryRecorder that reset and step report to
+                    pipelined     - keep track of the target position locally and send moves without waiting,
+                                    so VREP_Env.step_async can batch them with the motor commands
         """
         self.client_id = client_id
         self.handle = target_handle
         self.path = path
         self.increment = increment
+        self.recorder = recorder
+        self.pipelined = pipelined
         self._index = 0
+        # last position sent in pipelined mode, None until read back after a reset
+        self._pos = None
 
     def step(self):
         """ move the target to the next positions specified in the path 
@@ -34,20 +41,38 @@ class TargetMover(object):
         """
         movex, movey = self._get_next_pos()
         if movex == DONE:
+            if self.recorder is not None:
+                self.recorder.record_target(self._index, None, True)
             return True
 
         # what is our current absolute position
-        _, pos = vrep.simxGetObjectPosition(self.client_id, self.handle, -1, vrep.simx_opmode_oneshot_wait)
+        if self.pipelined and self._pos is not None:
+            pos = self._pos
+        else:
+            _, pos = vrep.simxGetObjectPosition(self.client_id, self.handle, -1, vrep.simx_opmode_oneshot_wait)
         x = pos[0]
         y = pos[1]
         z = pos[2]
 
-        vrep.simxSetObjectPosition(self.client_id, self.handle, -1, (x+movex, y+movey, z), vrep.simx_opmode_oneshot_wait)
+        if self.pipelined:
+            vrep.simxSetObjectPosition(self.client_id, self.handle, -1, (x+movex, y+movey, z), vrep.simx_opmode_oneshot)
+            self._pos = (x+movex, y+movey, z)
+        else:
+            vrep.simxSetObjectPosition(self.client_id, self.handle, -1, (x+movex, y+movey, z), vrep.simx_opmode_oneshot_wait)
         self._index = self._index + 1
+        if self.recorder is not None:
+            self.recorder.record_target(self._index, (x+movex, y+movey, z), False)
         return False
 
     def reset(self):
         self._index = 0
+        self._pos = None
+        if self.recorder is not None:
+            self.recorder.record_path(self.path)
+
+    def finished(self):
+        """ if the path is used up, step() returns True from here on """
+        return self._get_next_pos()[0] == DONE
 
     def _get_next_pos(self):
         """ what is the next x and y position """
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+import numpy as np
+import fake_vrep
+
+fake_vrep.install(latency=0.0, realtime_factor=1.0)
+import collect
+import memory
+import policy_server
+import rewards
+import vrep_env
+from target_mover import TargetMover
+
+
+def test_collect_through_the_policy_server(tmpdir):
+    weights = np.zeros((vrep_env.VREP_Env.state_dim, vrep_env.VREP_Env.action_dim))
+    weights[0] = 1.0
+    socket_path = str(tmpdir.join('policy.sock'))
+    server = policy_server.PolicyServer(lambda states: states.dot(weights), vrep_env.VREP_Env.state_dim,
+                                        vrep_env.VREP_Env.action_dim, vrep_env.VREP_Env.action_bound, socket_path)
+    server.start()
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.01)
+    mover = TargetMover(env.client_id, env.target_handle, ["R"] * 4 + ["exit"])
+    client = policy_server.PolicyClient(socket_path, env.state_dim, env.action_dim)
+    try:
+        mem = memory.Memory(10, dims=2 * env.state_dim + env.action_dim + 1)
+        episodes = collect.collect(env, mover, client, mem, var=0.0)
+        # the path ends every episode after 5 steps
+        assert mem.pointer == 10 and episodes == 2
+        # every action is the served policy's answer to the state it was taken in
+        states = mem.data[:, :env.state_dim]
+        assert np.allclose(mem.data[:, env.state_dim: env.state_dim + env.action_dim], states.dot(weights))
+        assert server.stats()['requests'] == 10
+    finally:
+        client.close()
+        server.stop()
+        env.stop()
+
+
+def test_collector_does_not_import_tensorflow():
+    # the point of the collectors is to leave the graph and the session to the server
+    subprocess.check_call([sys.executable, '-c', 'import sys, fake_vrep; fake_vrep.install(); import collect; '
+                                                 'assert "tensorflow" not in sys.modules and "ddpg" not in sys.modules'])
@@ -0,0 +1,74 @@
+import argparse
+import numpy as np
+import pytest
+import data_parallel
+import tuning
+
+
+def _learner(rank, reducer, results, steps, fail_rank):
+    if rank == fail_rank:
+        raise SystemExit(3)
+    weights = np.zeros(5, np.float32)
+    for step in range(steps):
+        # every learner's gradient differs, the applied mean is the same for all
+        gradient = np.arange(5, dtype=np.float32) * (rank + 1) + step
+        weights -= reducer.mean(rank, gradient)
+    results.put((rank, {'weights': weights, 'steps': steps, 'elapsed': 1.0 + rank}))
+
+
+def test_all_reduce_keeps_learners_identical():
+    results = data_parallel.run(_learner, 3, 5, args=(4, None))
+    assert data_parallel.max_difference([result['weights'] for result in results]) == 0
+    # mean over ranks 1..3 is 2 * arange, plus the step
+    assert np.allclose(results[0]['weights'], -(4 * 2 * np.arange(5) + 6))
+
+    lines = data_parallel.scaling({1: results[:1], 3: results}, batch_size=64)
+    assert lines[1]['samples_per_s'] == 3 * 64 * 4 / 3.0
+    assert lines[1]['efficiency'] == lines[1]['samples_per_s'] / (3 * lines[0]['samples_per_s'])
+
+
+def test_failed_learner_releases_the_others():
+    with pytest.raises(Exception):
+        data_parallel.run(_learner, 2, 5, args=(4, 1))
+
+
+def test_split_inverts_flatten():
+    arrays = [np.ones((2, 3)), np.zeros(4), np.full((1, 1), 2.0)]
+    restored = data_parallel.split(data_parallel.flatten(arrays), [a.shape for a in arrays])
+    assert all(np.array_equal(a, b) for a, b in zip(arrays, restored))
+
+
+def _threads_learner(rank, reducer, results):
+    results.put((rank, tuning.inherited_threads()))
+
+
+def test_child_threads_reach_spawned_learners():
+    with tuning.child_threads(3, 1):
+        assert data_parallel.run(_threads_learner, 2, 1) == [(3, 1), (3, 1)]
+    assert tuning.inherited_threads() is None
+
+
+def _ddpg_learner(*args):
+    import fake_vrep
+    fake_vrep.install(latency=0.0, realtime_factor=1.0)
+    import ddpg
+    ddpg.parallel_learner(*args)
+
+
+def test_ddpg_learners_keep_identical_weights(tmpdir):
+    tf = pytest.importorskip("tensorflow")
+    import fake_vrep
+    fake_vrep.install(latency=0.0, realtime_factor=1.0)
+    import ddpg
+    import evaluation
+    ddpg.sess.run(tf.global_variables_initializer())
+    params = ddpg.critic.e_params + ddpg.actor.e_params
+    start = data_parallel.flatten(ddpg.sess.run(params))
+    args = argparse.Namespace(mode='bench', save_path=str(tmpdir), init_path=None, learners=2, replay='memory',
+                              n_step=1, compact_memory=None, loadmempath=None, policy_socket=None)
+    weights = evaluation.snapshot(ddpg.sess, ddpg.policy_saver_params)
+    with tuning.child_threads(1, 1):
+        results = data_parallel.run(_ddpg_learner, 2, len(start), args=(args, weights, 5, 0))
+    # different minibatches, the same averaged critic and policy gradients through the shared RMSProp slots
+    assert data_parallel.max_difference([result['weights'] for result in results]) < 1e-6
+    assert not np.allclose(results[0]['weights'], start)
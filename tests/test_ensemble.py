@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+import fake_vrep
+
+fake_vrep.install(latency=0.0, realtime_factor=1.0)
+import ensemble
+from vrep_env import VREP_Env
+
+
+def make_ensemble(k=2):
+    return ensemble.Ensemble(k, VREP_Env.state_dim, VREP_Env.action_dim, VREP_Env.action_bound, 1e-3, 1e-3, 0.9,
+                             1100, 1000)
+
+
+def batch(k, n, rng):
+    return (rng.uniform(-1, 1, (k, n, VREP_Env.state_dim)), rng.uniform(-1, 1, (k, n, VREP_Env.action_dim)),
+            rng.uniform(-1, 1, (k, n, 1)), rng.uniform(-1, 1, (k, n, VREP_Env.state_dim)))
+
+
+def test_members_learn_independently():
+    agents = make_ensemble()
+    agents.initialize()
+    with agents.graph.as_default():
+        variables = tf.global_variables()
+    start = agents.sess.run(variables)
+    rng = np.random.RandomState(0)
+    s, a, r, s_ = batch(2, 16, rng)
+    agents.learn(s, a, r, s_)
+    first = agents.member_weights(1)
+    changed = agents.member_weights(0)
+
+    # the same start, member 0 learns from another minibatch, member 1 must not notice
+    for variable, value in zip(variables, start):
+        variable.load(value, agents.sess)
+    s[0], a[0], r[0], s_[0] = [part[0] for part in batch(1, 16, rng)]
+    agents.learn(s, a, r, s_)
+    second = agents.member_weights(1)
+    for name in first:
+        np.testing.assert_allclose(first[name], second[name], rtol=1e-6, atol=1e-7)
+    assert any(not np.allclose(changed[name], agents.member_weights(0)[name]) for name in changed)
+
+    states = rng.uniform(-1, 1, (2, VREP_Env.state_dim))
+    assert np.allclose(agents.choose_action(1, states[1]), agents.choose_actions(states)[1])
+
+
+def test_save_member_restores_into_ddpg(tmpdir):
+    import ddpg
+    agents = make_ensemble()
+    agents.initialize()
+    weights = agents.member_weights(1)
+    location = agents.save_member(1, str(tmpdir))
+    ddpg.policy_saver.restore(ddpg.sess, location)
+    for variable in ddpg.policy_saver_params:
+        np.testing.assert_allclose(ddpg.sess.run(variable), weights[variable.op.name])
@@ -0,0 +1,87 @@
+import threading
+import numpy as np
+import fake_vrep
+
+fake_vrep.install(latency=0.0, realtime_factor=1.0)
+import evaluation
+import metrics
+import rewards
+import vrep_env
+from target_mover import TargetMover
+
+
+def actor_weights(rng, scope='Actor/eval_net'):
+    sizes = [('l1', 4, 200), ('l2', 200, 200), ('l3', 200, 10), ('a/a', 10, 2)]
+    weights = {}
+    for name, fan_in, fan_out in sizes:
+        weights['%s/%s/kernel:0' % (scope, name)] = rng.normal(0, 0.3, (fan_in, fan_out))
+        weights['%s/%s/bias:0' % (scope, name)] = rng.normal(0, 0.1, fan_out)
+    return weights
+
+
+def test_numpy_actor():
+    weights = actor_weights(np.random.RandomState(0))
+    actor = evaluation.NumpyActor(weights, 2.5)
+    s = np.array([1.0, 0.2, 0.1, 0.2])
+    net = s
+    for name in ['l1', 'l2']:
+        net = np.clip(net.dot(weights['Actor/eval_net/%s/kernel:0' % name]) + weights['Actor/eval_net/%s/bias:0' % name], 0, 6)
+    net = np.maximum(net.dot(weights['Actor/eval_net/l3/kernel:0']) + weights['Actor/eval_net/l3/bias:0'], 0)
+    expected = 2.5 * np.tanh(net.dot(weights['Actor/eval_net/a/a/kernel:0']) + weights['Actor/eval_net/a/a/bias:0'])
+    assert np.allclose(actor.choose_action(s), expected)
+    assert np.allclose(actor.choose_actions(np.vstack([s, s])), [expected, expected])
+
+
+def test_eval_worker_runs_in_background(tmpdir):
+    # the training connection stays open while the worker connects its own environment
+    train_env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.01)
+
+    def make_env():
+        env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.01, exclusive=False)
+        return env, TargetMover(env.client_id, env.target_handle, ["R"] * 4 + ["exit"])
+
+    location = str(tmpdir.join('metrics.jsonl'))
+    log = metrics.MetricsLog(location)
+    worker = evaluation.EvalWorker(make_env, log, episodes=2, max_steps=10)
+    worker.start()
+    policy = evaluation.NumpyActor(actor_weights(np.random.RandomState(1)), 2.5)
+    # the worker is held at its first action until the gate opens, submitting must not wait for it
+    gate = threading.Event()
+
+    class GatedPolicy(object):
+        def choose_action(self, s):
+            gate.wait()
+            return policy.choose_action(s)
+
+    worker.submit(100, GatedPolicy())
+    worker.submit(200, GatedPolicy())
+    assert worker.evaluated == 0
+    gate.set()
+    log.write('train', 150, reward=1.0)
+    train_env.step([1.0, 1.0])
+    worker.stop()
+    train_env.stop()
+
+    records = metrics.read(location)
+    evals = metrics.read(location, 'eval')
+    assert [r['kind'] for r in records].count('train') == 1
+    # the second snapshot either replaced the first before it started or ran after it
+    assert evals[-1]['step'] == 200 and worker.evaluated + worker.skipped == 2
+    assert evals[-1]['episodes'] == 2 and 0 < evals[-1]['steps_mean'] <= 5
+
+
+def test_finished_path_is_not_a_lost_target(tmpdir):
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.01, action_repeat=3)
+    mover = TargetMover(env.client_id, env.target_handle, ["R"] * 4 + ["exit"])
+
+    class StandStill(object):
+        def choose_action(self, s):
+            return [0.0, 0.0]
+
+    location = str(tmpdir.join('metrics.jsonl'))
+    worker = evaluation.EvalWorker(None, metrics.MetricsLog(location), episodes=1, max_steps=10)
+    # the path runs out on a repeated tick, the step that ends the episode is done
+    worker._evaluate(env, mover, 100, StandStill())
+    env.stop()
+    evals = metrics.read(location, 'eval')
+    assert evals[-1]['steps_mean'] < 4 and evals[-1]['lost_target'] == 0
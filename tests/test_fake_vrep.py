@@ -0,0 +1,278 @@
+import numpy as np
+import pytest
+import fake_vrep
+
+fake_vrep.install(latency=0.0, realtime_factor=1.0)
+import vrep_env
+import rewards
+
+
+def test_opmodes():
+    client_id = fake_vrep.simxStart('127.0.0.1', 19999, True, True, 5000, 5)
+    _, target = fake_vrep.simxGetObjectHandle(client_id, 'Sphere', fake_vrep.simx_opmode_oneshot_wait)
+    rc, _ = fake_vrep.simxGetObjectPosition(client_id, target, -1, fake_vrep.simx_opmode_buffer)
+    assert rc == fake_vrep.simx_return_novalue_flag
+    rc, _ = fake_vrep.simxGetObjectPosition(client_id, target, -1, fake_vrep.simx_opmode_streaming)
+    assert rc == fake_vrep.simx_return_novalue_flag
+    rc, pos = fake_vrep.simxGetObjectPosition(client_id, target, -1, fake_vrep.simx_opmode_buffer)
+    assert rc == fake_vrep.simx_return_ok
+    assert pos == [1.0, 0.0, 0.05]
+
+    # paused non blocking commands are applied together on release
+    fake_vrep.simxPauseCommunication(client_id, True)
+    fake_vrep.simxSetObjectPosition(client_id, target, -1, (2.0, 0.0, 0.05), fake_vrep.simx_opmode_oneshot)
+    _, pos = fake_vrep.simxGetObjectPosition(client_id, target, -1, fake_vrep.simx_opmode_oneshot_wait)
+    assert pos[0] == 1.0
+    fake_vrep.simxPauseCommunication(client_id, False)
+    _, pos = fake_vrep.simxGetObjectPosition(client_id, target, -1, fake_vrep.simx_opmode_oneshot_wait)
+    assert pos[0] == 2.0
+    fake_vrep.simxFinish(client_id)
+
+
+def test_relative_frames():
+    client_id = fake_vrep.simxStart('127.0.0.1', 19999, True, True, 5000, 5)
+    wait = fake_vrep.simx_opmode_oneshot_wait
+    _, target = fake_vrep.simxGetObjectHandle(client_id, 'Sphere', wait)
+    _, robot = fake_vrep.simxGetObjectHandle(client_id, fake_vrep.ROBOT_NAME, wait)
+    fake_vrep.simxSetObjectOrientation(client_id, robot, -1, (0.0, 0.0, np.pi / 2), wait)
+    assert fake_vrep.simxSetObjectPosition(client_id, target, robot, (1.0, 0.5, 0.0), wait) == fake_vrep.simx_return_ok
+    _, pos = fake_vrep.simxGetObjectPosition(client_id, target, robot, wait)
+    assert np.allclose(pos, [1.0, 0.5, 0.0])
+    # a quarter turn maps the robot's forward onto the world y axis
+    _, absolute = fake_vrep.simxGetObjectPosition(client_id, target, -1, wait)
+    _, robot_pos = fake_vrep.simxGetObjectPosition(client_id, robot, -1, wait)
+    assert np.allclose(np.subtract(absolute, robot_pos)[:2], [-0.5, 1.0])
+    fake_vrep.simxSetObjectOrientation(client_id, target, robot, (0.0, 0.0, 0.25), wait)
+    _, orient = fake_vrep.simxGetObjectOrientation(client_id, target, robot, wait)
+    assert np.isclose(orient[2], 0.25)
+    # an unknown reference is a remote error, like in vrep
+    rc = fake_vrep.simxSetObjectPosition(client_id, target, 9999, (1.0, 0.0, 0.0), wait)
+    assert rc == fake_vrep.simx_return_remote_error_flag
+    fake_vrep.simxFinish(client_id)
+
+
+def test_env_kinematics():
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.05)
+    s = env.reset()
+    # target starts one meter straight ahead
+    assert abs(s[0] - 1.0) < 1e-6 and abs(s[1]) < 1e-6
+    s, r, done = env.step([2.0, 2.0])
+    # driving forward closes the gap, the motors are set one after the other so allow a little drift
+    assert s[0] < 1.0 and abs(s[1]) < 1e-3
+    s_turn, r, done = env.step([-1.0, 1.0])
+    # turning left puts the target to the right, and the robot yaw shows in theta
+    assert s_turn[1] < 0 and s_turn[2] > 0
+    env.stop()
+
+
+class CountingReward(object):
+    """ one per tick, so the summed reward counts the ticks a step ran """
+
+    def __init__(self):
+        self.calls = 0
+
+    def calculate_reward(self, orig_state, new_state):
+        self.calls += 1
+        return 1
+
+
+def test_action_repeat():
+    rewarder = CountingReward()
+    env = vrep_env.VREP_Env(rewarder, goal_distance=1, max_delta=0.5, sleep_time=0.01, action_repeat=3)
+    held = env.reset()
+    kept = held.copy()
+    # the reward is summed over the ticks of the held action
+    s, r, done = env.step([0.0, 0.0])
+    assert r == 3 and not done
+    # a step reads 1 + action_repeat states, the ring leaves the one the caller still holds alone
+    assert np.array_equal(held, kept)
+    held, kept = s, s.copy()
+    env.step([0.0, 0.0])
+    assert np.array_equal(held, kept)
+
+    # before_tick runs before every tick after the first, True ends the step as done
+    ticks = []
+    s, r, done = env.step([0.0, 0.0], before_tick=lambda: ticks.append(1) or len(ticks) == 2)
+    assert done and r == 2 and len(ticks) == 2
+
+    env.stop()
+
+    # driving away from the target ends the step at the tick the robot gets out of range, not after all of them
+    env = vrep_env.VREP_Env(CountingReward(), goal_distance=1, max_delta=0.5, sleep_time=0.01, action_repeat=100)
+    env.reset()
+    s, r, done = env.step([-20.0, -20.0])
+    assert done and 0 < r < 100
+    assert abs(np.hypot(s[0], s[1]) - 1) > 0.5
+    env.stop()
+
+
+def test_pipelined_step():
+    from target_mover import TargetMover
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.05, pipelined=True)
+    mover = TargetMover(env.client_id, env.target_handle, ["R", "R", "exit"], pipelined=True)
+    env.reset()
+    mover.reset()
+    fake_vrep.reset_stats()
+    # after a reset the mover reads the target position back once
+    assert env.step_async([2.0, 2.0], move_target=mover.step) is False
+    assert fake_vrep.stats()['round_trips'] == 1
+    s, r, done = env.step_wait()
+    # the target moved 0.1 away and the robot closed part of it, the motors start together so there is no drift
+    assert 1.0 < s[0] < 1.1 and abs(s[1]) < 1e-9
+    # both motor commands and the target move go out together without waiting, and the step starts from the
+    # state the last one ended with, leaving only the one state read
+    round_trips = fake_vrep.stats()['round_trips']
+    env.step_async([0.0, 0.0], move_target=mover.step)
+    assert fake_vrep.stats()['round_trips'] == round_trips
+    env.step_wait()
+    assert fake_vrep.stats()['round_trips'] - round_trips == round_trips - 1
+    env.stop()
+
+
+def test_recorded_episodes_start_at_the_target_reset(tmpdir):
+    import trajectory
+    from target_mover import TargetMover
+    recorder = trajectory.TrajectoryRecorder(str(tmpdir), vrep_env.VREP_Env.action_bound)
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.02, recorder=recorder)
+    mover = TargetMover(env.client_id, env.target_handle, ["R"] * 3 + ["exit"], recorder=recorder)
+    for _ in range(2):
+        env.reset()
+        mover.reset()
+        for _ in range(3):
+            mover.step()
+            env.step([0.0, 0.0])
+    env.stop()
+    episodes = [trajectory.load_episode(location) for location in trajectory.episode_files(str(tmpdir))]
+    assert len(episodes) == 2
+    for episode in episodes:
+        assert episode['target_index'][0] == 0
+        np.testing.assert_allclose(episode['target_pose'][0], env.target_reset.pos, atol=1e-6)
+    # the previous episode's target moved away from the reset pose
+    assert episodes[0]['target_index'][-1] == 3
+    assert not np.allclose(episodes[0]['target_pose'][-1], env.target_reset.pos)
+
+
+def test_snapshot_restore_and_fork():
+    from target_mover import TargetMover
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.02)
+    mover = TargetMover(env.client_id, env.target_handle, ["R"] * 10 + ["exit"])
+    env.reset()
+    mover.reset()
+    mover.step()
+    env.step([1.0, -1.0])
+    snapshot = env.snapshot(mover)
+    start = env.get_state().to_array().copy()
+    for _ in range(3):
+        mover.step()
+        env.step([2.0, 2.0])
+    s = env.restore(snapshot, mover)
+    # only the time between placing the robot and reading the state back has passed
+    assert np.allclose(s, start, atol=1e-2)
+    assert mover._index == 1
+
+    fork = env.fork(3, snapshot)
+    assert np.allclose(fork.reset(), start, atol=1e-2)
+    states, r, dones = fork.step([[2.0, 2.0], [0.0, 0.0], [-2.0, -2.0]])
+    # the target moved the same in every copy, driving towards it closes the gap the most
+    assert states[0, 0] < states[1, 0] < states[2, 0]
+    assert r.shape == (3,) and not dones.any()
+    for _ in range(8):
+        states, r, dones = fork.step([0.0, 0.0])
+    # the snapshot was taken after the first of the 10 moves, the step after the last one is done
+    assert not dones.all()
+    states, r, dones = fork.step([0.0, 0.0])
+    assert dones.all()
+    env.stop()
+
+
+def test_restore_after_reset_and_history_forks():
+    import history
+    from target_mover import TargetMover
+    env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.02)
+    mover = TargetMover(env.client_id, env.target_handle, ["R"] * 10 + ["exit"])
+    env.reset()
+    mover.reset()
+    for _ in range(3):
+        mover.step()
+        env.step([2.0, 1.0])
+    # commanded to stop, the wheels are still turning
+    env.step([0.0, 0.0])
+    snapshot = env.snapshot(mover)
+    env.reset()
+    mover.reset()
+    env.restore(snapshot, mover)
+    # the reset reloaded the robot, the restore places the robot loaded now
+    pose = vrep_env.read_pose(env.client_id, env.ref_frame)
+    assert np.allclose(pose[:2], snapshot.robot.pos[:2], atol=1e-6) and abs(pose[0]) > 1e-3
+    scene = fake_vrep._scenes[env.client_id]
+    # the restored robot starts from rest, it stays where the snapshot had it
+    assert scene.objects[env.motor_left].speed == 0 and scene.objects[env.motor_right].speed == 0
+
+    stacked = history.HistoryEnv(env, 3)
+    fork = stacked.fork(2, snapshot)
+    states = fork.reset()
+    assert states.shape == (2, 3 * env.state_dim)
+    assert np.allclose(states[:, :env.state_dim], states[:, -env.state_dim:])
+    frames = [states[:, -env.state_dim:].copy()]
+    for actions in ([[2.0, 2.0], [-2.0, -2.0]], [[1.0, 1.0], [0.0, 0.0]]):
+        states, r, dones = fork.step(actions)
+        frames.append(fork.forked._states[fork.forked._current].to_array().copy())
+    # every copy's row is its own frames, oldest first
+    for copy in range(2):
+        assert np.allclose(states[copy], np.concatenate([frame[copy] for frame in frames]))
+    assert states[0, -env.state_dim] != states[1, -env.state_dim]
+    env.stop()
+
+
+def test_sensor_states():
+    import sensor_model
+    obstacles = [(0.0, 0.6, 0.2), (-0.7, 0.0, 0.2)]
+    fake_vrep.configure(obstacles=obstacles)
+    try:
+        env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.02, include_sensors=True)
+    finally:
+        fake_vrep.configure(obstacles=[])
+    model = sensor_model.SensorModel(obstacles, sensor_range=fake_vrep.SENSOR_RANGE)
+    scene = fake_vrep._scenes[env.client_id]
+    casts = []
+    read = scene.sensor_model.read
+    scene.sensor_model.read = lambda *pose: casts.append(pose) or read(*pose)
+    s = env.reset()
+    assert s.shape == (env.state_dim,) == (vrep_env.VREP_Env.sensor_state_dim,)
+    # the robot stands still at the origin, one cast serves all 16 sensor reads
+    assert np.allclose(s[:16], model.read(0.0, 0.0, 0.0)[0], atol=1e-3) and np.count_nonzero(s[:16]) >= 3
+    assert len(casts) == 1
+
+    with pytest.raises(ValueError):
+        env.fork(2)
+    fork = env.fork(2, sensor_model=model)
+    states = fork.reset()
+    assert states.shape == (2, env.state_dim)
+    assert np.allclose(states[0], s, atol=1e-2)
+    states, r, dones = fork.step([[2.0, 2.0], [-2.0, -2.0]])
+    # backing up approaches the obstacle behind the robot
+    assert states[1, 11] < s[11] and states[1, 11] > 0
+    env.stop()
+
+
+def test_multi_pair_env():
+    fake_vrep.configure(pairs=3)
+    try:
+        env = vrep_env.MultiVREP_Env(rewards.graduated(1), 3, goal_distance=1, sleep_time=0.05)
+    finally:
+        fake_vrep.configure(pairs=1)
+    movers = env.make_movers(["F"] * 5 + ["exit"])
+    s = env.reset(movers=movers)
+    assert s.shape == (3, 4) and np.allclose(s[:, 0], 1.0)
+    fake_vrep.reset_stats()
+    s, r, dones = env.step(np.array([[2.0, 2.0], [0.0, 0.0], [-2.0, -2.0]]), movers)
+    # the pairs move independently, and reading all of them takes two round trips
+    assert s[0, 0] < s[1, 0] < s[2, 0]
+    assert r.shape == (3,) and not dones.any()
+    assert fake_vrep.stats()['round_trips'] == 2
+    # resetting one pair leaves the others where they are
+    s = env.reset(pairs=[0], movers=movers)
+    assert abs(s[0, 0] - 1.0) < 1e-6 and abs(s[0, 1]) < 1e-6
+    assert s[2, 0] > 1.0 and s[2, 1] > 0
+    assert movers[0]._index == 0 and movers[2]._index == 1
+    env.stop()
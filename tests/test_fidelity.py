@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import fake_vrep
+
+fake_vrep.install(latency=0.0, realtime_factor=1.0)
+import fidelity
+import kinematics
+import rewards
+import trajectory
+import vrep_env
+from state_batch import StateBatch
+from target_mover import TargetMover
+
+TRUE_PARAMS = {'wheel_radius': 0.09, 'axle_length': 0.36, 'time_constant': 0.12}
+
+
+def synthetic_episode(seed, steps=40):
+    """ an episode recorded from the kinematic model itself, with the target standing at (1, 0) """
+    actions, path = fidelity.random_script(steps, [-2, 2], np.random.RandomState(seed))
+    episode = {'actions': actions, 'time': np.arange(steps + 1) * 0.1, 'robot_pose': np.zeros((steps + 1, 6))}
+    poses = fidelity.simulate(episode, TRUE_PARAMS)[0]
+    episode['robot_pose'][:, [0, 1, 5]] = poses
+    dx, dy = 1.0 - poses[:, 0], -poses[:, 1]
+    cos, sin = np.cos(poses[:, 2]), np.sin(poses[:, 2])
+    vleft = np.concatenate(([0], actions[:, 0]))
+    vright = np.concatenate(([0], actions[:, 1]))
+    states = StateBatch.from_arrays(cos * dx + sin * dy, -sin * dx + cos * dy, poses[:, 2], vleft, vright)
+    episode['states'] = states.data
+    episode['sensors'] = np.zeros((steps + 1, 0))
+    return episode
+
+
+def test_divergence_and_fit():
+    episodes = [synthetic_episode(seed) for seed in range(3)]
+    # the model that made the episodes follows them exactly, rewards included
+    diverged = fidelity.divergence(episodes[0], fidelity.simulate(episodes[0], TRUE_PARAMS), rewards.graduated(1))
+    assert diverged['position'].max() < 1e-9 and diverged['yaw'].max() < 1e-9
+    assert diverged['reward'].max() < 1e-9
+    # several parameter sets are simulated in one batch
+    assert fidelity.simulate(episodes[0], {'wheel_radius': [0.08, 0.09, 0.1]}).shape == (3, 41, 3)
+
+    params, loss = fidelity.fit(episodes, rounds=5)
+    assert loss < fidelity.loss(episodes, kinematics.DYNAMICS)[0] / 10
+    for name in fidelity.PARAMS:
+        assert abs(params[name] - TRUE_PARAMS[name]) < 0.1 * TRUE_PARAMS[name]
+
+
+def test_calibration_files(tmpdir):
+    first = fidelity.save_calibration(str(tmpdir), TRUE_PARAMS)
+    second = fidelity.save_calibration(str(tmpdir), kinematics.DYNAMICS, {'loss': 0.5})
+    assert first.endswith('calibration_000.json') and second.endswith('calibration_001.json')
+    # a directory loads its newest calibration
+    assert fidelity.load_calibration(str(tmpdir)) == kinematics.DYNAMICS
+    assert fidelity.load_calibration(first) == TRUE_PARAMS
+
+    # revisions continue after the highest one, also when an older file was deleted
+    tmpdir.join('calibration_000.json').remove()
+    assert fidelity.save_calibration(str(tmpdir), TRUE_PARAMS).endswith('calibration_002.json')
+    assert fidelity.load_calibration(str(tmpdir)) == TRUE_PARAMS
+
+    tmpdir.join('calibration_003.json').write('{"version": 0, "params": {}}')
+    with pytest.raises(Exception):
+        fidelity.load_calibration(str(tmpdir))
+
+
+def test_fidelity_calibration(tmpdir):
+    fake_vrep.configure(dynamics={'wheel_radius': 0.085, 'time_constant': 0.1})
+    try:
+        recorder = trajectory.TrajectoryRecorder(str(tmpdir), vrep_env.VREP_Env.action_bound)
+        env = vrep_env.VREP_Env(rewards.graduated(1), goal_distance=1, sleep_time=0.05, recorder=recorder)
+        mover = TargetMover(env.client_id, target_handle=env.target_handle, path=['exit'], recorder=recorder)
+        rng = np.random.RandomState(0)
+        fidelity.record(env, mover, [fidelity.random_script(15, [-1, 1], rng, hold=(5, 5)) for _ in range(2)])
+        env.stop()
+    finally:
+        fake_vrep.configure(dynamics=kinematics.DYNAMICS)
+    episodes = fidelity.load_episodes(str(tmpdir))
+    assert len(episodes) == 2
+    params, loss = fidelity.fit(episodes)
+    # the slower wheels and the motor lag of the recording are found, the default model drifts further
+    assert loss < fidelity.loss(episodes, kinematics.DYNAMICS)[0]
+    assert abs(params['wheel_radius'] - 0.085) < 0.01
@@ -0,0 +1,37 @@
+import history
+import memory
+import numpy as np
+
+
+def test_window_views():
+    window = history.HistoryWindow(3, 2, spare=2)
+    assert np.array_equal(window.reset([1, 1]), [1, 1] * 3)
+    held = window.push([2, 2])
+    assert np.array_equal(held, [1, 1, 1, 1, 2, 2])
+    # the window is a view into the buffer, not a copy
+    assert np.shares_memory(held, window._buffer)
+    for i in range(3, 8):
+        states = window.push([i, i])
+    # frames are moved to the front of the buffer as it fills up, the window keeps its order
+    assert np.array_equal(states, [5, 5, 6, 6, 7, 7])
+
+
+def test_compact_memory_stacks_history():
+    mem = memory.CompactMemory(6, 1, 1, history=3)
+    for s in [10, 11]:
+        mem.store_transition([s], [0], 0, [s + 1])
+    # the second episode starts without an end_episode, the discontinuity closes the first one
+    for s in [20, 21, 22]:
+        mem.store_transition([s], [0], 0, [s + 1])
+    rows = mem._rows(np.arange(6))
+    # [s (3 frames), a, r, s_ (3 frames)], frames before an episode start repeat its first frame
+    assert np.array_equal(rows[1], [10, 10, 11, 0, 0, 10, 11, 12])
+    assert np.array_equal(rows[3], [20, 20, 20, 0, 0, 20, 20, 21])
+    assert np.array_equal(rows[5], [20, 21, 22, 0, 0, 21, 22, 23])
+
+    # stacked states are accepted, only their newest frame is stored
+    mem.store_transition([21, 22, 23], [0], 0, [22, 23, 24])
+    assert np.array_equal(mem._rows(np.array([0]))[0], [21, 22, 23, 0, 0, 22, 23, 24])
+    # slot 1 needs the frame slot 0 held and is never sampled, nor is the closing slot 2
+    starts = set(mem.sample(200)[:, 2])
+    assert starts == {20, 21, 22, 23}
@@ -0,0 +1,45 @@
+import csv
+import os
+import numpy as np
+import landscape
+
+
+def test_analyse_and_cache(tmpdir):
+    calls = []
+
+    def run(states):
+        calls.append(len(states))
+        # action = (xdist, ydist), q = -distance
+        return states[:, :2], -np.hypot(states[:, 0], states[:, 1])
+
+    axes = landscape.grid_axes(extent=1.0, shape=(5, 3, 4))
+    directory = str(tmpdir)
+    cache = os.path.join(directory, 'ckpt.npz')
+    result = landscape.analyse(run, axes, cache_path=cache, checkpoint='ckpt', batch_size=16)
+    assert result['actions'].shape == (5, 3, 4, 2) and result['q'].shape == (5, 3, 4)
+    assert calls == [16, 16, 16, 12]
+    # grid points line up with the axes
+    assert result['actions'][4, 0, 2, 0] == 1.0 and result['actions'][4, 0, 2, 1] == -1.0
+    assert result['q'][2, 1, 0] == 0
+
+    # cached for the same checkpoint, recomputed for another one
+    landscape.analyse(run, axes, cache_path=cache, checkpoint='ckpt')
+    assert len(calls) == 4
+    other = landscape.analyse(run, axes, cache_path=cache, checkpoint='ckpt-2')
+    assert len(calls) == 5
+    assert landscape.summary(other, result)['action_change'] == 0
+    # the same name retrained is another version
+    landscape.analyse(run, axes, cache_path=cache, checkpoint='ckpt-2', version='1.0')
+    assert len(calls) == 6
+
+    weights = os.path.join(directory, 'DDPG.ckpt')
+    for suffix in ('.index', '.data-00000-of-00001'):
+        open(weights + suffix, 'w').close()
+    first = landscape.checkpoint_version(weights)
+    os.utime(weights + '.index', (1e9, float(first) + 10))
+    assert landscape.checkpoint_version(weights) != first
+
+    landscape.write_csv(result, os.path.join(directory, 'ckpt.csv'))
+    with open(os.path.join(directory, 'ckpt.csv')) as file_handle:
+        rows = list(csv.reader(file_handle))
+    assert rows[0] == ['xdist', 'ydist', 'theta', 'a0', 'a1', 'q'] and len(rows) == 1 + 5 * 3 * 4
@@ -0,0 +1,41 @@
+import numpy as np
+import lookup_table
+
+
+def policy(states):
+    # smooth in xdist and theta, a steep step in ydist around 0
+    return np.stack((np.tanh(states[:, 0]) + 0.5 * np.sin(states[:, 2]), 2 * np.tanh(8 * states[:, 1])), axis=-1)
+
+
+def test_compile_refines_where_needed():
+    table = lookup_table.compile_actor(policy, action_bound=2, extent=2.0, coarse=5, tolerance=0.05, samples=5000)
+    assert table.max_error < 0.1
+    xdist, ydist, theta = table.axes
+    # the steep ydist step gets more breakpoints than the smooth axes, and they sit close to 0
+    assert len(ydist) > len(xdist) and len(ydist) > len(theta)
+    assert np.diff(ydist).min() < np.diff(ydist).max() / 4
+    assert abs(ydist[np.argmin(np.diff(ydist))]) < 0.5
+
+
+def test_controller_matches_table():
+    table = lookup_table.compile_actor(policy, action_bound=2, coarse=5, max_levels=2, samples=2000)
+    controller = lookup_table.LookupController(table)
+    points = lookup_table.sample_points(lookup_table.bounds(2.5), 200, np.random.RandomState(1))
+    expected = table.lookup(points)
+    states = lookup_table.network_input(points)
+    for state, action in zip(states, expected):
+        assert np.allclose(controller.choose_action(state), action)
+    # grid points are reproduced exactly, states beyond the bounds are clamped to the edge
+    assert np.allclose(controller.choose_action([0.0, 0.0, 0.0, 0.0]), [0.0, 0.0])
+    assert np.allclose(controller.choose_action([9.0, 0.0, 0.0, 0.0]), policy(np.array([[2.0, 0.0, 0.0]])))
+
+
+def test_save_load_int16(tmpdir):
+    table = lookup_table.compile_actor(policy, action_bound=2, coarse=5, max_levels=1, samples=1000, dtype='int16')
+    location = str(tmpdir.join('table.npz'))
+    table.save(location)
+    loaded = lookup_table.load(location)
+    assert loaded.actions.dtype == np.int16 and loaded.max_error == table.max_error
+    points = lookup_table.sample_points(lookup_table.bounds(2.0), 100, np.random.RandomState(2))
+    assert np.array_equal(loaded.lookup(points), table.lookup(points))
+    assert np.abs(table.lookup(points) - lookup_table.evaluate(policy, points)).max() <= table.max_error + 1e-3
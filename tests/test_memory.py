@@ -27,3 +27,76 @@ def test_save_load():
     assert mem.capacity == 10
     
     
+
+def test_n_step_returns():
+    gamma = 0.5
+    mem = memory.NStepMemory(10, dims=2 * STATE_DIM + ACTION_DIM + 1, n=3, gamma=gamma)
+    for i in range(4):
+        mem.store_transition([i], [i, i], i + 1, [i + 1])
+    # first two windows are complete, the last two wait for more steps
+    assert mem.pointer == 2
+    assert np.array_equal(mem.data[0], [0, 0, 0, 1 + gamma * 2 + gamma**2 * 3, 3])
+    assert np.array_equal(mem.data[1], [1, 1, 1, 2 + gamma * 3 + gamma**2 * 4, 4])
+    assert np.allclose(mem.discounts[:2], gamma**3)
+
+    mem.end_episode()
+    # windows cut short by the episode end bootstrap from the last state with a shorter discount
+    assert mem.pointer == 4
+    assert np.array_equal(mem.data[2], [2, 2, 2, 3 + gamma * 4, 4])
+    assert np.array_equal(mem.data[3], [3, 3, 3, 4, 4])
+    assert np.allclose(mem.discounts[2:4], [gamma**2, gamma])
+
+def test_load_all(tmpdir):
+    locations = [str(tmpdir.join("mem_a")), str(tmpdir.join("mem_b"))]
+    for i, location in enumerate(locations):
+        mem = memory.Memory(4, dims=2 * STATE_DIM + ACTION_DIM + 1)
+        for j in range(4):
+            mem.store_transition(i, [j, j], j, i + 1)
+        mem.save(location)
+
+    mem = memory.Memory(4, dims=2 * STATE_DIM + ACTION_DIM + 1)
+    mem.load_all(locations)
+    assert mem.capacity == 8
+    assert np.array_equal(mem.data[:, 0], [0] * 4 + [1] * 4)
+    # combined memory is full and can be sampled right away
+    assert len(mem.sample(3)) == 3
+
+def fill_episodes(mems, episodes, steps):
+    for e in range(episodes):
+        for t in range(steps):
+            s = [e + t / 10.0]
+            for mem in mems:
+                mem.store_transition(s, [t / 10.0, -t / 10.0], t, [e + (t + 1) / 10.0])
+        for mem in mems:
+            mem.end_episode()
+
+
+def test_compact_matches_memory():
+    # 4 episodes of 5 steps need 5 + 1 slots each
+    mem = memory.Memory(20, dims=2 * STATE_DIM + ACTION_DIM + 1)
+    compact = memory.CompactMemory(24, STATE_DIM, ACTION_DIM, dtype='float64')
+    fill_episodes([mem, compact], 4, 5)
+    rows = compact.sample(200)
+    stored = set(tuple(row) for row in mem.data)
+    assert all(tuple(row) in stored for row in rows)
+    # every transition, including each episode's last one, can be reconstructed
+    assert len(set(tuple(row) for row in rows)) == 20
+
+
+def test_compact_quantized_save_load(tmpdir):
+    compact = memory.CompactMemory(24, STATE_DIM, ACTION_DIM, dtype='int16', state_bound=10, action_bound=2.5)
+    fill_episodes([compact], 4, 5)
+    # last episode still waiting on its end
+    compact.store_transition([7.0], [0.1, 0.1], 1, [7.1])
+    location = str(tmpdir.join("compact"))
+    compact.save(location)
+
+    loaded = memory.CompactMemory(30, STATE_DIM, ACTION_DIM, dtype='int16', state_bound=10, action_bound=2.5)
+    loaded.load(location)
+    original = list(compact._transitions())
+    assert [row is None for row in loaded._transitions()][:len(original)] == [row is None for row in original]
+    for a, b in zip(original, loaded._transitions()):
+        if a is not None:
+            # int16 keeps values within half a quantization step
+            assert np.allclose(a, b, atol=10 / 32767.0)
+    assert loaded.nbytes() < memory.Memory(30, dims=2 * STATE_DIM + ACTION_DIM + 1).data.nbytes
@@ -0,0 +1,44 @@
+import threading
+import numpy as np
+import policy_server
+
+STATE_DIM = 4
+ACTION_DIM = 2
+
+
+def test_batched_answers_and_swap(tmpdir):
+    weights = {'w': np.ones((STATE_DIM, ACTION_DIM))}
+    socket_path = str(tmpdir.join('policy.sock'))
+    server = policy_server.PolicyServer(lambda states: states.dot(weights['w']), STATE_DIM, ACTION_DIM,
+                                        [-100, 100], socket_path, max_batch=8, max_wait=0.05)
+    server.start()
+    try:
+        results = {}
+
+        def worker(i):
+            client = policy_server.PolicyClient(socket_path, STATE_DIM, ACTION_DIM)
+            results[i] = client.choose_action(np.full(STATE_DIM, i, dtype=float))
+            client.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(8):
+            assert np.array_equal(results[i], [4 * i, 4 * i])
+        # batches are counted before their replies are sent, every answered request is in the stats
+        stats = server.stats()
+        assert stats['requests'] == 8
+        # concurrent requests were answered together
+        assert stats['batches'] < 8
+
+        def load():
+            weights['w'] = np.zeros((STATE_DIM, ACTION_DIM))
+        assert server.swap(load) == 1
+        client = policy_server.PolicyClient(socket_path, STATE_DIM, ACTION_DIM)
+        assert np.array_equal(client.choose_action(np.ones(STATE_DIM)), [0, 0])
+        assert client.version == 1
+        client.close()
+    finally:
+        server.stop()
@@ -0,0 +1,39 @@
+import numpy as np
+import metrics
+import scenarios
+
+
+def test_rotate_and_pool():
+    assert scenarios.rotate(["R", "R", "B", "exit"], 2) == ["B", "R", "R", "exit"]
+    pool = scenarios.make_pool(["circle"], offsets=4)
+    assert [scenario.name for scenario in pool] == ["circle@0", "circle@7", "circle@14", "circle@21"]
+    assert pool[1].path[:7] == ["B"] * 7 and pool[1].path[-1] == "exit"
+    # rotating a straight path gives the same path again
+    assert [scenario.name for scenario in scenarios.make_pool(["right", "back_and_forth"], offsets=2)] == \
+        ["right@0", "back_and_forth@0", "back_and_forth@10"]
+
+
+def test_scheduler_prefers_failing_scenarios(tmpdir):
+    location = str(tmpdir.join('metrics.jsonl'))
+    pool = scenarios.make_pool(["circle", "right"])
+    scheduler = scenarios.ScenarioScheduler(pool, metrics.MetricsLog(location), floor=0.1, seed=0)
+    counts = {"circle@0": 0, "right@0": 0}
+    rewards = []
+    for step in range(300):
+        scenario = scheduler.next(step)
+        counts[scenario.name] += 1
+        # the circle is always lost, the straight path always followed
+        failed = scenario.name == "circle@0"
+        reward = -float(step % 5) if failed else float(step % 3)
+        if failed:
+            rewards.append(reward)
+        scheduler.record(scenario, step, failed, reward, 10)
+    # the failing scenario gets most episodes, the mastered one still some
+    assert counts["circle@0"] > 5 * counts["right@0"] > 0
+    circle = pool[0]
+    assert circle.failures == circle.episodes == len(rewards)
+    assert np.isclose(circle.reward_mean, np.mean(rewards)) and np.isclose(circle.reward_std, np.std(rewards))
+
+    assert len(metrics.read(location, 'schedule')) == 300
+    last = metrics.read(location, 'scenario')[-1]
+    assert last['scenario'] == scenario.name and last['episodes'] == scenario.episodes
@@ -0,0 +1,37 @@
+import math
+import numpy as np
+import sensor_model
+from state_batch import StateBatch, STATE_DIM
+
+
+def test_front_sensor_distance():
+    # obstacle straight ahead, sensors 4 and 5 point 10 degrees either side of the heading
+    model = sensor_model.SensorModel([(1.0, 0.0, 0.2)])
+    readings = model.read(0.0, 0.0, 0.0)
+    assert readings.shape == (1, sensor_model.NUM_SENSORS)
+    assert 0.6 < readings[0, 3] < 0.7 and abs(readings[0, 3] - readings[0, 4]) < 1e-9
+    # nothing behind the robot
+    assert np.all(readings[0, 8:] == 0)
+    # turned around the rear sensors see it instead
+    assert np.all(model.read(0.0, 0.0, math.pi)[0, :8] == 0)
+
+
+def test_grid_matches_brute_force():
+    rng = np.random.RandomState(0)
+    obstacles = np.column_stack((rng.uniform(-5, 5, 60), rng.uniform(-5, 5, 60), rng.uniform(0.05, 0.4, 60)))
+    # a single cell holding every obstacle tests them all against every ray
+    brute = sensor_model.SensorModel(obstacles, cell_size=100.0)
+    grid = sensor_model.SensorModel(obstacles, cell_size=0.3)
+    x, y, yaw = rng.uniform(-5, 5, 200), rng.uniform(-5, 5, 200), rng.uniform(-math.pi, math.pi, 200)
+    expected = brute.read(x, y, yaw)
+    assert np.count_nonzero(expected) > 100
+    assert np.allclose(grid.read(x, y, yaw), expected)
+
+
+def test_sensor_state_is_view():
+    batch = StateBatch.empty(2, num_sensors=sensor_model.NUM_SENSORS)
+    batch.row(1).fill(1.0, 0.0, 0.5, 0.0, 0.0, np.arange(sensor_model.NUM_SENSORS))
+    s = batch.row(1).to_array(include_sensors=True)
+    assert np.shares_memory(s, batch.data)
+    assert np.array_equal(s, list(range(sensor_model.NUM_SENSORS)) + [1.0, 0.0, 0.5, 0.0])
+    assert batch.to_array(include_sensors=True).shape == (2, sensor_model.NUM_SENSORS + STATE_DIM)
@@ -0,0 +1,34 @@
+import math
+import numpy as np
+import rewards
+from state_batch import StateBatch
+
+
+def test_derived_columns():
+    batch = StateBatch.from_arrays([3.0, 0.0], [4.0, 1.0], [0.1, 0.2])
+    assert np.allclose(batch.dist(), [5.0, 1.0])
+    assert np.allclose(batch.relative_orientation(), [math.atan2(4, 3), math.pi / 2])
+
+
+def test_row_is_view():
+    batch = StateBatch.empty(3, num_sensors=16)
+    row = batch.row(1)
+    row.fill(1.0, 1.0, 0.5, 1.0, 2.0, np.arange(16))
+    # single state accessors are scalars, and the batch sees the write
+    assert row.dist() == math.sqrt(2)
+    assert batch.dist()[1] == math.sqrt(2)
+    assert batch.sensor_readings[1, 15] == 15
+    # network input is a view, not a copy
+    assert np.shares_memory(row.to_array(), batch.data)
+    assert np.array_equal(row.to_array(), [1.0, 1.0, 0.5, math.pi / 4])
+
+
+def test_vectorized_rewards_match_scalar():
+    rng = np.random.RandomState(0)
+    n = 200
+    orig = StateBatch.from_arrays(rng.uniform(-2, 2, n), rng.uniform(-2, 2, n), rng.uniform(-math.pi, math.pi, n))
+    new = StateBatch.from_arrays(rng.uniform(-2, 2, n), rng.uniform(-2, 2, n), rng.uniform(-math.pi, math.pi, n))
+    for calculator in [rewards.default(1), rewards.graduated(1)]:
+        batched = calculator.calculate_rewards(orig, new)
+        for i in range(n):
+            assert batched[i] == calculator.calculate_reward(orig.row(i), new.row(i))
@@ -0,0 +1,54 @@
+import numpy as np
+import memory
+import rewards
+import trajectory
+from state_batch import StateBatch, STATE_DIM
+
+ACTION_DIM = 2
+
+
+def record_episode(recorder, xdists):
+    recorder.record_path(["R"] * len(xdists) + ["exit"])
+    states = StateBatch.from_arrays(xdists, [0.0] * len(xdists), [0.0] * len(xdists),
+                                    sensor_readings=np.zeros((len(xdists), 16)))
+    recorder.begin_episode(states.row(0), [0.0] * 6)
+    for i in range(1, len(xdists)):
+        recorder.record_target(i, (i * 0.1, 0.0, 0.0), False)
+        recorder.record_step([i, -i], states.row(i), float(i), i == len(xdists) - 1, [i, 0, 0, 0, 0, 0])
+
+
+def test_record_and_replay(tmpdir):
+    recorder = trajectory.TrajectoryRecorder(str(tmpdir), [-2.5, 2.5])
+    record_episode(recorder, [2.0, 1.5, 1.2, 1.0])
+    record_episode(recorder, [3.0, 2.0])
+    recorder.close()
+    assert len(trajectory.episode_files(str(tmpdir))) == 2
+
+    env = trajectory.ReplayEnv(str(tmpdir), loop=False)
+    assert env.action_bound == [-2.5, 2.5]
+    s = env.reset()
+    assert np.allclose(s, [2.0, 0, 0, 0])
+    steps = 0
+    while True:
+        assert np.array_equal(env.recorded_action(), [steps + 1, -steps - 1])
+        s, r, done = env.step(None)
+        steps += 1
+        assert r == steps
+        if done:
+            break
+    assert steps == 3
+    assert np.allclose(s, [1.0, 0, 0, 0])
+    env.reset()
+    assert len(env.episode['actions']) == 1
+
+
+def test_rereward_to_memory(tmpdir):
+    recorder = trajectory.TrajectoryRecorder(str(tmpdir), [-2.5, 2.5])
+    record_episode(recorder, [2.0, 1.5, 1.2, 1.0])
+    recorder.close()
+
+    mem = memory.Memory(10, dims=2 * STATE_DIM + ACTION_DIM + 1)
+    calculator = rewards.graduated(1)
+    assert trajectory.to_memory(str(tmpdir), mem, calculator) == 3
+    # 1.5 is outside every distance band, 1.2 and 1.0 are in the 0.25 and 1.0 bands
+    assert np.array_equal(mem.data[:3, STATE_DIM + ACTION_DIM], [-1, 1.25, 2])
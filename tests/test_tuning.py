@@ -0,0 +1,71 @@
+import json
+import pytest
+import tuning
+
+
+def measurement(intra, inter, latency_ms, samples_per_s):
+    return {'intra_op_threads': intra, 'inter_op_threads': inter, 'latency_ms': latency_ms,
+            'samples_per_s': samples_per_s}
+
+
+def test_parse_cpus_and_settings():
+    assert tuning.parse_cpus('0-3,6') == [0, 1, 2, 3, 6]
+    assert tuning.parse_cpus('5,2') == [2, 5]
+    assert tuning.thread_settings(1) == [(1, 1)]
+    assert tuning.thread_settings(6) == [(1, 1), (1, 2), (2, 1), (2, 2), (4, 1), (4, 2), (6, 1), (6, 2)]
+
+
+def test_choose_prefers_fewer_threads_and_the_knee_batch():
+    measurements = [
+        measurement(1, 1, 0.3, {32: 2000.0, 64: 3000.0, 128: 3500.0}),
+        # within 5% of the fastest with fewer threads
+        measurement(2, 1, 0.4, {32: 3000.0, 64: 5800.0, 128: 6300.0}),
+        measurement(8, 2, 0.2, {32: 3200.0, 64: 6000.0, 128: 9000.0}),
+    ]
+    chosen = tuning.choose(measurements)
+    # 64 reaches 90% of the best samples/s of the 2 thread setting
+    assert chosen == {'intra_op_threads': 2, 'inter_op_threads': 1, 'batch_size': 64}
+    assert tuning.choose(measurements, tolerance=0.0) == {'intra_op_threads': 8, 'inter_op_threads': 2,
+                                                          'batch_size': 128}
+
+
+def test_profile_round_trip(tmpdir):
+    location = str(tmpdir.join('profiles', 'tf_profile.json'))
+    assert tuning.load_profile(location) is None
+    measurements = [measurement(2, 1, 0.4, {32: 3000.0, 64: 5800.0})]
+    chosen = tuning.choose(measurements)
+    tuning.save_profile(location, chosen, measurements, [0, 1])
+    profile = tuning.load_profile(location)
+    assert profile['batch_size'] == chosen['batch_size'] and profile['cpus'] == [0, 1]
+    assert profile['measurements'][0]['samples_per_s'] == {'32': 3000.0, '64': 5800.0}
+    assert tuning.session_kwargs(profile) == {'intra_op_parallelism_threads': 2, 'inter_op_parallelism_threads': 1}
+    # pinned to fewer cores than the profile was tuned for
+    assert tuning.session_kwargs(profile, cores=1) == {'intra_op_parallelism_threads': 1,
+                                                       'inter_op_parallelism_threads': 1}
+    assert tuning.session_kwargs(None) == {}
+    profile['version'] = tuning.PROFILE_VERSION + 1
+    with open(location, 'w') as file_handle:
+        json.dump(profile, file_handle)
+    with pytest.raises(Exception):
+        tuning.load_profile(location)
+
+
+def test_measurements():
+    calls = []
+    assert tuning.latency(lambda: calls.append(1), calls=20, warmup=2) >= 0
+    assert len(calls) == 22
+    assert tuning.rate(lambda: None, seconds=0.05) > 0
+
+
+def test_spread_and_child_threads():
+    same = [measurement(1, 1, 0.3, {64: 3000.0}), measurement(4, 2, 0.3, {64: 3030.0})]
+    assert tuning.spread(same) < 1 + tuning.TOLERANCE
+    assert tuning.spread([measurement(1, 1, 0.3, {64: 3000.0}), measurement(4, 2, 0.2, {64: 6000.0})]) == 2.0
+
+    assert tuning.inherited_threads() is None
+    with tuning.child_threads(4, 2):
+        assert tuning.inherited_threads() == (4, 2)
+        # a parent's sizes win over the profile's
+        assert tuning.session_kwargs({'intra_op_threads': 8, 'inter_op_threads': 1}) == \
+            {'intra_op_parallelism_threads': 4, 'inter_op_parallelism_threads': 2}
+    assert tuning.inherited_threads() is None
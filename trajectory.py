@@ -0,0 +1,234 @@
+""" module for recording episode trajectories and replaying them offline
+
+Each episode is written as one compressed npz file of columns.  Row i of the per-state columns is the
+state after i steps (row 0 is the state reset() returned), row i of the per-step columns is step i:
+
+    per state:  states (NUM_FIELDS), sensors, robot_pose (x, y, z, alpha, beta, gamma), target_pose (x, y, z),
+                target_index, time
+    per step:   actions, rewards, dones, mover_dones
+    meta:       path, action_bound
+"""
+import glob
+import os
+import time
+import numpy as np
+from state_batch import StateBatch, STATE_DIM
+
+
+class TrajectoryRecorder(object):
+    """ collects the columns of the running episode and writes them out when the next one starts """
+
+    def __init__(self, directory, action_bound):
+        """ params: directory - folder the episode_NNNNN.npz files are written to, created if missing
+                    action_bound - [min, max] action, stored with every episode for the replay env
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.action_bound = action_bound
+        self.episode = len(glob.glob(os.path.join(directory, 'episode_*.npz')))
+        self.path = []
+        self._columns = None
+        # target position and path index from the last TargetMover.step, reset by begin_episode
+        self._target_pose = [np.nan] * 3
+        self._target_index = 0
+        self._mover_done = False
+
+    def record_path(self, path):
+        """ called by TargetMover.reset with the path of the coming episode """
+        self.path = list(path)
+        self._target_index = 0
+
+    def record_target(self, index, pos, done):
+        """ called by TargetMover.step, the values are attached to the next recorded state """
+        self._target_index = index
+        self._mover_done = done
+        if pos is not None:
+            self._target_pose = list(pos)
+
+    def begin_episode(self, state, robot_pose, target_pos=None):
+        """ called by VREP_Env.reset, writes out the previous episode
+
+            The reset runs before TargetMover.reset, so the target's place in the path is set back here.
+
+            params: state - single state StateBatch the reset returned
+                    robot_pose - absolute (x, y, z, alpha, beta, gamma) of the robot
+                    target_pos - absolute (x, y, z) the target was reset to, NaN if unknown
+        """
+        self.end_episode()
+        self._target_index = 0
+        self._target_pose = [np.nan] * 3 if target_pos is None else list(target_pos)
+        self._columns = {'states': [], 'sensors': [], 'robot_pose': [], 'target_pose': [], 'target_index': [],
+                         'time': [], 'actions': [], 'rewards': [], 'dones': [], 'mover_dones': []}
+        self._mover_done = False
+        self._record_state(state, robot_pose)
+
+    def record_step(self, action, state, reward, done, robot_pose):
+        """ called by VREP_Env.step with the action taken and what it led to """
+        if self._columns is None:
+            return
+        self._columns['actions'].append(np.array(action, dtype=np.float32))
+        self._columns['rewards'].append(reward)
+        self._columns['dones'].append(done)
+        self._columns['mover_dones'].append(self._mover_done)
+        self._record_state(state, robot_pose)
+
+    def end_episode(self):
+        """ write the running episode, if it took any steps """
+        columns = self._columns
+        self._columns = None
+        if columns is None or not columns['actions']:
+            return None
+        location = os.path.join(self.directory, 'episode_%05d.npz' % self.episode)
+        np.savez_compressed(location,
+                            states=np.array(columns['states'], dtype=np.float32),
+                            sensors=np.array(columns['sensors'], dtype=np.float32),
+                            robot_pose=np.array(columns['robot_pose'], dtype=np.float32),
+                            target_pose=np.array(columns['target_pose'], dtype=np.float32),
+                            target_index=np.array(columns['target_index'], dtype=np.int16),
+                            time=np.array(columns['time']),
+                            actions=np.array(columns['actions'], dtype=np.float32),
+                            rewards=np.array(columns['rewards'], dtype=np.float32),
+                            dones=np.array(columns['dones'], dtype=bool),
+                            mover_dones=np.array(columns['mover_dones'], dtype=bool),
+                            path=np.array(self.path, dtype=str),
+                            action_bound=np.array(self.action_bound, dtype=np.float32))
+        self.episode += 1
+        return location
+
+    def close(self):
+        self.end_episode()
+
+    def _record_state(self, state, robot_pose):
+        self._columns['states'].append(np.array(state.data, dtype=np.float32))
+        self._columns['sensors'].append(np.array(state.sensor_readings, dtype=np.float32))
+        self._columns['robot_pose'].append(np.array(robot_pose, dtype=np.float32))
+        self._columns['target_pose'].append(np.array(self._target_pose, dtype=np.float32))
+        self._columns['target_index'].append(self._target_index)
+        self._columns['time'].append(time.time())
+
+
+def episode_files(directory):
+    """ recorded episode files in the order they were written """
+    return sorted(glob.glob(os.path.join(directory, 'episode_*.npz')))
+
+
+def load_episode(location):
+    """ load a recorded episode
+
+        returns: dict of column name to array
+    """
+    with np.load(location) as episode:
+        return dict(episode)
+
+
+def episode_states(episode):
+    """ the recorded states of an episode as a StateBatch with one row per state """
+    return StateBatch(episode['states'].astype(float), episode['sensors'].astype(float))
+
+
+def rewards_for(episode, rewarder=None):
+    """ per step rewards of an episode, recalculated with the rewarder if one is given
+
+        A recording made with action_repeat > 1 only has the state at the end of every step, so recalculated
+        rewards compare those states and not the intermediate ticks.
+    """
+    if rewarder is None:
+        return episode['rewards'].astype(float)
+    states = episode_states(episode)
+    return rewarder.calculate_rewards(StateBatch(states.data[:-1]), StateBatch(states.data[1:]))
+
+
+def to_memory(directory, mem, rewarder=None):
+    """ fill a memory with the recorded transitions, optionally re-rewarded
+
+        params: directory - folder of recorded episodes
+                mem - memory.Memory (or subclass) to store the transitions into
+                rewarder - optional rewards.RewardCalculator to recalculate the rewards with
+
+        returns: number of transitions stored
+    """
+    count = 0
+    for location in episode_files(directory):
+        episode = load_episode(location)
+        s = episode['states'][:, :STATE_DIM]
+        for i, r in enumerate(rewards_for(episode, rewarder)):
+            mem.store_transition(s[i], episode['actions'][i], r, s[i + 1])
+        mem.end_episode()
+        count += len(episode['actions'])
+    return count
+
+
+class ReplayEnv(object):
+    """ serves recorded episodes back through the VREP_Env api
+
+        Episodes are replayed deterministically in recording order, the actions handed to step are ignored
+        and the recorded ones are available from recorded_action().  The matching ReplayMover reports the
+        end of the recorded path.
+    """
+
+    def __init__(self, directory, rewarder=None, loop=True):
+        """ params: directory - folder of recorded episodes
+                    rewarder - optional rewards.RewardCalculator to recalculate the rewards with
+                    loop - start over at the first episode after the last one
+        """
+        self.files = episode_files(directory)
+        if not self.files:
+            raise Exception('No recorded episodes in ' + directory)
+        self.rewarder = rewarder
+        self.loop = loop
+        first = load_episode(self.files[0])
+        self.state_dim = STATE_DIM
+        self.action_dim = first['actions'].shape[1]
+        self.action_bound = list(first['action_bound'])
+        self._next_file = 0
+        self.episode = None
+        self._t = 0
+
+    def reset(self):
+        """ move on to the next recorded episode
+
+            retruns: the recorded state after reset
+        """
+        if self._next_file == len(self.files):
+            if not self.loop:
+                raise StopIteration('All recorded episodes replayed')
+            self._next_file = 0
+        self.episode = load_episode(self.files[self._next_file])
+        self.episode['rewards'] = rewards_for(self.episode, self.rewarder)
+        self._next_file += 1
+        self._t = 0
+        return self.episode['states'][0, :STATE_DIM]
+
+    def recorded_action(self):
+        """ the action that was taken at the current step """
+        return self.episode['actions'][self._t]
+
+    def step(self, actions=None, before_tick=None):
+        """ replay the recorded step, actions are ignored
+
+            returns: (state, reward, done), done is also set once the recording runs out
+        """
+        t = self._t
+        self._t += 1
+        done = bool(self.episode['dones'][t]) or self._t == len(self.episode['actions'])
+        return (self.episode['states'][t + 1, :STATE_DIM], self.episode['rewards'][t], done)
+
+    def stop(self):
+        return
+
+
+class ReplayMover(object):
+    """ stands in for TargetMover next to a ReplayEnv """
+
+    def __init__(self, replay_env):
+        self.env = replay_env
+
+    def step(self):
+        """ returns: if the recorded movement was over at this step """
+        if self.env._t >= len(self.env.episode['mover_dones']):
+            return True
+        return bool(self.env.episode['mover_dones'][self.env._t])
+
+    def reset(self):
+        return
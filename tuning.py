@@ -0,0 +1,204 @@
+""" module for tuning the tensorflow thread pools and the minibatch size to the machine
+
+--mode autotune measures the actor's single state latency and the samples/s of learning steps for every
+thread pool setting and batch size, picks a configuration and writes it to a profile.  ddpg.py loads the
+profile at import, before it builds the session, and can pin the process to a set of cores so several runs
+sharing a host do not fight over them.
+"""
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import time
+import numpy as np
+
+
+# format of the profile files, bumped when their layout changes
+PROFILE_VERSION = 1
+BATCH_SIZES = (32, 64, 128, 256)
+REFERENCE_BATCH = 64
+# relative difference in samples/s below which thread settings count as equally fast
+TOLERANCE = 0.05
+# "intra,inter" thread pool sizes a parent process hands the processes it starts, see child_threads
+THREADS_VARIABLE = 'LEARN_TO_FOLLOW_THREADS'
+
+
+def default_profile_path():
+    """ one profile per host, in the user's home """
+    return os.path.join(os.path.expanduser('~'), '.learn_to_follow', 'tf_profile_%s.json' % socket.gethostname())
+
+
+def parse_cpus(text):
+    """ core set from a list like '0-3,6'
+
+        returns: sorted list of core ids
+    """
+    cpus = set()
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def available_cpus():
+    """ cores this process may run on """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def pin(cpus):
+    """ restrict this process, and the threads it starts from now on, to the given cores """
+    if not hasattr(os, 'sched_setaffinity'):
+        print("Core pinning is not supported on this platform, running on all cores")
+        return
+    os.sched_setaffinity(0, cpus)
+
+
+def thread_settings(cores):
+    """ (intra op, inter op) thread pool sizes worth trying on this many cores """
+    intra = sorted(set([2 ** i for i in range(int(np.log2(cores)) + 1)] + [cores]))
+    return [(threads, inter) for threads in intra for inter in (1, 2) if inter <= cores]
+
+
+@contextlib.contextmanager
+def child_threads(intra, inter):
+    """ thread pools of the processes started within, e.g. spawned learners
+
+        Tensorflow sizes its thread pools once per process, from the first session, and ddpg.py builds that
+        session at import.  A session configured later gets the same pools, so the sizes travel in the
+        environment the child processes are started with and ddpg.py reads them before building its session.
+    """
+    previous = os.environ.get(THREADS_VARIABLE)
+    os.environ[THREADS_VARIABLE] = '%d,%d' % (intra, inter)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ[THREADS_VARIABLE]
+        else:
+            os.environ[THREADS_VARIABLE] = previous
+
+
+def inherited_threads():
+    """ (intra op, inter op) thread pool sizes set by child_threads in the parent process, None otherwise """
+    value = os.environ.get(THREADS_VARIABLE)
+    if not value:
+        return None
+    intra, inter = value.split(',')
+    return int(intra), int(inter)
+
+
+def session_kwargs(profile, cores=None):
+    """ tf.ConfigProto arguments of the first session of a process
+
+        The pool sizes the parent process set with child_threads come first, then the profile's, and without
+        either there are none so tensorflow picks its defaults.
+
+        params: cores - cores the run is pinned to, the profile's thread pools are capped at it
+    """
+    inherited = inherited_threads()
+    if inherited:
+        return {'intra_op_parallelism_threads': inherited[0], 'inter_op_parallelism_threads': inherited[1]}
+    if not profile:
+        return {}
+    cores = cores or profile['intra_op_threads']
+    return {'intra_op_parallelism_threads': min(profile['intra_op_threads'], cores),
+            'inter_op_parallelism_threads': min(profile['inter_op_threads'], cores)}
+
+
+def latency(call, calls=200, warmup=10):
+    """ median seconds per call """
+    for _ in range(warmup):
+        call()
+    times = np.zeros(calls)
+    for i in range(calls):
+        start = time.time()
+        call()
+        times[i] = time.time() - start
+    return float(np.median(times))
+
+
+def rate(call, seconds=1.0, warmup=3):
+    """ calls per second, calling for about the given wall clock time """
+    for _ in range(warmup):
+        call()
+    calls = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        call()
+        calls += 1
+    return calls / (time.time() - start)
+
+
+def spread(measurements, reference_batch=REFERENCE_BATCH):
+    """ fastest over slowest samples/s at reference_batch across the thread settings
+
+        Close to 1 means the settings made no difference to the measurements, e.g. because every one of them
+        ran on the same thread pools.
+    """
+    rates = [measurement['samples_per_s'][reference_batch] for measurement in measurements]
+    return max(rates) / min(rates)
+
+
+def choose(measurements, reference_batch=REFERENCE_BATCH, tolerance=TOLERANCE, knee=0.9):
+    """ pick a configuration from the autotune measurements
+
+        The thread setting is the one with the most learning samples/s at reference_batch, or, among those
+        within tolerance of it, the one using the fewest threads and then the one with the lowest latency,
+        which leaves cores to other runs on the host.  The batch size is the smallest one reaching knee of
+        that setting's best samples/s, as larger minibatches change learning and not only its speed.
+
+        params: measurements - list of dicts with intra_op_threads, inter_op_threads, latency_ms and
+                               samples_per_s, a dict of batch size to samples/s
+
+        returns: dict with intra_op_threads, inter_op_threads and batch_size
+    """
+    best = max(measurement['samples_per_s'][reference_batch] for measurement in measurements)
+    close = [measurement for measurement in measurements
+             if measurement['samples_per_s'][reference_batch] >= (1 - tolerance) * best]
+    chosen = min(close, key=lambda measurement: (measurement['intra_op_threads'] + measurement['inter_op_threads'],
+                                                 measurement['latency_ms']))
+    rates = chosen['samples_per_s']
+    batch_size = min(batch for batch in rates if rates[batch] >= knee * max(rates.values()))
+    return {'intra_op_threads': chosen['intra_op_threads'], 'inter_op_threads': chosen['inter_op_threads'],
+            'batch_size': batch_size}
+
+
+def save_profile(location, chosen, measurements, cpus):
+    """ write the chosen configuration with the measurements it was chosen from
+
+        params: cpus - cores the measurements ran on, only recorded, runs are pinned with --cpus
+    """
+    directory = os.path.dirname(location)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    profile = dict(chosen)
+    profile.update({'version': PROFILE_VERSION, 'host': socket.gethostname(), 'created': time.time(),
+                    'cpus': cpus, 'cpu_count': multiprocessing.cpu_count(),
+                    # json keys are strings
+                    'measurements': [dict(measurement, samples_per_s=dict((str(batch), value) for batch, value
+                                                                          in measurement['samples_per_s'].items()))
+                                     for measurement in measurements]})
+    with open(location, 'w') as file_handle:
+        json.dump(profile, file_handle, indent=2, sort_keys=True)
+    return location
+
+
+def load_profile(location):
+    """ the profile at location, None if there is none
+
+        returns: dict with intra_op_threads, inter_op_threads and batch_size, plus what save_profile recorded
+    """
+    if not os.path.exists(location):
+        return None
+    with open(location) as file_handle:
+        profile = json.load(file_handle)
+    if profile.get('version') != PROFILE_VERSION:
+        raise Exception('%s is profile version %s, expected %d, rerun --mode autotune' %
+                        (location, profile.get('version'), PROFILE_VERSION))
+    return profile
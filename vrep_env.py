@@ -9,13 +9,21 @@ import vrep
 import numpy as np
 import time
 import rewards
+import kinematics
+from state_batch import StateBatch
+from target_mover import TargetMover, DONE
 
-def setup_vrep():
+def setup_vrep(port=19999, exclusive=True):
     """ sets up and connects to the vrep server
+
+        params: port - remote api port of the vrep instance
+                exclusive - close all other connections of this process first
+
         returns: client_id - the client_id for interacting with vrep
     """
-    vrep.simxFinish(-1) # just in case, close all opened connections
-    client_id = vrep.simxStart('127.0.0.1', 19999, True, True, 5000, 5) # Connect to V-REP
+    if exclusive:
+        vrep.simxFinish(-1) # just in case, close all opened connections
+    client_id = vrep.simxStart('127.0.0.1', port, True, True, 5000, 5) # Connect to V-REP
 
     if client_id != -1:
         print ('Connected to remote API server')
@@ -38,32 +46,40 @@ def get_handle(client_id, handle_name):
                                     vrep.simx_opmode_oneshot_wait)
 
 
-def get_sensor_handles(client_id, base_name, num_sensors):
+def pair_suffix(pair):
+    """ name suffix of the pair-th copy of an object, vrep names pasted copies name, name#0, name#1, ... """
+    return '' if pair == 0 else '#%d' % (pair - 1)
+
+
+def get_sensor_handles(client_id, base_name, num_sensors, suffix=''):
     """ get list of sensor handles with names that start with base
 
         params: client_id - to connect to vrep server with
                 base_name - base of object sensor name
                 num_sensors - number of sensors that start with this base name
+                suffix - copy suffix of the robot the sensors belong to, see pair_suffix
 
         returns: usensors - list of sensor handles for sensors 1 to N
    """
     usensors = [-1] * num_sensors
-    for i in range(1, num_sensors):
-        _, usensors[i] = vrep.simxGetObjectHandle(client_id, base_name + str(i),
+    for i in range(num_sensors):
+        _, usensors[i] = vrep.simxGetObjectHandle(client_id, base_name + str(i + 1) + suffix,
                                                   vrep.simx_opmode_oneshot_wait)
     return usensors
 
 
-def read_sensors(client_id, usensors):
+def read_sensors(client_id, usensors, readings=None):
     """ reads the distance measured by each sensor
 
         params: client_id - to connect to vrep server with
                 usensors - list of sensor handles
+                readings - optional preallocated buffer to fill in place
 
         returns: readings - list of sensor distance readings
     """
-    readings = [0] * len(usensors)
-    for i in range(0, len(usensors) - 1):
+    if readings is None:
+        readings = [0] * len(usensors)
+    for i in range(len(usensors)):
         (_, _, detected_point, _, _) = vrep.simxReadProximitySensor(client_id, usensors[i],
                                                                     vrep.simx_opmode_oneshot_wait)
         dist = math.sqrt(detected_point[0]**2 + detected_point[1]**2 + detected_point[2]**2)
@@ -71,7 +87,7 @@ def read_sensors(client_id, usensors):
     return readings
 
 
-def read_state(client_id, target_handle, ref_frame, vleft, vright, usensors):
+def read_state(client_id, target_handle, ref_frame, vleft, vright, usensors, out=None):
     """ reads the distance measured by each sensor
 
         params: client_id - to connect to vrep server with
@@ -80,15 +96,29 @@ def read_state(client_id, target_handle, ref_frame, vleft, vright, usensors):
                 vleft - current left motor velocity
                 vright - current right motor velocity
                 usensors - list of sensor handles
+                out - optional single state StateBatch to fill in place instead of allocating a State
 
         returns: state - current state of the robot
     """
     _, pos = vrep.simxGetObjectPosition(client_id, target_handle, ref_frame, vrep.simx_opmode_oneshot_wait)
     _, orient = vrep.simxGetObjectOrientation (client_id, ref_frame, target_handle, vrep.simx_opmode_oneshot_wait)
-    
+
+    if out is not None:
+        read_sensors(client_id, usensors, out.sensor_readings)
+        return out.fill(pos[0], pos[1], orient[2], vleft, vright)
     return State(pos[0], pos[1], orient[2], vleft, vright, read_sensors(client_id, usensors))
 
 
+def read_pose(client_id, handle):
+    """ reads the absolute position and orientation of an object
+
+        returns: pose - list of [ x, y, z, alpha, beta, gamma ]
+    """
+    _, pos = vrep.simxGetObjectPosition(client_id, handle, -1, vrep.simx_opmode_oneshot_wait)
+    _, orient = vrep.simxGetObjectOrientation(client_id, handle, -1, vrep.simx_opmode_oneshot_wait)
+    return list(pos) + list(orient)
+
+
 def calculate_distance(pos):
     """ calculates the distance from the current measured position
 
@@ -101,6 +131,8 @@ def calculate_distance(pos):
 
 class State(object):
     """ for storing the state elements of the robot """
+    __slots__ = ('xdist', 'ydist', 'theta', 'vleft', 'vright', 'sensor_readings')
+
     def __init__(self, xdist, ydist, theta, vleft, vright, sensor_readings=None):
         """ constructs the state object
 
@@ -155,24 +187,57 @@ class Reset(object):
         self.handle = handle
         self.pos = pos
         self.orient = orient
-        
+
+
+class Snapshot(object):
+    """ for storing everything VREP_Env.restore needs to put the environment back """
+    def __init__(self, robot, target, vleft, vright, mover_index=0, path=None, increment=0.1):
+        """ params: robot, target - Reset objects with the absolute poses
+                    vleft, vright - commanded motor velocities, the velocities the robot has reached are not
+                                    part of a snapshot, see VREP_Env.restore
+                    mover_index - TargetMover position in its path
+                    path, increment - the TargetMover path, for forks to keep moving the target
+        """
+        self.robot = robot
+        self.target = target
+        self.vleft = vleft
+        self.vright = vright
+        self.mover_index = mover_index
+        self.path = path
+        self.increment = increment
+
 
 class VREP_Env(object):
     """ Class for encapsulating a vrep environment """
-    # x distance, y distance, orientation, relative orientation, +16 distance sensors
+    # x distance, y distance, orientation, relative orientation
     state_dim = 4
+    # the same preceded by the 16 distance sensors, see include_sensors
+    sensor_state_dim = 4 + 16
     # left motor velocity and right motor velocity
     action_dim = 2
     # max min velocity change?
     action_bound = [-2.5, 2.5]
+    # number of preallocated state rows get_state cycles through, see get_state
+    state_ring_size = 3
 
-    def __init__(self, rewarder, vleft=0, vright=0, goal_distance=1, max_delta=1, sleep_time=0.1):
+    def __init__(self, rewarder, vleft=0, vright=0, goal_distance=1, max_delta=1, sleep_time=0.1, action_repeat=1,
+                 recorder=None, include_sensors=False, pipelined=False, port=19999, exclusive=True):
         """ initialize the vrep evironment
 
             params: vleft - initial left motor velocity
                     vright - initial right motor velocity
+                    action_repeat - number of control ticks (of sleep_time each) one step's action is held for
+                    recorder - optional trajectory.TrajectoryRecorder that reset and step report to
+                    include_sensors - return the ultrasonic sensor readings as part of the state,
+                                      state_dim becomes sensor_state_dim
+                    pipelined - send the motor commands (and a target move) as one non blocking message and
+                                reuse the state a step ends with as the state the next step starts from,
+                                see step_async
+                    port - remote api port of the vrep instance
+                    exclusive - close the process's other vrep connections, False for a second environment
+                                next to the training one, e.g. for evaluation
         """
-        self.client_id = setup_vrep()
+        self.client_id = setup_vrep(port, exclusive)
 
         _, self.target_handle = get_handle(self.client_id, 'Sphere')
         self._load_robot_handles()
@@ -182,49 +247,205 @@ class VREP_Env(object):
         self.goal_distance = goal_distance
         self.max_delta = max_delta
         self.sleep_time = sleep_time
+        self.action_repeat = action_repeat
+        self.recorder = recorder
+        self.include_sensors = include_sensors
+        self.pipelined = pipelined
+        # the state the last step or reset ended with, the next pipelined step starts from it
+        self._last_state = None
+        self._orig_state = None
+        self._sent_at = 0.0
+        if include_sensors:
+            self.state_dim = self.sensor_state_dim
+        # a step reads 1 + action_repeat states, none of which may land on the one the caller still holds
+        self.state_ring_size = action_repeat + 2
         self.target_reset = get_reset(self.client_id, self.target_handle)
+        self._states = StateBatch.empty(self.state_ring_size, len(self.usensors))
+        self._state_rows = [self._states.row(i) for i in range(self.state_ring_size)]
+        self._state_index = 0
 
     def get_state(self):
         """ gets the current state of the environment
 
-            returns: State - of current environment
+            States are read into a small ring of preallocated rows instead of allocating per call.  A
+            returned state (and the to_array() view of it) stays valid until get_state has been called
+            state_ring_size more times, which covers the state a caller holds across one step().
+            Use copy() to keep a state longer.
+
+            returns: StateBatch - single state view of current environment
         """
-        return read_state(self.client_id, self.target_handle, self.ref_frame, self.vleft, self.vright, self.usensors)
+        self._state_index = (self._state_index + 1) % self.state_ring_size
+        return read_state(self.client_id, self.target_handle, self.ref_frame, self.vleft, self.vright, self.usensors,
+                          out=self._state_rows[self._state_index])
 
-    def step(self, actions):
-        """ take an action
+    def step(self, actions, before_tick=None):
+        """ take an action and hold it for action_repeat control ticks
 
             params: action[0] = vleft - left motor velocity
                     action[1] = vright - right motor velocity
+                    before_tick - optional callable run before every tick after the first, e.g. TargetMover.step,
+                                  returning True ends the step early and reports it as done
+
+            returns: (state, reward summed over the ticks, done)
+        """
+        self.step_async(actions)
+        return self.step_wait(before_tick)
 
-            returns: (state, reward)
+    def step_async(self, actions, move_target=None):
+        """ first half of step(), sends the action and returns without waiting for the simulator
+
+            In pipelined mode both motor commands and whatever move_target sends (e.g. a TargetMover created
+            with pipelined=True) are held back with simxPauseCommunication and go out as one oneshot message,
+            and the starting state is the one the previous step ended with instead of a fresh read.  Work done
+            before step_wait, e.g. a learning step, overlaps with the simulator advancing.
+
+            params: actions - [vleft, vright]
+                    move_target - optional callable sent with the action, e.g. TargetMover.step
+
+            returns: what move_target returned, None without one
         """
-        orig_state = self.get_state()
+        if self.pipelined and self._last_state is not None:
+            self._orig_state = self._last_state
+        else:
+            self._orig_state = self.get_state()
         self.vleft = actions[0]
         self.vright = actions[1]
-        vrep.simxSetJointTargetVelocity(self.client_id, self.motor_left, self.vleft, vrep.simx_opmode_oneshot_wait)
-        vrep.simxSetJointTargetVelocity(self.client_id, self.motor_right, self.vright, vrep.simx_opmode_oneshot_wait)
-        time.sleep(self.sleep_time)
-        new_state = self.get_state()
-        return (new_state.to_array(), self.rewarder.calculate_reward(orig_state, new_state), self._is_done(new_state))
-        
+        self._actions = actions
+        moved = None
+        if self.pipelined:
+            vrep.simxPauseCommunication(self.client_id, True)
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motor_left, self.vleft, vrep.simx_opmode_oneshot)
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motor_right, self.vright, vrep.simx_opmode_oneshot)
+            if move_target is not None:
+                moved = move_target()
+            vrep.simxPauseCommunication(self.client_id, False)
+        else:
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motor_left, self.vleft,
+                                            vrep.simx_opmode_oneshot_wait)
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motor_right, self.vright,
+                                            vrep.simx_opmode_oneshot_wait)
+            if move_target is not None:
+                moved = move_target()
+        self._sent_at = time.time()
+        return moved
+
+    def step_wait(self, before_tick=None):
+        """ second half of step(), waits out the ticks of the action sent by step_async
+
+            In pipelined mode the time spent since step_async counts towards the first tick.
+
+            returns: (state, reward summed over the ticks, done)
+        """
+        orig_state = self._orig_state
+        tick_start = self._sent_at
+        reward = 0
+        done = False
+        for tick in range(self.action_repeat):
+            if tick > 0 and before_tick is not None and before_tick():
+                done = True
+                break
+            if self.pipelined:
+                time.sleep(max(0.0, self.sleep_time - (time.time() - tick_start)))
+            else:
+                time.sleep(self.sleep_time)
+            new_state = self.get_state()
+            tick_start = time.time()
+            reward += self.rewarder.calculate_reward(orig_state, new_state)
+            if self._is_done(new_state):
+                done = True
+                break
+            orig_state = new_state
+        self._last_state = new_state
+        if self.recorder is not None:
+            self.recorder.record_step(self._actions, new_state, reward, done,
+                                      read_pose(self.client_id, self.ref_frame))
+        return (new_state.to_array(self.include_sensors), reward, done)
+
     def reset(self):
         """ reset the state 
 
             retruns: the current state after reset
         """
         reset_object(self.client_id, self.target_reset)
-        vrep.simxRemoveModel(self.client_id, self.ref_frame, vrep.simx_opmode_oneshot_wait)
-        vrep.simxLoadModel(self.client_id, "/home/user/V-REP/models/robots/mobile/pioneer_p3dx_script_disabled.ttm",
-                           1, vrep.simx_opmode_oneshot_wait)
-        self._load_robot_handles()
+        self._reload_robot()
         self.vleft = 0
         self.vright = 0
+
+        state = self.get_state()
+        self._last_state = state
+        if self.recorder is not None:
+            self.recorder.begin_episode(state, read_pose(self.client_id, self.ref_frame), self.target_reset.pos)
+        return state.to_array(self.include_sensors)
         
-        return self.get_state().to_array()
-        
+    def snapshot(self, mover=None):
+        """ capture the robot and target poses, motor velocities and the mover's place in its path
+
+            params: mover - optional TargetMover driving the target
+
+            returns: Snapshot - to pass to restore() or fork()
+        """
+        snapshot = Snapshot(get_reset(self.client_id, self.ref_frame), get_reset(self.client_id, self.target_handle),
+                            self.vleft, self.vright)
+        if mover is not None:
+            snapshot.mover_index = mover._index
+            snapshot.path = mover.path
+            snapshot.increment = mover.increment
+        return snapshot
+
+    def restore(self, snapshot, mover=None):
+        """ put the environment back to a snapshot, the poses and motor commands in one message
+
+            The remote api cannot set the velocities the physics engine has for the robot's body and wheels,
+            so they are not part of a snapshot.  Instead the robot model is reloaded, like in reset(), which
+            drops the velocities it had: the restored robot starts from rest with the snapshot's motor
+            velocities as commands and accelerates from there.
+
+            params: snapshot - from snapshot()
+                    mover - optional TargetMover to put back to the snapshot's place in the path
+
+            returns: the state after restoring
+        """
+        self._reload_robot()
+        vrep.simxPauseCommunication(self.client_id, True)
+        # the snapshot's robot handle is gone once the model was reloaded
+        for handle, reset in ((self.ref_frame, snapshot.robot), (self.target_handle, snapshot.target)):
+            vrep.simxSetObjectPosition(self.client_id, handle, -1, reset.pos, vrep.simx_opmode_oneshot)
+            vrep.simxSetObjectOrientation(self.client_id, handle, -1, reset.orient, vrep.simx_opmode_oneshot)
+        vrep.simxSetJointTargetVelocity(self.client_id, self.motor_left, snapshot.vleft, vrep.simx_opmode_oneshot)
+        vrep.simxSetJointTargetVelocity(self.client_id, self.motor_right, snapshot.vright, vrep.simx_opmode_oneshot)
+        vrep.simxPauseCommunication(self.client_id, False)
+        self.vleft = snapshot.vleft
+        self.vright = snapshot.vright
+        if mover is not None:
+            mover._index = snapshot.mover_index
+            mover._pos = None
+        state = self.get_state()
+        self._last_state = state
+        return state.to_array(self.include_sensors)
+
+    def fork(self, k, snapshot=None, mover=None, sensor_model=None):
+        """ k kinematic copies of the environment that step together, see ForkedEnv
+
+            params: k - number of copies
+                    snapshot - Snapshot to start from, the current state if None
+                    mover - TargetMover whose path the copies move the target along, taken when snapshotting
+                    sensor_model - sensor_model.SensorModel of the scene's obstacles, required with include_sensors
+
+            returns: ForkedEnv
+        """
+        if self.include_sensors and sensor_model is None:
+            raise ValueError('the copies cast their sensors against a sensor_model.SensorModel of the scene, '
+                             'pass one to fork an environment that includes sensors')
+        if snapshot is None:
+            snapshot = self.snapshot(mover)
+        return ForkedEnv(snapshot, k, self.rewarder, goal_distance=self.goal_distance, max_delta=self.max_delta,
+                         sleep_time=self.sleep_time, action_repeat=self.action_repeat,
+                         sensor_model=sensor_model if self.include_sensors else None)
+
     def stop(self):
         """ stop the vrep environment """
+        if self.recorder is not None:
+            self.recorder.close()
         # Now close the connection to V-REP:
         vrep.simxFinish(self.client_id)
 
@@ -252,6 +473,13 @@ class VREP_Env(object):
        
         return reward
 
+    def _reload_robot(self):
+        """ replace the robot with a freshly loaded model at its starting pose and at rest """
+        vrep.simxRemoveModel(self.client_id, self.ref_frame, vrep.simx_opmode_oneshot_wait)
+        vrep.simxLoadModel(self.client_id, "/home/user/V-REP/models/robots/mobile/pioneer_p3dx_script_disabled.ttm",
+                           1, vrep.simx_opmode_oneshot_wait)
+        self._load_robot_handles()
+
     def _load_robot_handles(self):
         """ loads/reloads the handles for the robot """
         _, self.ref_frame = get_handle(self.client_id, 'Pioneer_p3dx')
@@ -260,6 +488,290 @@ class VREP_Env(object):
         self.usensors = get_sensor_handles(self.client_id, "Pioneer_p3dx_ultrasonicSensor", 16)
 
 
+class ForkedEnv(object):
+    """ k copies of a snapshot advanced together with the kinematics model instead of the simulator
+
+        Every copy is stepped with its own action, the target moves along the snapshot's path the same in all
+        of them.  Meant for branched evaluation and action search from one situation, the copies follow the
+        simple differential drive model so they drift from the simulator over long horizons.  With a sensor
+        model the copies' ultrasonic readings are cast against its obstacles and lead every state, like
+        VREP_Env with include_sensors.
+    """
+
+    def __init__(self, snapshot, k, rewarder, goal_distance=1, max_delta=1, sleep_time=0.1, action_repeat=1,
+                 sensor_model=None):
+        self.snapshot = snapshot
+        self.k = k
+        self.rewarder = rewarder
+        self.goal_distance = goal_distance
+        self.max_delta = max_delta
+        self.sleep_time = sleep_time
+        self.action_repeat = action_repeat
+        self.action_bound = VREP_Env.action_bound
+        self._moves = self._path_moves(snapshot)
+        self.sensor_model = sensor_model
+        self.include_sensors = sensor_model is not None
+        self.state_dim = VREP_Env.sensor_state_dim if self.include_sensors else VREP_Env.state_dim
+        num_sensors = VREP_Env.sensor_state_dim - VREP_Env.state_dim if self.include_sensors else 0
+        # two batches the ticks alternate between, so the original and new states never need copying
+        self._states = [StateBatch.empty(k, num_sensors), StateBatch.empty(k, num_sensors)]
+        self._current = 0
+        self.reset()
+
+    @staticmethod
+    def _path_moves(snapshot):
+        """ target displacement for each path entry, None once the path is over """
+        if not snapshot.path:
+            return []
+        mover = TargetMover(None, None, snapshot.path, snapshot.increment)
+        moves = []
+        for index in range(len(snapshot.path)):
+            mover._index = index
+            move = mover._get_next_pos()
+            if move[0] == DONE:
+                break
+            moves.append(move)
+        return moves
+
+    def reset(self):
+        """ put every copy back to the snapshot
+
+            returns: (k, state_dim) array of states
+        """
+        snapshot = self.snapshot
+        self.x = np.full(self.k, float(snapshot.robot.pos[0]))
+        self.y = np.full(self.k, float(snapshot.robot.pos[1]))
+        self.yaw = np.full(self.k, float(snapshot.robot.orient[2]))
+        self.vleft = np.full(self.k, float(snapshot.vleft))
+        self.vright = np.full(self.k, float(snapshot.vright))
+        self.target = np.array(snapshot.target.pos[:2], dtype=float)
+        self.target_yaw = float(snapshot.target.orient[2])
+        self.index = snapshot.mover_index
+        self.dones = np.zeros(self.k, dtype=bool)
+        return self._read().to_array(self.include_sensors)
+
+    def _read(self):
+        """ fill the next state batch the way read_state sees the scene """
+        self._current = 1 - self._current
+        dx = self.target[0] - self.x
+        dy = self.target[1] - self.y
+        cos, sin = np.cos(self.yaw), np.sin(self.yaw)
+        readings = self.sensor_model.read(self.x, self.y, self.yaw) if self.include_sensors else None
+        return self._states[self._current].fill(cos * dx + sin * dy, -sin * dx + cos * dy,
+                                                kinematics.wrap(self.yaw - self.target_yaw),
+                                                self.vleft, self.vright, readings)
+
+    def _move_target(self):
+        """ TargetMover.step for all copies, returns if the path is over """
+        if self.index >= len(self._moves):
+            return bool(self.snapshot.path)
+        self.target += self._moves[self.index]
+        self.index += 1
+        return False
+
+    def step(self, actions):
+        """ move the target and step every copy that is not done yet
+
+            params: actions - (k, action_dim) array, or one action for all copies
+
+            returns: (states (k, state_dim), rewards (k,), dones (k,)), done copies stop moving
+        """
+        actions = np.broadcast_to(np.asarray(actions, dtype=float), (self.k, 2))
+        active = ~self.dones
+        self.vleft = np.where(active, actions[:, 0], self.vleft)
+        self.vright = np.where(active, actions[:, 1], self.vright)
+        orig_states = self._states[self._current]
+        rewards = np.zeros(self.k)
+        for tick in range(self.action_repeat):
+            if self._move_target():
+                self.dones[:] = True
+                break
+            x, y, yaw = kinematics.drive(self.x, self.y, self.yaw, self.vleft, self.vright, self.sleep_time)
+            self.x = np.where(active, x, self.x)
+            self.y = np.where(active, y, self.y)
+            self.yaw = np.where(active, yaw, self.yaw)
+            new_states = self._read()
+            rewards += np.where(active, self.rewarder.calculate_rewards(orig_states, new_states), 0.0)
+            self.dones |= active & (np.abs(new_states.dist() - self.goal_distance) > self.max_delta)
+            active = ~self.dones
+            orig_states = new_states
+        return self._states[self._current].to_array(self.include_sensors), rewards, self.dones.copy()
+
+
+def read_group_poses(client_id, object_type, handles):
+    """ absolute poses of many objects of one type with a single call
+
+        params: object_type - vrep object type of all the handles, e.g. vrep.sim_object_shape_type
+                handles - array of object handles
+
+        returns: (len(handles), 6) array of [ x, y, z, alpha, beta, gamma ]
+    """
+    _, found, _, floats, _ = vrep.simxGetObjectGroupData(client_id, object_type, 9, vrep.simx_opmode_oneshot_wait)
+    return np.reshape(floats, (-1, 6))[_positions(found, handles)]
+
+
+def read_group_sensors(client_id, handles):
+    """ distance readings of many proximity sensors with a single call, 0 where nothing is detected
+
+        params: handles - array of sensor handles, any shape
+
+        returns: array of readings with the shape of handles
+    """
+    _, found, _, floats, _ = vrep.simxGetObjectGroupData(client_id, vrep.sim_object_proximitysensor_type, 13,
+                                                         vrep.simx_opmode_oneshot_wait)
+    points = np.reshape(floats, (-1, 6))[:, :3]
+    return np.linalg.norm(points, axis=1)[_positions(found, np.ravel(handles))].reshape(np.shape(handles))
+
+
+def _positions(found, handles):
+    """ index of every handle in the list of handles vrep returned """
+    found = np.asarray(found)
+    order = np.argsort(found)
+    return order[np.searchsorted(found, handles, sorter=order)]
+
+
+class MultiVREP_Env(object):
+    """ n independent robot and target pairs in one scene, stepped together
+
+        Pair 0 is the usual Pioneer_p3dx and Sphere, pair i are copies of both named with pair_suffix(i).  All
+        pairs share one connection: their states are read with two group data calls, their actions (and target
+        moves) are sent as one message, so one simulator step yields n transitions.  Pairs are reset on their
+        own by placing the robot and target back, without reloading the model.
+    """
+    state_dim = VREP_Env.state_dim
+    sensor_state_dim = VREP_Env.sensor_state_dim
+    action_dim = VREP_Env.action_dim
+    action_bound = VREP_Env.action_bound
+
+    def __init__(self, rewarder, n, goal_distance=1, max_delta=1, sleep_time=0.1, action_repeat=1,
+                 include_sensors=False):
+        """ params: n - number of robot and target pairs in the scene
+                    see VREP_Env for the others
+        """
+        self.client_id = setup_vrep()
+        self.n = n
+        self.rewarder = rewarder
+        self.goal_distance = goal_distance
+        self.max_delta = max_delta
+        self.sleep_time = sleep_time
+        self.action_repeat = action_repeat
+        self.include_sensors = include_sensors
+        if include_sensors:
+            self.state_dim = self.sensor_state_dim
+        suffixes = [pair_suffix(i) for i in range(n)]
+        self.robots = np.array([get_handle(self.client_id, 'Pioneer_p3dx' + x)[1] for x in suffixes])
+        self.targets = np.array([get_handle(self.client_id, 'Sphere' + x)[1] for x in suffixes])
+        self.motors_left = [get_handle(self.client_id, 'Pioneer_p3dx_leftMotor' + x)[1] for x in suffixes]
+        self.motors_right = [get_handle(self.client_id, 'Pioneer_p3dx_rightMotor' + x)[1] for x in suffixes]
+        self.usensors = np.array([get_sensor_handles(self.client_id, "Pioneer_p3dx_ultrasonicSensor", 16, x)
+                                  for x in suffixes])
+        self.robot_resets = [get_reset(self.client_id, handle) for handle in self.robots]
+        self.target_resets = [get_reset(self.client_id, handle) for handle in self.targets]
+        self.vleft = np.zeros(n)
+        self.vright = np.zeros(n)
+        # a step reads action_repeat states while the caller holds the one it started from
+        self.state_ring_size = action_repeat + 2
+        self._states = [StateBatch.empty(n, self.usensors.shape[1]) for _ in range(self.state_ring_size)]
+        self._state_index = 0
+        self._last_state = None
+
+    def get_state(self):
+        """ states of all pairs, read into a ring of preallocated batches like VREP_Env.get_state
+
+            returns: StateBatch - one row per pair
+        """
+        self._state_index = (self._state_index + 1) % self.state_ring_size
+        poses = read_group_poses(self.client_id, vrep.sim_object_shape_type,
+                                 np.concatenate((self.robots, self.targets)))
+        robots, targets = poses[:self.n], poses[self.n:]
+        dx = targets[:, 0] - robots[:, 0]
+        dy = targets[:, 1] - robots[:, 1]
+        cos, sin = np.cos(robots[:, 5]), np.sin(robots[:, 5])
+        states = self._states[self._state_index]
+        states.fill(cos * dx + sin * dy, -sin * dx + cos * dy, kinematics.wrap(robots[:, 5] - targets[:, 5]),
+                    self.vleft, self.vright, read_group_sensors(self.client_id, self.usensors))
+        return states
+
+    def make_movers(self, path, increment=0.1):
+        """ one pipelined TargetMover per pair, all following path """
+        return [TargetMover(self.client_id, handle, path, increment, pipelined=True) for handle in self.targets]
+
+    def step(self, actions, movers=None):
+        """ send every pair's action (and target move) in one message and hold them for action_repeat ticks
+
+            params: actions - (n, action_dim) array
+                    movers - optional list of per pair TargetMover from make_movers
+
+            returns: (states (n, state_dim), rewards (n,), dones (n,)), a pair is done when it deviated too far
+                     or its mover ran out of path
+        """
+        orig_states = self._last_state if self._last_state is not None else self.get_state()
+        actions = np.asarray(actions, dtype=float)
+        self.vleft[:] = actions[:, 0]
+        self.vright[:] = actions[:, 1]
+        dones = np.zeros(self.n, dtype=bool)
+        vrep.simxPauseCommunication(self.client_id, True)
+        for i in range(self.n):
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motors_left[i], self.vleft[i], vrep.simx_opmode_oneshot)
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motors_right[i], self.vright[i],
+                                            vrep.simx_opmode_oneshot)
+        self._move_targets(movers, dones)
+        vrep.simxPauseCommunication(self.client_id, False)
+        sent_at = time.time()
+        rewards = np.zeros(self.n)
+        for tick in range(self.action_repeat):
+            if tick > 0 and movers is not None:
+                vrep.simxPauseCommunication(self.client_id, True)
+                self._move_targets(movers, dones)
+                vrep.simxPauseCommunication(self.client_id, False)
+            time.sleep(max(0.0, self.sleep_time - (time.time() - sent_at)))
+            new_states = self.get_state()
+            sent_at = time.time()
+            active = ~dones
+            rewards += np.where(active, self.rewarder.calculate_rewards(orig_states, new_states), 0.0)
+            dones |= np.abs(new_states.dist() - self.goal_distance) > self.max_delta
+            orig_states = new_states
+        self._last_state = new_states
+        return new_states.to_array(self.include_sensors), rewards, dones
+
+    def _move_targets(self, movers, dones):
+        if movers is None:
+            return
+        for i, mover in enumerate(movers):
+            if not dones[i] and mover.step():
+                dones[i] = True
+
+    def reset(self, pairs=None, movers=None):
+        """ put the given pairs back to their starting poses, in one message
+
+            params: pairs - indices of the pairs to reset, all if None
+                    movers - optional list of per pair TargetMover, the reset pairs' movers are reset too
+
+            returns: (n, state_dim) states of all pairs
+        """
+        pairs = range(self.n) if pairs is None else pairs
+        vrep.simxPauseCommunication(self.client_id, True)
+        for i in pairs:
+            for reset in (self.robot_resets[i], self.target_resets[i]):
+                vrep.simxSetObjectPosition(self.client_id, reset.handle, -1, reset.pos, vrep.simx_opmode_oneshot)
+                vrep.simxSetObjectOrientation(self.client_id, reset.handle, -1, reset.orient,
+                                              vrep.simx_opmode_oneshot)
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motors_left[i], 0, vrep.simx_opmode_oneshot)
+            vrep.simxSetJointTargetVelocity(self.client_id, self.motors_right[i], 0, vrep.simx_opmode_oneshot)
+            self.vleft[i] = 0
+            self.vright[i] = 0
+            if movers is not None:
+                movers[i].reset()
+                # the target was just placed, no need to read it back
+                movers[i]._pos = tuple(self.target_resets[i].pos)
+        vrep.simxPauseCommunication(self.client_id, False)
+        self._last_state = self.get_state()
+        return self._last_state.to_array(self.include_sensors)
+
+    def stop(self):
+        vrep.simxFinish(self.client_id)
+
+
 def make(goal_distance, rewarder=None):
     """ makes a new vrep environment 
         